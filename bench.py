@@ -0,0 +1,547 @@
+import argparse
+import asyncio
+import gc
+import importlib
+import logging
+import os
+import random
+import json
+import resource
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import types
+from urllib.parse import parse_qs, urlsplit
+
+import httpx
+
+from replay import FakeBot, FakeVybe, bot_environment, report_line, synthetic_transfers
+
+# Focused micro-benchmarks that complement replay.py: each subcommand measures one part of the bot
+# against local fakes, usually next to the naive implementation it replaced.
+
+# Runs a fake server (FakeVybe, FakeTelegram) on its own event loop, so a blocking client in the bot's loop
+# can't stall it
+class ServerThread:
+    def __init__(self, server):
+        self.server = server
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name=type(server).__name__, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        asyncio.run_coroutine_threadsafe(self.server.start(), self.loop).result()
+        return self.server
+
+    def __exit__(self, *exc) -> None:
+        asyncio.run_coroutine_threadsafe(self.server.stop(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+
+# Local stand-in for the Telegram Bot API: answers getMe/setWebhook/sendMessage and records when each chat got a reply
+class FakeTelegram:
+    def __init__(self):
+        self.replied_at = {}
+        self.methods = {}
+        self._server = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.sockets[0].getsockname()[:2]
+        return f"http://{host}:{port}"
+
+    async def start(self) -> None:
+        self._server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+
+    async def stop(self) -> None:
+        self._server.close()
+        await self._server.wait_closed()
+
+    def _route(self, method: str, params: dict):
+        self.methods[method] = self.methods.get(method, 0) + 1
+        if method == "getMe":
+            return {"id": 1, "is_bot": True, "first_name": "Bench", "username": "bench_bot"}
+        if method == "sendMessage":
+            chat_id = int(params["chat_id"])
+            self.replied_at.setdefault(chat_id, time.perf_counter())
+            return {"message_id": 1, "date": int(time.time()), "chat": {"id": chat_id, "type": "private"}}
+        return True
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                head = (await reader.readuntil(b"\r\n\r\n")).decode()
+                request_line, *headers = head.split("\r\n")
+                length = 0
+                for header in headers:
+                    name, _, value = header.partition(":")
+                    if name.lower() == "content-length":
+                        length = int(value)
+                body = (await reader.readexactly(length)).decode() if length else ""
+                method = urlsplit(request_line.split(" ")[1]).path.rsplit("/", 1)[-1]
+                params = {key: values[-1] for key, values in parse_qs(body).items()}
+                payload = json.dumps({"ok": True, "result": self._route(method, params)}).encode()
+                writer.write(
+                    b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                    + f"Content-Length: {len(payload)}\r\n\r\n".encode() + payload
+                )
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+def load_bot(base_url: str, verbose: bool = False, **overrides):
+    os.environ.update(bot_environment(base_url, tempfile.mkdtemp(prefix="vybe-bench-"), **overrides))
+    bot = importlib.import_module("bot")
+    if not verbose:
+        bot.logger.setLevel(logging.WARNING)
+    return bot
+
+def percentile(samples: list, fraction: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))] if ordered else 0.0
+
+def latency_line(samples: list) -> str:
+    return f"p50 {percentile(samples, 0.5) * 1000:.1f}ms, p99 {percentile(samples, 0.99) * 1000:.1f}ms"
+
+# Samples how late a 10ms sleep wakes up: anything blocking the event loop shows up as lag
+async def watch_loop_lag(lags: list, stop: asyncio.Event) -> None:
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(0.01)
+        lags.append(time.perf_counter() - started - 0.01)
+
+# Bursts of `concurrency` simultaneous lookups; latency runs from the burst start, so time spent queued behind a
+# blocked event loop counts too
+async def run_handler_load(bot, addresses: list, concurrency: int, requests: int) -> tuple:
+    context = types.SimpleNamespace(bot=FakeBot())
+    rng = random.Random(concurrency)
+    latencies = []
+    lags = []
+
+    async def lookup(burst_started: float) -> None:
+        await bot.process_wallet(0, rng.choice(addresses), context)
+        latencies.append(time.perf_counter() - burst_started)
+
+    stop = asyncio.Event()
+    lag_task = asyncio.create_task(watch_loop_lag(lags, stop))
+    started = time.perf_counter()
+    for _ in range(max(1, requests // concurrency)):
+        burst_started = time.perf_counter()
+        await asyncio.gather(*(lookup(burst_started) for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await lag_task
+    return latencies, max(lags, default=0.0), elapsed
+
+# /wallet lookups from many concurrent users against a slow API, with the shared async client and with the
+# blocking call every handler used to make (what requests.get did)
+async def bench_handlers(args) -> None:
+    transfers = synthetic_transfers(args.transfers, 10, args.wallets, args.seed)
+    with ServerThread(FakeVybe(transfers, latency=args.api_latency, seed=args.seed)) as vybe:
+        vybe.release(len(transfers))
+        bot = load_bot(vybe.base_url, args.verbose, VYBE_MAX_CONCURRENCY=max(args.concurrency))
+        addresses = list(vybe.by_address)
+        client_get = bot.vybe_client.get
+        # Build the pool before timing anything
+        await bot.vybe_client.warm(vybe.base_url, max(args.concurrency))
+
+        async def blocking_get(url, params=None, stale_ok=False):
+            return httpx.get(url, params=params, timeout=bot.VYBE_TIMEOUT)
+
+        print(f"/wallet lookups, {args.requests} per level, {args.api_latency * 1000:.0f}ms API latency")
+        for label, get in (("async client", client_get), ("blocking call", blocking_get)):
+            bot.vybe_client.get = get
+            for concurrency in args.concurrency:
+                latencies, lag, elapsed = await run_handler_load(bot, addresses, concurrency, args.requests)
+                print(report_line(
+                    f"{label} x{concurrency}",
+                    f"{latency_line(latencies)}, {len(latencies) / elapsed:.0f} lookups/s, loop lag max {lag * 1000:.0f}ms",
+                ))
+        bot.vybe_client.get = client_get
+        await bot.vybe_client.close()
+
+# Recipients of one tick's transfers: the old loop over every (subscriber, transfer) pair vs the sorted threshold index
+async def bench_matching(args) -> None:
+    bot = load_bot("http://127.0.0.1:9", args.verbose)
+    rng = random.Random(args.seed)
+    thresholds = {user_id: round(10 ** rng.uniform(3.7, 6.5)) for user_id in range(1, args.subscribers + 1)}
+    transfers = synthetic_transfers(args.transfers, 50, 5000, args.seed)
+
+    # Both sides build the recipient list of every transfer, which is what delivery consumes
+    started = time.perf_counter()
+    items = list(thresholds.items())
+    nested = [[user_id for user_id, threshold in items if tx["amount_usd"] >= threshold] for tx in transfers]
+    nested_seconds = time.perf_counter() - started
+    nested_matches = sum(len(users) for users in nested)
+    del nested
+
+    index = bot.ThresholdIndex()
+    started = time.perf_counter()
+    index.load(thresholds)
+    load_seconds = time.perf_counter() - started
+    started = time.perf_counter()
+    recipients = [index.users_for_amount(tx["amount_usd"]) for tx in transfers]
+    index_seconds = time.perf_counter() - started
+    matches = sum(len(users) for users in recipients)
+    assert matches == nested_matches, "index and nested loop disagree"
+
+    print(f"{args.subscribers} subscribers x {args.transfers} transfers, {matches} matches")
+    print(report_line("nested loop", f"{nested_seconds * 1000:.0f}ms"))
+    print(report_line("threshold index", f"{index_seconds * 1000:.0f}ms (+{load_seconds * 1000:.0f}ms one-off load)"))
+    print(report_line("speedup", f"{nested_seconds / index_seconds:.0f}x"))
+
+# Custom rules over one tick's transfers: the compiled RuleEngine buckets vs checking every rule against every transfer
+async def bench_rules(args) -> None:
+    bot = load_bot("http://127.0.0.1:9", args.verbose)
+    rng = random.Random(args.seed)
+    transfers = synthetic_transfers(args.transfers, 50, 5000, args.seed)
+    addresses = sorted({address for tx in transfers for address in bot.tx_addresses(tx)})
+    mints = sorted({bot.tx_mint(tx) for tx in transfers})
+    rules = []
+    for i in range(args.rules):
+        kind = rng.random()
+        sender = rng.choice(addresses) if kind < 0.45 else None
+        receiver = rng.choice(addresses) if 0.3 <= kind < 0.75 else None
+        min_usd = round(10 ** rng.uniform(3.7, 6))
+        rules.append(bot.AlertRule(
+            f"r{i}",
+            rng.randint(1, args.rules // 5),
+            # A rule with no address filter still names a token, as one matching every whale is just /threshold
+            rng.choice(mints) if kind >= 0.95 or rng.random() < 0.5 else None,
+            sender,
+            receiver,
+            rng.choice(addresses) if 0.75 <= kind < 0.95 else None,
+            min_usd,
+            rng.choice((None, None, min_usd * 10)),
+        ))
+
+    def brute_force(tx: dict) -> set:
+        amount = bot.tx_amount(tx)
+        mint = bot.tx_mint(tx)
+        sender, receiver = bot.tx_addresses(tx)
+        return {
+            rule.user_id for rule in rules
+            if (rule.mint is None or rule.mint == mint)
+            and (rule.sender is None or rule.sender == sender)
+            and (rule.receiver is None or rule.receiver == receiver)
+            and (rule.wallet is None or rule.wallet in (sender, receiver))
+            and rule.min_usd <= amount and (rule.max_usd is None or amount <= rule.max_usd)
+        }
+
+    # Both sides run with the cyclic GC paused, and the engine reports its best of --repeat runs, so the numbers do
+    # not depend on when a collection lands
+    engine = bot.RuleEngine()
+    engine.load(rules)
+    compile_seconds = match_seconds = float("inf")
+    gc.collect()
+    gc.disable()
+    for _ in range(args.repeat):
+        started = time.perf_counter()
+        engine._buckets = engine._compile()
+        compile_seconds = min(compile_seconds, time.perf_counter() - started)
+        started = time.perf_counter()
+        pairs = bot.match_transfers(transfers, bot.ThresholdIndex(), engine)
+        match_seconds = min(match_seconds, time.perf_counter() - started)
+
+    # The brute-force loop only checks the first --check transfers; its time is scaled up to the whole tick
+    checked = transfers[:args.check]
+    started = time.perf_counter()
+    expected = {(user_id, tx["signature"]) for tx in checked for user_id in brute_force(tx)}
+    brute_seconds = (time.perf_counter() - started) * len(transfers) / len(checked)
+    gc.enable()
+    signatures = {tx["signature"] for tx in checked}
+    matched = {(user_id, tx["signature"]) for user_id, tx in pairs if tx["signature"] in signatures}
+    assert matched == expected, "rule engine and brute force disagree"
+
+    engine_seconds = compile_seconds + match_seconds
+    print(f"{args.rules} rules x {args.transfers} transfers, {len(pairs)} matches "
+          f"({len(expected)} checked against brute force on {len(checked)} transfers)")
+    print(report_line("brute force", f"{brute_seconds * 1000:.0f}ms (extrapolated)"))
+    print(report_line("rule engine", f"{engine_seconds * 1000:.0f}ms "
+                                     f"({compile_seconds * 1000:.0f}ms compile + {match_seconds * 1000:.0f}ms match)"))
+    print(report_line("speedup", f"{brute_seconds / engine_seconds:.0f}x"))
+
+# Startup with a large user store: open + load every row, then build the in-memory threshold index
+async def bench_startup(args) -> None:
+    bot = load_bot("http://127.0.0.1:9", args.verbose)
+    store = bot.UserStore(bot.USER_DB_FILE)
+    await store.open()
+    await store.close()
+    rng = random.Random(args.seed)
+    started = time.perf_counter()
+    with sqlite3.connect(store.path) as conn:
+        conn.executemany(
+            "INSERT INTO thresholds (user_id, threshold) VALUES (?, ?)",
+            ((user_id, rng.choice((5000, 10000, 50000, 100000, 1000000))) for user_id in range(1, args.users + 1)),
+        )
+        conn.executemany(
+            "INSERT INTO states (user_id, state) VALUES (?, ?)",
+            ((user_id, "awaiting_threshold") for user_id in range(1, args.users + 1, 20)),
+        )
+    fill_seconds = time.perf_counter() - started
+    size_mb = os.path.getsize(store.path) / 1e6
+
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    started = time.perf_counter()
+    stored = await store.open()
+    open_seconds = time.perf_counter() - started
+    started = time.perf_counter()
+    bot.threshold_index.load(stored["thresholds"])
+    index_seconds = time.perf_counter() - started
+    await store.close()
+    rss_mb = (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss_before) / 1024
+
+    print(f"{len(stored['thresholds'])} stored users, {len(stored['states'])} pending states ({size_mb:.0f} MB database)")
+    print(report_line("fill (not part of startup)", f"{fill_seconds * 1000:.0f}ms"))
+    print(report_line("open + load", f"{open_seconds * 1000:.0f}ms"))
+    print(report_line("threshold index", f"{index_seconds * 1000:.0f}ms"))
+    print(report_line("startup total", f"{(open_seconds + index_seconds) * 1000:.0f}ms, +{rss_mb:.0f} MB max RSS"))
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def message_update(update_id: int, chat_id: int, text: str) -> dict:
+    message = {
+        "message_id": update_id,
+        "date": int(time.time()),
+        "chat": {"id": chat_id, "type": "private"},
+        "from": {"id": chat_id, "is_bot": False, "first_name": "Bench"},
+        "text": text,
+    }
+    if text.startswith("/"):
+        message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split(" ")[0])}]
+    return {"update_id": update_id, "message": message}
+
+# Bursts of `concurrency` updates POSTed to the webhook the way Telegram delivers them. Half are /start, half a
+# wallet address from a user the bot is waiting on, which costs a Vybe lookup. Each burst waits for its replies.
+async def run_webhook_load(bot, client, url: str, secret: str, telegram_api, addresses: list, concurrency: int,
+                           requests: int, first_id: int) -> tuple:
+    rng = random.Random(concurrency)
+    posts = []
+    replies = []
+    missing = 0
+    started = time.perf_counter()
+    for burst in range(max(1, requests // concurrency)):
+        sent_at = {}
+        chat_ids = range(first_id + burst * concurrency, first_id + (burst + 1) * concurrency)
+        for chat_id in chat_ids:
+            if chat_id % 2:
+                bot.set_user_state(chat_id, "awaiting_wallet")
+
+        async def post(chat_id: int, text: str) -> None:
+            sent_at[chat_id] = time.perf_counter()
+            response = await client.post(
+                url, json=message_update(chat_id, chat_id, text), headers={"X-Telegram-Bot-Api-Secret-Token": secret}
+            )
+            response.raise_for_status()
+            posts.append(time.perf_counter() - sent_at[chat_id])
+
+        await asyncio.gather(*(post(chat_id, rng.choice(addresses) if chat_id % 2 else "/start") for chat_id in chat_ids))
+        deadline = time.perf_counter() + 10
+        while any(chat_id not in telegram_api.replied_at for chat_id in sent_at) and time.perf_counter() < deadline:
+            await asyncio.sleep(0.001)
+        for chat_id, sent in sent_at.items():
+            if chat_id in telegram_api.replied_at:
+                replies.append(telegram_api.replied_at[chat_id] - sent)
+            else:
+                missing += 1
+    return posts, replies, missing, time.perf_counter() - started
+
+# The webhook path end to end: PTB's webhook server with the bot's handlers, fed synthetic updates that carry the
+# secret token, replying through a fake Bot API. Reports how long each POST waits and how long until the reply is sent.
+async def bench_webhook(args) -> None:
+    from telegram.ext import Application
+
+    transfers = synthetic_transfers(args.transfers, 10, args.wallets, args.seed)
+    with ServerThread(FakeVybe(transfers, latency=args.api_latency, seed=args.seed)) as vybe, \
+            ServerThread(FakeTelegram()) as telegram_api:
+        vybe.release(len(transfers))
+        bot = load_bot(vybe.base_url, args.verbose)
+        if not args.verbose:
+            for name in ("telegram", "apscheduler", "httpx"):
+                logging.getLogger(name).setLevel(logging.WARNING)
+        application = (
+            Application.builder()
+            .token("123456:bench")
+            .base_url(f"{telegram_api.base_url}/bot")
+            .concurrent_updates(bot.CONCURRENT_UPDATES)
+            .build()
+        )
+        bot.add_handlers(application)
+        secret = "bench-secret"
+        port = free_port()
+        # What run_webhook does, minus the blocking loop and signal handlers
+        await application.initialize()
+        await bot.post_init(application)
+        await application.updater.start_webhook(
+            listen="127.0.0.1",
+            port=port,
+            url_path=bot.WEBHOOK_PATH,
+            webhook_url=f"http://127.0.0.1:{port}/{bot.WEBHOOK_PATH}",
+            secret_token=secret,
+            allowed_updates=bot.ALLOWED_UPDATES,
+        )
+        await application.start()
+
+        url = f"http://127.0.0.1:{port}/{bot.WEBHOOK_PATH}"
+        addresses = list(vybe.by_address)
+        async with httpx.AsyncClient(limits=httpx.Limits(max_connections=max(args.concurrency))) as client:
+            rejected = await client.post(url, json=message_update(0, 1, "/start"))
+            print(
+                f"Webhook updates, {args.requests} per level, {bot.CONCURRENT_UPDATES} concurrent updates, "
+                f"{args.api_latency * 1000:.0f}ms API latency (no secret header: HTTP {rejected.status_code})"
+            )
+            first_id = 1000
+            for concurrency in args.concurrency:
+                posts, replies, missing, elapsed = await run_webhook_load(
+                    bot, client, url, secret, telegram_api, addresses, concurrency, args.requests, first_id
+                )
+                first_id += args.requests + concurrency
+                print(report_line(f"POST x{concurrency}", f"{latency_line(posts)}, {len(posts) / elapsed:.0f} updates/s"))
+                print(report_line(
+                    f"reply x{concurrency}", latency_line(replies) + (f", {missing} never answered" if missing else "")
+                ))
+
+        await application.updater.stop()
+        await application.stop()
+        await bot.post_shutdown(application)
+        await application.shutdown()
+
+# Telegram sends per whale check with one message per matching transfer vs one digest per user per tick
+async def bench_digest(args) -> None:
+    transfers = synthetic_transfers(args.ticks * args.tick_size, 20, 2000, args.seed)
+    with ServerThread(FakeVybe(transfers, seed=args.seed)) as vybe:
+        # Rate limits off: this counts messages, the rate limiter would only stretch the run
+        bot = load_bot(vybe.base_url, args.verbose, TELEGRAM_GLOBAL_RATE=1e6, TELEGRAM_CHAT_RATE=1e6,
+                       ALERT_QUEUE_SIZE=args.subscribers * args.tick_size)
+        rng = random.Random(args.seed)
+        thresholds = {user_id: rng.choice((5000, 10000, 25000, 50000, 100000)) for user_id in range(1, args.subscribers + 1)}
+        bot.user_thresholds.update(thresholds)
+        bot.threshold_index.load(thresholds)
+        context = types.SimpleNamespace()
+
+        print(f"{args.subscribers} subscribers, {args.ticks} ticks of {args.tick_size} transfers")
+        results = {}
+        for label, window in (("one message per alert", None), ("digest per tick", 0)):
+            for user_id in thresholds:
+                bot.digest_buffer.set_window(user_id, window)
+            bot.seen_transfers = bot.SeenTransfers()
+            bot.watermark.block_time = vybe.block_times[0] - 1
+            bot.watermark.keys = []
+            vybe.released = 0
+            fake_bot = FakeBot()
+            bot.alert_delivery.start(fake_bot)
+            sends = []
+            started = time.perf_counter()
+            for _ in range(args.ticks):
+                vybe.release(args.tick_size)
+                before = len(fake_bot.sent)
+                await bot.broadcast_whales(context)
+                await bot.alert_delivery.drain()
+                sends.append(len(fake_bot.sent) - before)
+            elapsed = time.perf_counter() - started
+            await bot.alert_delivery.stop()
+            results[label] = sum(sends)
+            print(report_line(
+                label,
+                f"{sum(sends) / len(sends):.0f} sends/tick (max {max(sends)}), {elapsed / args.ticks * 1000:.0f}ms/tick",
+            ))
+        before, after = results.values()
+        print(report_line("reduction", f"{before / max(1, after):.1f}x fewer sends"))
+        await bot.vybe_client.close()
+
+# Whole-pipeline throughput as ALERT_SHARDS grows: one replay.py run per shard count, each in a fresh interpreter
+# since the bot reads its settings at import time
+async def bench_shards(args) -> None:
+    replay_args = [
+        sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "replay.py"), "--json",
+        "--import-runs", "0", "--lookups", "0", "--watches", "0", "--seed", str(args.seed),
+        "--synthetic", str(args.transfers), "--users", str(args.users), "--rules", str(args.rules),
+    ]
+    runs = [("in-process (no broker)", [])]
+    runs += [(f"in-process broker x{max(args.workers)}", ["--shards", str(max(args.workers)), "--in-process-shards"])]
+    runs += [(f"shard processes x{shards}", ["--shards", str(shards)]) for shards in args.workers]
+
+    print(f"{args.transfers} transfers, {args.users} subscribers, {args.rules} rules, {os.cpu_count()} CPUs")
+    for label, extra in runs:
+        completed = await asyncio.to_thread(
+            subprocess.run, replay_args + extra, capture_output=True, text=True, check=True
+        )
+        result = json.loads(completed.stdout)
+        print(report_line(
+            label,
+            f"{result['transfers_per_sec']:.0f} transfers/s, {result['alerts_per_sec']:.0f} alerts/s "
+            f"({result['alerts']} alerts in {result['elapsed']:.1f}s)",
+        ))
+
+def int_list(value: str) -> list:
+    return [int(item) for item in value.split(",") if item]
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Micro-benchmarks for the whale alert bot, run against local fakes.")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--verbose", action="store_true", help="keep the bot's INFO logs")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    handlers = commands.add_parser("handlers", help="handler latency under concurrent load, async client vs blocking calls")
+    handlers.add_argument("--concurrency", type=int_list, default=[1, 10, 50], help="comma-separated concurrent users")
+    handlers.add_argument("--requests", type=int, default=100, help="lookups per concurrency level")
+    handlers.add_argument("--api-latency", type=float, default=0.05, help="seconds added to every fake Vybe response")
+    handlers.add_argument("--transfers", type=int, default=2000, help="synthetic transfers served by the fake API")
+    handlers.add_argument("--wallets", type=int, default=500, help="distinct wallets in the synthetic data")
+    handlers.set_defaults(run=bench_handlers)
+
+    matching = commands.add_parser("matching", help="broadcast fan-out: nested loop vs sorted threshold index")
+    matching.add_argument("--subscribers", type=int, default=100000)
+    matching.add_argument("--transfers", type=int, default=1000, help="transfers per tick")
+    matching.set_defaults(run=bench_matching)
+
+    rules = commands.add_parser("rules", help="custom rule matching: compiled rule buckets vs brute force")
+    rules.add_argument("--rules", type=int, default=50000)
+    rules.add_argument("--transfers", type=int, default=5000, help="transfers per tick")
+    rules.add_argument("--check", type=int, default=500, help="transfers also run through the brute-force loop")
+    rules.add_argument("--repeat", type=int, default=5, help="rule engine runs, best one reported")
+    rules.set_defaults(run=bench_rules)
+
+    startup = commands.add_parser("startup", help="startup time with a large user store")
+    startup.add_argument("--users", type=int, default=1000000, help="stored subscribers")
+    startup.set_defaults(run=bench_startup)
+
+    digest = commands.add_parser("digest", help="Telegram sends per tick with and without digest mode")
+    digest.add_argument("--subscribers", type=int, default=1000)
+    digest.add_argument("--ticks", type=int, default=10)
+    digest.add_argument("--tick-size", type=int, default=20, help="transfers per whale check")
+    digest.set_defaults(run=bench_digest)
+
+    webhook = commands.add_parser("webhook", help="webhook POST and reply latency under concurrent updates")
+    webhook.add_argument("--concurrency", type=int_list, default=[1, 10, 50], help="comma-separated concurrent updates")
+    webhook.add_argument("--requests", type=int, default=200, help="updates per concurrency level")
+    webhook.add_argument("--api-latency", type=float, default=0.05, help="seconds added to every fake Vybe response")
+    webhook.add_argument("--transfers", type=int, default=2000, help="synthetic transfers served by the fake API")
+    webhook.add_argument("--wallets", type=int, default=500, help="distinct wallets in the synthetic data")
+    webhook.set_defaults(run=bench_webhook)
+
+    shards = commands.add_parser("shards", help="replay throughput with 1, 2, 4 and 8 alert shard processes")
+    shards.add_argument("--workers", type=int_list, default=[1, 2, 4, 8], help="comma-separated shard counts")
+    shards.add_argument("--transfers", type=int, default=2000)
+    shards.add_argument("--users", type=int, default=500, help="subscribers with a random threshold")
+    shards.add_argument("--rules", type=int, default=500, help="random custom alert rules")
+    shards.set_defaults(run=bench_shards)
+    return parser.parse_args(argv)
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    asyncio.run(args.run(args))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
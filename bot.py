@@ -1,14 +1,29 @@
+import asyncio
+import bisect
+import collections
+import contextlib
+import datetime
+import functools
+import heapq
+import itertools
+import json
 import logging
 import os
+import pickle
+import random
+import sqlite3
+import ssl
+import time
+import uuid
+import weakref
 
+import certifi
+import httpx
 import telegram
 from dotenv import load_dotenv
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
-from telegram.ext import Application, CommandHandler, MessageHandler, filters, CallbackQueryHandler
 from telegram.request import HTTPXRequest
-import requests
 import re
-import pytz
 
 # Load environment variables from .env file
 load_dotenv()
@@ -18,16 +33,147 @@ VYBE_API_KEY = os.getenv("VYBE_API_KEY")
 # Set up logging
 logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
 logger = logging.getLogger(__name__)
+# httpx logs every request URL at INFO (including Telegram's getUpdates polls)
+logging.getLogger("httpx").setLevel(logging.WARNING)
 
-# Vybe API endpoints
-VYBE_TRANSACTIONS_URL = "https://api.vybenetwork.xyz/token/transfers?min_amount_usd=5000&limit=10"
-VYBE_TOKEN_URL = "https://api.vybenetwork.xyz/token"  
-VYBE_WALLET_URL = "https://api.vybenetwork.xyz/token/transfers" 
+# Vybe API endpoints (VYBE_API_BASE can point at a staging or local replay server)
+VYBE_API_BASE = os.getenv("VYBE_API_BASE", "https://api.vybenetwork.xyz").rstrip("/")
+VYBE_TRANSACTIONS_URL = f"{VYBE_API_BASE}/token/transfers"
+VYBE_TRANSACTIONS_PARAMS = {"min_amount_usd": 5000, "limit": 10}
+WHALE_MIN_AMOUNT_USD = 5000
 
-# Store user thresholds and states in memory
+# Scheduled ingestion pages through transfers newer than the watermark
+VYBE_PAGE_LIMIT = int(os.getenv("VYBE_PAGE_LIMIT", "100"))
+VYBE_MAX_PAGES = int(os.getenv("VYBE_MAX_PAGES", "20"))
+VYBE_TOKEN_URL = f"{VYBE_API_BASE}/token"
+VYBE_WALLET_URL = f"{VYBE_API_BASE}/token/transfers"
+VYBE_TOKENS_URL = f"{VYBE_API_BASE}/tokens"
+
+# Input validation for token symbols and base58 Solana addresses, compiled once at import
+TOKEN_SYMBOL_RE = re.compile(r"^[A-Za-z0-9]{1,15}$")
+SOLANA_ADDRESS_RE = re.compile(r"^[1-9A-HJ-NP-Za-km-z]{32,44}$")
+
+# Reply markups attached to every alert, built once and shared (they are immutable)
+WHALE_ALERT_MARKUP = InlineKeyboardMarkup([
+    [
+        InlineKeyboardButton("Check Again 🔄", callback_data="check_whales"),
+        InlineKeyboardButton("Set New Threshold 🐋", callback_data="set_threshold"),
+    ]
+])
+WALLET_ALERT_MARKUP = InlineKeyboardMarkup([[InlineKeyboardButton("Wallet Tracker 🔍", callback_data="wallet_tracker")]])
+
+# Digest mode: at most DIGEST_MAX_ITEMS transfers listed per digest message
+DIGEST_MAX_ITEMS = int(os.getenv("DIGEST_MAX_ITEMS", "10"))
+DIGEST_MAX_WINDOW_MINUTES = int(os.getenv("DIGEST_MAX_WINDOW_MINUTES", "240"))
+
+# Vybe HTTP client settings (shared pool for all handlers and the scheduled job)
+VYBE_MAX_CONNECTIONS = int(os.getenv("VYBE_MAX_CONNECTIONS", "20"))
+VYBE_MAX_CONCURRENCY = int(os.getenv("VYBE_MAX_CONCURRENCY", "10"))
+VYBE_TIMEOUT = float(os.getenv("VYBE_TIMEOUT", "10"))
+# Connections opened at startup so the first tick and lookups skip the TLS handshake
+VYBE_WARM_CONNECTIONS = int(os.getenv("VYBE_WARM_CONNECTIONS", "4"))
+
+# Per-endpoint circuit breaker: opens when at least VYBE_CIRCUIT_FAILURE_RATIO of the last
+# VYBE_CIRCUIT_WINDOW seconds' requests failed, then lets one probe through after VYBE_CIRCUIT_OPEN_SECONDS
+VYBE_CIRCUIT_WINDOW = float(os.getenv("VYBE_CIRCUIT_WINDOW", "60"))
+VYBE_CIRCUIT_MIN_REQUESTS = int(os.getenv("VYBE_CIRCUIT_MIN_REQUESTS", "5"))
+VYBE_CIRCUIT_FAILURE_RATIO = float(os.getenv("VYBE_CIRCUIT_FAILURE_RATIO", "0.5"))
+VYBE_CIRCUIT_OPEN_SECONDS = float(os.getenv("VYBE_CIRCUIT_OPEN_SECONDS", "30"))
+# Last good responses kept for handlers to fall back on while Vybe is failing
+VYBE_STALE_CACHE_SIZE = int(os.getenv("VYBE_STALE_CACHE_SIZE", "1000"))
+
+# Outbound alert delivery settings (Telegram allows ~30 msg/s overall and ~1 msg/s per chat)
+TELEGRAM_GLOBAL_RATE = float(os.getenv("TELEGRAM_GLOBAL_RATE", "25"))
+TELEGRAM_CHAT_RATE = float(os.getenv("TELEGRAM_CHAT_RATE", "1"))
+ALERT_WORKERS = int(os.getenv("ALERT_WORKERS", "16"))
+ALERT_QUEUE_SIZE = int(os.getenv("ALERT_QUEUE_SIZE", "50000"))
+ALERT_MAX_ATTEMPTS = int(os.getenv("ALERT_MAX_ATTEMPTS", "3"))
+
+# Observability: Prometheus-style /metrics endpoint (0 disables), periodic snapshot logs, sampled payload logs
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+METRICS_SNAPSHOT_INTERVAL = float(os.getenv("METRICS_SNAPSHOT_INTERVAL", "300"))
+PAYLOAD_LOG_SAMPLE_RATE = float(os.getenv("PAYLOAD_LOG_SAMPLE_RATE", "0.05"))
+PAYLOAD_LOG_MAX_CHARS = int(os.getenv("PAYLOAD_LOG_MAX_CHARS", "500"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+PROFILE_TICKS = int(os.getenv("PROFILE_TICKS", "0"))
+ADMIN_USER_IDS = {int(user_id) for user_id in os.getenv("ADMIN_USER_IDS", "").split(",") if user_id.strip()}
+
+# Whale check scheduling: the interval adapts between the bounds to the transfer rate and API limits
+WHALE_CHECK_INTERVAL = float(os.getenv("WHALE_CHECK_INTERVAL", "120"))
+WHALE_MIN_INTERVAL = float(os.getenv("WHALE_MIN_INTERVAL", "30"))
+WHALE_MAX_INTERVAL = float(os.getenv("WHALE_MAX_INTERVAL", "600"))
+WHALE_TARGET_TRANSFERS = int(os.getenv("WHALE_TARGET_TRANSFERS", "25"))
+VYBE_RATE_LIMIT_LOW_WATER = int(os.getenv("VYBE_RATE_LIMIT_LOW_WATER", "5"))
+
+# Update delivery: long polling by default, webhook when WEBHOOK_URL is set
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+WEBHOOK_LISTEN = os.getenv("WEBHOOK_LISTEN", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("PORT", os.getenv("WEBHOOK_PORT", "8443")))
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "telegram")
+CONCURRENT_UPDATES = int(os.getenv("CONCURRENT_UPDATES", "64"))
+
+# We only handle messages and button presses, so don't ask Telegram for anything else
+ALLOWED_UPDATES = [Update.MESSAGE, Update.CALLBACK_QUERY]
+
+# Sharded mode: ALERT_SHARDS worker processes each own a slice of subscribers (0 = match and send in-process)
+ALERT_SHARDS = int(os.getenv("ALERT_SHARDS", "0"))
+# Transfers are matched (and published to shards) in batches of this size
+SHARD_BATCH_SIZE = int(os.getenv("SHARD_BATCH_SIZE", "100"))
+
+# Token stats cache: fresh for TOKEN_CACHE_TTL, then served stale while refreshing for TOKEN_CACHE_STALE_TTL
+TOKEN_CACHE_TTL = float(os.getenv("TOKEN_CACHE_TTL", "30"))
+TOKEN_CACHE_STALE_TTL = float(os.getenv("TOKEN_CACHE_STALE_TTL", "300"))
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "5000"))
+
+# Token registry: compact binary snapshot loaded at startup, refreshed from Vybe in the background
+TOKEN_REGISTRY_FILE = os.getenv("TOKEN_REGISTRY_FILE", "tokens.snapshot")
+TOKEN_REGISTRY_REFRESH = float(os.getenv("TOKEN_REGISTRY_REFRESH", "3600"))
+TOKEN_REGISTRY_PAGE_LIMIT = int(os.getenv("TOKEN_REGISTRY_PAGE_LIMIT", "1000"))
+TOKEN_REGISTRY_MAX_PAGES = int(os.getenv("TOKEN_REGISTRY_MAX_PAGES", "200"))
+
+# Custom alert rules per user (token, sender/receiver wallet, USD range)
+RULES_PER_USER = int(os.getenv("RULES_PER_USER", "10"))
+
+# Wallet watchlists: transfers of WATCH_MIN_AMOUNT_USD or more reach watchers through the whale stream, one fetch per
+# tick for every watched wallet at once. Smaller ones come from a round-robin sweep of WATCH_BATCH_SIZE wallets per
+# tick, so API calls per tick stay flat however many wallets are watched
+WATCH_MIN_AMOUNT_USD = float(os.getenv("WATCH_MIN_AMOUNT_USD", str(WHALE_MIN_AMOUNT_USD)))
+WATCH_POLL_INTERVAL = float(os.getenv("WATCH_POLL_INTERVAL", "60"))
+WATCH_BATCH_SIZE = int(os.getenv("WATCH_BATCH_SIZE", "50"))
+WATCH_FETCH_LIMIT = int(os.getenv("WATCH_FETCH_LIMIT", "25"))
+WATCH_LIMIT_PER_USER = int(os.getenv("WATCH_LIMIT_PER_USER", "25"))
+
+# Already-alerted transfer tracking across polling ticks
+SEEN_CACHE_SIZE = int(os.getenv("SEEN_CACHE_SIZE", "20000"))
+SEEN_TTL = float(os.getenv("SEEN_TTL", "86400"))
+WATERMARK_FILE = os.getenv("WATERMARK_FILE", "watermark.json")
+# After a long outage, resume at most this many seconds back instead of alerting the whole backlog
+WHALE_MAX_CATCHUP = float(os.getenv("WHALE_MAX_CATCHUP", "900"))
+
+# Store user thresholds and states in memory (write-through cache of the SQLite user store)
 user_thresholds = {}
 user_states = {}
 
+# SQLite user store (WAL mode); writes are group-committed in batches
+USER_DB_FILE = os.getenv("USER_DB_FILE", "users.db")
+STORE_BATCH_SIZE = int(os.getenv("STORE_BATCH_SIZE", "500"))
+
+# Transfer history: ingested transfers kept locally for /history, older rows compacted away
+TRANSFER_DB_FILE = os.getenv("TRANSFER_DB_FILE", "transfers.db")
+HISTORY_RETENTION_DAYS = int(os.getenv("HISTORY_RETENTION_DAYS", "30"))
+HISTORY_DEFAULT_DAYS = int(os.getenv("HISTORY_DEFAULT_DAYS", "7"))
+HISTORY_COMPACT_INTERVAL = float(os.getenv("HISTORY_COMPACT_INTERVAL", "3600"))
+HISTORY_FETCH_LIMIT = int(os.getenv("HISTORY_FETCH_LIMIT", "100"))
+HISTORY_MAX_PAGES = int(os.getenv("HISTORY_MAX_PAGES", "5"))
+HISTORY_MAX_ROWS = int(os.getenv("HISTORY_MAX_ROWS", "5000"))
+HISTORY_LINES = int(os.getenv("HISTORY_LINES", "5"))
+
+# Rolling whale analytics for /top and /flows: per-minute buckets over 1h and 24h windows
+ANALYTICS_BUCKET_SECONDS = int(os.getenv("ANALYTICS_BUCKET_SECONDS", "60"))
+ANALYTICS_TOP_N = int(os.getenv("ANALYTICS_TOP_N", "5"))
+ANALYTICS_WINDOWS = {"1h": 3600, "24h": 86400}
+
 # Token symbol to Solana token address mapping
 TOKEN_ADDRESS_MAP = {
     "SOL": "So11111111111111111111111111111111111111112",  # SOL's wrapped address
@@ -35,7 +181,1506 @@ TOKEN_ADDRESS_MAP = {
     "USDT": "Es9vMFrzaCERmJfrF4H2FYD4KCoNkY11McCe8BenwNYB",
 }
 
+# Cumulative latency histogram with fixed Prometheus-style buckets
+class Histogram:
+    BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+    def __init__(self):
+        self.counts = [0] * (len(self.BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.BUCKETS, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        # Upper bound of the bucket holding the q-th observation
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, bucket_count in zip(self.BUCKETS, self.counts):
+            seen += bucket_count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+# Counters, histograms and callback gauges, rendered as Prometheus text or a log-friendly snapshot
+class Metrics:
+    def __init__(self):
+        self._counters = collections.defaultdict(float)
+        self._histograms = collections.defaultdict(Histogram)
+        self._gauges = {}
+
+    @staticmethod
+    def _key(name: str, labels: dict) -> tuple:
+        return name, tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+    def inc(self, name: str, amount: float = 1, **labels) -> None:
+        self._counters[self._key(name, labels)] += amount
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        self._histograms[self._key(name, labels)].observe(value)
+
+    def gauge(self, name: str, read) -> None:
+        self._gauges[name] = read
+
+    @contextlib.contextmanager
+    def timer(self, name: str, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    @staticmethod
+    def _format_labels(labels: tuple, extra: str = "") -> str:
+        parts = [f'{key}="{value}"' for key, value in labels]
+        if extra:
+            parts.append(extra)
+        return "{" + ",".join(parts) + "}" if parts else ""
+
+    def render(self) -> str:
+        lines = []
+        for (name, labels), value in sorted(self._counters.items()):
+            lines.append(f"{name}{self._format_labels(labels)} {value:g}")
+        for name, read in sorted(self._gauges.items()):
+            lines.append(f"{name} {read():g}")
+        for (name, labels), histogram in sorted(self._histograms.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(Histogram.BUCKETS, histogram.counts):
+                cumulative += bucket_count
+                bucket_labels = self._format_labels(labels, 'le="%g"' % bound)
+                lines.append(f"{name}_bucket{bucket_labels} {cumulative}")
+            inf_labels = self._format_labels(labels, 'le="+Inf"')
+            lines.append(f"{name}_bucket{inf_labels} {histogram.count}")
+            lines.append(f"{name}_sum{self._format_labels(labels)} {histogram.sum:g}")
+            lines.append(f"{name}_count{self._format_labels(labels)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self) -> dict:
+        snapshot = {}
+        for (name, labels), value in self._counters.items():
+            snapshot[name + self._format_labels(labels)] = value
+        for name, read in self._gauges.items():
+            snapshot[name] = read()
+        for (name, labels), histogram in self._histograms.items():
+            snapshot[name + self._format_labels(labels)] = {
+                "count": histogram.count,
+                "mean": histogram.sum / histogram.count if histogram.count else 0.0,
+                "p50": histogram.quantile(0.5),
+                "p99": histogram.quantile(0.99),
+            }
+        return snapshot
+
+metrics = Metrics()
+
+# Minimal HTTP responder for Prometheus scrapes
+async def serve_metrics(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    try:
+        await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), timeout=5)
+        body = metrics.render().encode()
+        writer.write(
+            b"HTTP/1.1 200 OK\r\nContent-Type: text/plain; version=0.0.4\r\n"
+            + f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode()
+            + body
+        )
+        await writer.drain()
+    except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+def endpoint_label(url: str) -> str:
+    # Collapse mint/wallet addresses so label cardinality stays bounded
+    path = httpx.URL(url).path
+    return "/".join("{address}" if len(segment) >= 32 else segment for segment in path.split("/"))
+
+# Log API payloads only at debug level, sampled and truncated
+def log_payload(label: str, response: httpx.Response) -> None:
+    if not logger.isEnabledFor(logging.DEBUG):
+        return
+    if random.random() >= PAYLOAD_LOG_SAMPLE_RATE:
+        logger.debug(f"{label}: {response.status_code}")
+        return
+    body = response.text
+    if len(body) > PAYLOAD_LOG_MAX_CHARS:
+        body = f"{body[:PAYLOAD_LOG_MAX_CHARS]}... ({len(body)} chars)"
+    logger.debug(f"{label}: {response.status_code} - {body}")
+
+# Profiles the next N scheduler ticks with cProfile and writes the stats to PROFILE_DIR
+class TickProfiler:
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._remaining = 0
+        self._profile = None
+
+    def arm(self, ticks: int) -> None:
+        self._remaining = ticks
+
+    @contextlib.contextmanager
+    def tick(self):
+        if not self._remaining:
+            yield
+            return
+        import cProfile
+
+        if self._profile is None:
+            self._profile = cProfile.Profile()
+        self._profile.enable()
+        try:
+            yield
+        finally:
+            self._profile.disable()
+            self._remaining -= 1
+            if not self._remaining:
+                self._dump()
+
+    def _dump(self) -> None:
+        import io
+        import pstats
+
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f"whale-ticks-{int(time.time())}.prof")
+        self._profile.dump_stats(path)
+        summary = io.StringIO()
+        pstats.Stats(self._profile, stream=summary).sort_stats("cumulative").print_stats(20)
+        logger.info(f"Saved scheduler profile to {path}\n{summary.getvalue()}")
+        self._profile = None
+
+tick_profiler = TickProfiler(PROFILE_DIR)
+
+# Raised instead of calling Vybe while an endpoint's circuit is open
+class CircuitOpenError(httpx.HTTPError):
+    pass
+
+# Closed -> open on a high failure rate within a sliding window -> half-open (one probe) -> closed or open again
+class CircuitBreaker:
+    def __init__(self, window=60.0, min_requests=5, failure_ratio=0.5, open_seconds=30.0):
+        self.window = window
+        self.min_requests = min_requests
+        self.failure_ratio = failure_ratio
+        self.open_seconds = open_seconds
+        self._outcomes = {}
+        self._opened_at = {}
+        self._probing = {}
+        self._tickets = itertools.count(1)
+
+    def state(self, endpoint: str) -> str:
+        opened_at = self._opened_at.get(endpoint)
+        if opened_at is None:
+            return "closed"
+        return "open" if time.monotonic() - opened_at < self.open_seconds else "half_open"
+
+    # Returns a ticket for the request (None when refused); only the ticket of the half-open probe can close the circuit
+    def allow(self, endpoint: str):
+        state = self.state(endpoint)
+        if state == "open" or (state == "half_open" and endpoint in self._probing):
+            return None
+        ticket = next(self._tickets)
+        if state == "half_open":
+            self._probing[endpoint] = ticket
+        return ticket
+
+    def release(self, endpoint: str, ticket: int) -> None:
+        # A probe that never reached record() says nothing about the endpoint; let the next caller probe instead
+        if self._probing.get(endpoint) == ticket:
+            del self._probing[endpoint]
+
+    def record(self, endpoint: str, ticket: int, failed: bool) -> None:
+        now = time.monotonic()
+        if self._probing.get(endpoint) == ticket:
+            del self._probing[endpoint]
+            if failed:
+                self._opened_at[endpoint] = now
+                logger.warning(f"Vybe {endpoint} probe failed, circuit stays open")
+            else:
+                del self._opened_at[endpoint]
+                self._outcomes.pop(endpoint, None)
+                logger.info(f"Vybe {endpoint} recovered, circuit closed")
+            return
+        outcomes = self._outcomes.setdefault(endpoint, collections.deque())
+        outcomes.append((now, failed))
+        while outcomes and now - outcomes[0][0] > self.window:
+            outcomes.popleft()
+        if not failed or endpoint in self._opened_at or len(outcomes) < self.min_requests:
+            return
+        failures = sum(1 for _, outcome in outcomes if outcome)
+        if failures >= self.failure_ratio * len(outcomes):
+            self._opened_at[endpoint] = now
+            metrics.inc("vybe_circuit_open_total", endpoint=endpoint)
+            logger.warning(
+                f"Vybe {endpoint} failed {failures} of {len(outcomes)} requests, "
+                f"opening circuit for {self.open_seconds:.0f}s"
+            )
+
+def stale_since(response: httpx.Response):
+    # Wall-clock time the response was originally fetched, if the client served it from its fallback cache
+    return response.extensions.get("stale_since")
+
+def stale_note(fetched_at: float) -> str:
+    minutes = max(1, round((time.time() - fetched_at) / 60))
+    return f"⚠️ Vybe is unavailable right now, showing data from {minutes} min ago.\n"
+
+# One TLS context shared by the Vybe and Telegram HTTP pools; each client otherwise re-parses the CA bundle (~40ms)
+@functools.cache
+def tls_context() -> ssl.SSLContext:
+    return ssl.create_default_context(cafile=certifi.where())
+
+# Long-lived async client for the Vybe API: keep-alive pooling, timeouts, bounded concurrency and a circuit breaker
+class VybeClient:
+    def __init__(self, api_key, max_connections=20, max_concurrency=10, timeout=10.0, breaker=None, stale_cache_size=1000):
+        self._api_key = api_key
+        self._limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_connections,
+            keepalive_expiry=30.0,
+        )
+        self._timeout = httpx.Timeout(timeout, connect=min(timeout, 5.0))
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._client = None
+        self.breaker = breaker or CircuitBreaker()
+        self._stale_cache_size = stale_cache_size
+        self._last_good = collections.OrderedDict()
+        self.rate_limit_remaining = None
+        self.rate_limit_reset = None
+
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                headers={"X-API-Key": self._api_key or ""},
+                limits=self._limits,
+                timeout=self._timeout,
+                verify=tls_context(),
+            )
+        return self._client
+
+    async def get(self, url: str, params: dict = None, stale_ok: bool = False) -> httpx.Response:
+        # stale_ok: user-facing lookups may get the last good response (see stale_since) instead of an error
+        endpoint = endpoint_label(url)
+        ticket = self.breaker.allow(endpoint)
+        if ticket is None:
+            metrics.inc("vybe_requests_total", endpoint=endpoint, status="circuit_open")
+            stale = self._stale_response(url, params) if stale_ok else None
+            if stale is not None:
+                return stale
+            raise CircuitOpenError(f"Vybe circuit open for {endpoint}")
+        try:
+            async with self._semaphore:
+                started = time.perf_counter()
+                try:
+                    response = await self._get_client().get(url, params=params)
+                except httpx.HTTPError:
+                    metrics.inc("vybe_requests_total", endpoint=endpoint, status="error")
+                    self.breaker.record(endpoint, ticket, failed=True)
+                    stale = self._stale_response(url, params) if stale_ok else None
+                    if stale is not None:
+                        return stale
+                    raise
+                finally:
+                    metrics.observe("vybe_fetch_seconds", time.perf_counter() - started, endpoint=endpoint)
+            metrics.inc("vybe_requests_total", endpoint=endpoint, status=response.status_code)
+            self._record_rate_limit(response)
+            failed = response.status_code >= 500 or response.status_code == 429
+            self.breaker.record(endpoint, ticket, failed=failed)
+        finally:
+            # Cancelled while queued or in flight, or any other error: free the probe slot unless record() used it
+            self.breaker.release(endpoint, ticket)
+        if stale_ok:
+            if response.is_success:
+                self._remember(url, params, response)
+            elif failed:
+                stale = self._stale_response(url, params)
+                if stale is not None:
+                    response = stale
+        return response
+
+    @staticmethod
+    def _cache_key(url: str, params: dict) -> tuple:
+        return url, tuple(sorted((params or {}).items()))
+
+    def _remember(self, url: str, params: dict, response: httpx.Response) -> None:
+        key = self._cache_key(url, params)
+        self._last_good.pop(key, None)
+        self._last_good[key] = (response.content, response.headers.get("content-type"), time.time())
+        while len(self._last_good) > self._stale_cache_size:
+            self._last_good.popitem(last=False)
+
+    def _stale_response(self, url: str, params: dict):
+        entry = self._last_good.get(self._cache_key(url, params))
+        if entry is None:
+            return None
+        content, content_type, fetched_at = entry
+        metrics.inc("vybe_stale_responses_total", endpoint=endpoint_label(url))
+        return httpx.Response(
+            200,
+            content=content,
+            headers={"content-type": content_type or "application/json"},
+            request=httpx.Request("GET", url, params=params),
+            extensions={"stale_since": fetched_at},
+        )
+
+    def _record_rate_limit(self, response: httpx.Response) -> None:
+        # Remember the latest quota headers so the scheduler can slow down before we get throttled
+        remaining = response.headers.get("x-ratelimit-remaining")
+        reset = response.headers.get("retry-after", response.headers.get("x-ratelimit-reset"))
+        try:
+            self.rate_limit_remaining = int(remaining) if remaining is not None else None
+        except ValueError:
+            self.rate_limit_remaining = None
+        try:
+            self.rate_limit_reset = float(reset) if reset is not None else None
+        except ValueError:
+            self.rate_limit_reset = None
+        if response.status_code == 429:
+            self.rate_limit_remaining = 0
+
+    async def warm(self, url: str, connections: int) -> None:
+        # Open pooled keep-alive connections up front; failures are left to the first real request and the breaker.
+        # Building the client loads the CA bundle, so do that off the event loop while the stores open.
+        client = await asyncio.to_thread(self._get_client)
+
+        async def probe():
+            try:
+                await client.head(url)
+            except httpx.HTTPError as e:
+                logger.debug(f"Vybe connection warm-up failed: {e}")
+
+        await asyncio.gather(*(probe() for _ in range(min(connections, self._limits.max_connections))))
+
+    async def close(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+vybe_client = VybeClient(
+    VYBE_API_KEY,
+    max_connections=VYBE_MAX_CONNECTIONS,
+    max_concurrency=VYBE_MAX_CONCURRENCY,
+    timeout=VYBE_TIMEOUT,
+    breaker=CircuitBreaker(
+        window=VYBE_CIRCUIT_WINDOW,
+        min_requests=VYBE_CIRCUIT_MIN_REQUESTS,
+        failure_ratio=VYBE_CIRCUIT_FAILURE_RATIO,
+        open_seconds=VYBE_CIRCUIT_OPEN_SECONDS,
+    ),
+    stale_cache_size=VYBE_STALE_CACHE_SIZE,
+)
+
+# Subscribers sorted by threshold so each transfer finds its recipients with one bisect
+class ThresholdIndex:
+    def __init__(self):
+        self._thresholds = []
+        self._users = []
+        self._by_user = {}
+
+    def __len__(self) -> int:
+        return len(self._users)
+
+    def set(self, user_id: int, threshold: float) -> None:
+        self.remove(user_id)
+        pos = bisect.bisect_right(self._thresholds, threshold)
+        self._thresholds.insert(pos, threshold)
+        self._users.insert(pos, user_id)
+        self._by_user[user_id] = threshold
+
+    def remove(self, user_id: int) -> None:
+        threshold = self._by_user.pop(user_id, None)
+        if threshold is None:
+            return
+        lo = bisect.bisect_left(self._thresholds, threshold)
+        hi = bisect.bisect_right(self._thresholds, threshold)
+        pos = self._users.index(user_id, lo, hi)
+        del self._thresholds[pos]
+        del self._users[pos]
+
+    def load(self, thresholds: dict) -> None:
+        # Bulk load sorts once instead of inserting users one by one
+        pairs = sorted((threshold, user_id) for user_id, threshold in thresholds.items())
+        self._thresholds = [threshold for threshold, _ in pairs]
+        self._users = [user_id for _, user_id in pairs]
+        self._by_user = dict(thresholds)
+
+    def min_threshold(self):
+        return self._thresholds[0] if self._thresholds else None
+
+    def users_for_amount(self, amount: float) -> list:
+        # Every user whose threshold is <= amount sits in the prefix before this position
+        return self._users[:bisect.bisect_right(self._thresholds, amount)]
+
+threshold_index = ThresholdIndex()
+
+# Crash-safe SQLite persistence: one writer task commits queued writes in batches
+class SQLiteStore:
+    NAME = "store"
+    # Lets compact-style deletes hand pages back to the OS (see _connect)
+    INCREMENTAL_VACUUM = False
+
+    def __init__(self, path: str, batch_size: int = 500):
+        self.path = path
+        self.batch_size = batch_size
+        self._conn = None
+        self._queue = None
+        self._task = None
+
+    def _schema(self, conn: sqlite3.Connection) -> None:
+        # Subclasses create their tables here
+        pass
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, check_same_thread=False)
+        if self.INCREMENTAL_VACUUM:
+            # auto_vacuum only sticks if set before WAL and the first table; older files need one VACUUM to convert
+            conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+            if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+                logger.info(f"Converting the {self.NAME} to incremental auto-vacuum, this runs once...")
+                conn.execute("VACUUM")
+        # WAL + synchronous=NORMAL: committed writes survive a killed process, and readers never block the writer
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        self._schema(conn)
+        conn.commit()
+        return conn
+
+    def _load(self) -> dict:
+        return {}
+
+    async def open(self) -> dict:
+        self._conn = await asyncio.to_thread(self._connect)
+        self._queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._writer())
+        return await asyncio.to_thread(self._load)
+
+    async def close(self) -> None:
+        if self._task is None:
+            return
+        # The sentinel lets the writer commit everything queued before it
+        self._queue.put_nowait(None)
+        await self._task
+        self._task = None
+        self._queue = None
+        await asyncio.to_thread(self._conn.close)
+
+    def _write(self, sql: str, params) -> asyncio.Future:
+        # params is a tuple for one statement, or a list of tuples for executemany
+        future = asyncio.get_running_loop().create_future()
+        if self._queue is None:
+            # Store not opened: keep data in memory only
+            future.set_result(False)
+            return future
+        self._queue.put_nowait((sql, params, future))
+        return future
+
+    def _maintain(self, script: str) -> asyncio.Future:
+        # Runs after the batch it lands in has committed, outside any transaction
+        return self._write(script, None)
+
+    def _commit(self, batch: list) -> None:
+        with self._conn:
+            for sql, params, _ in batch:
+                if params is None:
+                    continue
+                if isinstance(params, list):
+                    self._conn.executemany(sql, params)
+                else:
+                    self._conn.execute(sql, params)
+        for sql, params, _ in batch:
+            if params is None:
+                # executescript steps each statement to completion; execute() runs PRAGMA incremental_vacuum once,
+                # which frees a single page
+                self._conn.executescript(sql)
+
+    async def _writer(self) -> None:
+        stopping = False
+        while not stopping:
+            batch = []
+            item = await self._queue.get()
+            while item is not None:
+                batch.append(item)
+                if len(batch) >= self.batch_size or self._queue.empty():
+                    break
+                item = self._queue.get_nowait()
+            stopping = item is None
+            if not batch:
+                continue
+            try:
+                await asyncio.to_thread(self._commit, batch)
+                ok = True
+            except sqlite3.Error as e:
+                logger.error(f"Error writing {len(batch)} changes to the {self.NAME}: {e}")
+                ok = False
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_result(ok)
+
+# User data: thresholds, conversation states, watchlists, rules and digest settings
+class UserStore(SQLiteStore):
+    NAME = "user store"
+
+    def _schema(self, conn: sqlite3.Connection) -> None:
+        conn.execute("CREATE TABLE IF NOT EXISTS thresholds (user_id INTEGER PRIMARY KEY, threshold REAL NOT NULL)")
+        conn.execute("CREATE TABLE IF NOT EXISTS states (user_id INTEGER PRIMARY KEY, state TEXT NOT NULL)")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS watches (user_id INTEGER NOT NULL, address TEXT NOT NULL, "
+            "PRIMARY KEY (user_id, address))"
+        )
+        conn.execute("CREATE TABLE IF NOT EXISTS wallet_cursors (address TEXT PRIMARY KEY, block_time INTEGER NOT NULL)")
+        # Transfers already read at each cursor's block time, which the next poll (time_start is inclusive) reads again
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS wallet_cursor_keys (address TEXT NOT NULL, key TEXT NOT NULL, "
+            "PRIMARY KEY (address, key))"
+        )
+        conn.execute("CREATE TABLE IF NOT EXISTS digests (user_id INTEGER PRIMARY KEY, window INTEGER NOT NULL)")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS rules (rule_id TEXT PRIMARY KEY, user_id INTEGER NOT NULL, mint TEXT, "
+            "sender TEXT, receiver TEXT, wallet TEXT, min_usd REAL NOT NULL, max_usd REAL)"
+        )
+
+    def _load(self) -> dict:
+        cursor_keys = {}
+        for address, key in self._conn.execute("SELECT address, key FROM wallet_cursor_keys"):
+            cursor_keys.setdefault(address, []).append(key)
+        return {
+            "thresholds": dict(self._conn.execute("SELECT user_id, threshold FROM thresholds")),
+            "states": dict(self._conn.execute("SELECT user_id, state FROM states")),
+            "watches": self._conn.execute("SELECT user_id, address FROM watches").fetchall(),
+            "cursors": dict(self._conn.execute("SELECT address, block_time FROM wallet_cursors")),
+            "cursor_keys": cursor_keys,
+            "rules": [AlertRule(*row) for row in self._conn.execute(f"SELECT {RULE_COLUMNS} FROM rules")],
+            "digests": dict(self._conn.execute("SELECT user_id, window FROM digests")),
+        }
+
+    def save_threshold(self, user_id: int, threshold: float) -> asyncio.Future:
+        return self._write("INSERT OR REPLACE INTO thresholds (user_id, threshold) VALUES (?, ?)", (user_id, threshold))
+
+    def save_state(self, user_id: int, state: str) -> asyncio.Future:
+        return self._write("INSERT OR REPLACE INTO states (user_id, state) VALUES (?, ?)", (user_id, state))
+
+    def delete_state(self, user_id: int) -> asyncio.Future:
+        return self._write("DELETE FROM states WHERE user_id = ?", (user_id,))
+
+    def save_watch(self, user_id: int, address: str) -> asyncio.Future:
+        return self._write("INSERT OR IGNORE INTO watches (user_id, address) VALUES (?, ?)", (user_id, address))
+
+    def delete_watch(self, user_id: int, address: str) -> asyncio.Future:
+        return self._write("DELETE FROM watches WHERE user_id = ? AND address = ?", (user_id, address))
+
+    def save_cursor(self, address: str, block_time: int, keys: list) -> asyncio.Future:
+        self._write("INSERT OR REPLACE INTO wallet_cursors (address, block_time) VALUES (?, ?)", (address, block_time))
+        self._write("DELETE FROM wallet_cursor_keys WHERE address = ?", (address,))
+        return self._write("INSERT INTO wallet_cursor_keys (address, key) VALUES (?, ?)", [(address, key) for key in keys])
+
+    def delete_cursor(self, address: str) -> asyncio.Future:
+        self._write("DELETE FROM wallet_cursor_keys WHERE address = ?", (address,))
+        return self._write("DELETE FROM wallet_cursors WHERE address = ?", (address,))
+
+    def save_rule(self, rule) -> asyncio.Future:
+        return self._write(f"INSERT OR REPLACE INTO rules ({RULE_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?)", tuple(rule))
+
+    def delete_rule(self, rule_id: str) -> asyncio.Future:
+        return self._write("DELETE FROM rules WHERE rule_id = ?", (rule_id,))
+
+    def save_digest(self, user_id: int, window: int) -> asyncio.Future:
+        return self._write("INSERT OR REPLACE INTO digests (user_id, window) VALUES (?, ?)", (user_id, window))
+
+    def delete_digest(self, user_id: int) -> asyncio.Future:
+        return self._write("DELETE FROM digests WHERE user_id = ?", (user_id,))
+
+user_store = UserStore(USER_DB_FILE, batch_size=STORE_BATCH_SIZE)
+
+HISTORY_FIELDS = ("signature", "block_time", "mint_address", "sender_address", "receiver_address", "amount_usd", "token_symbol")
+
+# Append-only transfer history indexed by wallet, mint and block time, plus the time ranges it fully covers
+class TransferStore(SQLiteStore):
+    NAME = "transfer history"
+    INCREMENTAL_VACUUM = True
+    COLUMNS = "signature, block_time, mint, sender, receiver, amount_usd, symbol"
+
+    def __init__(self, path: str, batch_size: int = 500):
+        super().__init__(path, batch_size)
+        # scope ("whale", "wallet:<address>", "mint:<mint>") -> sorted [start, end, min_usd] intervals
+        self.coverage = {}
+        self._reader = None
+
+    def _schema(self, conn: sqlite3.Connection) -> None:
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS transfers (signature TEXT PRIMARY KEY, block_time INTEGER NOT NULL, "
+            "mint TEXT, sender TEXT, receiver TEXT, amount_usd REAL NOT NULL, symbol TEXT)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS transfers_time ON transfers (block_time)")
+        conn.execute("CREATE INDEX IF NOT EXISTS transfers_mint ON transfers (mint, block_time)")
+        conn.execute("CREATE INDEX IF NOT EXISTS transfers_sender ON transfers (sender, block_time)")
+        conn.execute("CREATE INDEX IF NOT EXISTS transfers_receiver ON transfers (receiver, block_time)")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS coverage (scope TEXT NOT NULL, start_time INTEGER NOT NULL, "
+            "end_time INTEGER NOT NULL, min_usd REAL NOT NULL)"
+        )
+
+    def _load(self) -> dict:
+        coverage = {}
+        for scope, start, end, min_usd in self._conn.execute(
+            "SELECT scope, start_time, end_time, min_usd FROM coverage ORDER BY scope, start_time"
+        ):
+            coverage.setdefault(scope, []).append([start, end, min_usd])
+        return {"coverage": coverage}
+
+    async def open(self) -> dict:
+        stored = await super().open()
+        self.coverage = stored["coverage"]
+        # Separate connection for lookups so they never wait on the writer (WAL readers see the last commit)
+        self._reader = await asyncio.to_thread(sqlite3.connect, self.path, check_same_thread=False)
+        return stored
+
+    async def close(self) -> None:
+        await super().close()
+        if self._reader is not None:
+            await asyncio.to_thread(self._reader.close)
+            self._reader = None
+
+    def record(self, transfers: list) -> asyncio.Future:
+        rows = []
+        for tx in transfers:
+            block_time = tx_block_time(tx)
+            if block_time is None:
+                continue
+            sender, receiver = tx_addresses(tx)
+            rows.append((transfer_key(tx), block_time, tx_mint(tx), sender, receiver, tx_amount(tx), tx.get("token_symbol")))
+        return self._write(f"INSERT OR IGNORE INTO transfers ({self.COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+
+    def extend_coverage(self, scope: str, start: int, end: int, min_usd: float) -> asyncio.Future:
+        # Overlapping intervals merge; the merged floor is the stricter one so we never claim rows we don't have
+        merged = []
+        for interval in sorted(self.coverage.get(scope, []) + [[start, end, min_usd]]):
+            if merged and interval[0] <= merged[-1][1]:
+                merged[-1][1] = max(merged[-1][1], interval[1])
+                merged[-1][2] = max(merged[-1][2], interval[2])
+            else:
+                merged.append(list(interval))
+        self.coverage[scope] = merged
+        return self._save_coverage(scope)
+
+    def _save_coverage(self, scope: str) -> asyncio.Future:
+        self._write("DELETE FROM coverage WHERE scope = ?", (scope,))
+        rows = [(scope, start, end, min_usd) for start, end, min_usd in self.coverage.get(scope, [])]
+        return self._write("INSERT INTO coverage (scope, start_time, end_time, min_usd) VALUES (?, ?, ?, ?)", rows)
+
+    def gaps(self, scopes: tuple, since: int, until: int, min_usd: float) -> list:
+        # Parts of [since, until] no listed scope covers down to min_usd
+        intervals = sorted(
+            (start, end)
+            for scope in scopes
+            for start, end, floor in self.coverage.get(scope, ())
+            if floor <= min_usd
+        )
+        gaps = []
+        cursor = since
+        for start, end in intervals:
+            if start > until:
+                break
+            if start > cursor:
+                gaps.append((cursor, start))
+            cursor = max(cursor, end)
+        if cursor < until:
+            gaps.append((cursor, until))
+        return gaps
+
+    def _query(self, sql: str, params: tuple) -> list:
+        return [dict(zip(HISTORY_FIELDS, row)) for row in self._reader.execute(sql, params)]
+
+    async def history(self, kind: str, key: str, since: int, until: int, min_usd: float, limit: int) -> list:
+        # Newest first; each branch is a range scan on its (column, block_time) index
+        where = "block_time BETWEEN ? AND ? AND amount_usd >= ?"
+        if kind == "wallet":
+            sql = (
+                f"SELECT {self.COLUMNS} FROM transfers WHERE sender = ? AND {where} UNION "
+                f"SELECT {self.COLUMNS} FROM transfers WHERE receiver = ? AND {where} "
+                "ORDER BY block_time DESC LIMIT ?"
+            )
+            params = (key, since, until, min_usd, key, since, until, min_usd, limit)
+        else:
+            sql = f"SELECT {self.COLUMNS} FROM transfers WHERE mint = ? AND {where} ORDER BY block_time DESC LIMIT ?"
+            params = (key, since, until, min_usd, limit)
+        if self._reader is None:
+            return []
+        return await asyncio.to_thread(self._query, sql, params)
+
+    async def since(self, since: int, min_usd: float, until: int = None) -> list:
+        if self._reader is None:
+            return []
+        sql = f"SELECT {self.COLUMNS} FROM transfers WHERE block_time >= ? AND amount_usd >= ?"
+        params = (since, min_usd)
+        if until is not None:
+            sql += " AND block_time <= ?"
+            params += (until,)
+        return await asyncio.to_thread(self._query, f"{sql} ORDER BY block_time", params)
+
+    async def compact(self, cutoff: int) -> bool:
+        # Drop rows past retention, trim coverage to match, then release the freed pages
+        for scope in list(self.coverage):
+            intervals = [[max(start, cutoff), end, min_usd] for start, end, min_usd in self.coverage[scope] if end > cutoff]
+            if intervals:
+                self.coverage[scope] = intervals
+            else:
+                del self.coverage[scope]
+            self._save_coverage(scope)
+        self._write("DELETE FROM transfers WHERE block_time < ?", (cutoff,))
+        return await self._maintain("PRAGMA incremental_vacuum;")
+
+transfer_store = TransferStore(TRANSFER_DB_FILE, batch_size=STORE_BATCH_SIZE)
+
+# Threshold changes are awaited until committed so they survive a crash right after the reply
+async def set_user_threshold(user_id: int, threshold: float) -> None:
+    user_thresholds[user_id] = threshold
+    threshold_index.set(user_id, threshold)
+    if alert_broker is not None:
+        alert_broker.publish(shard_for(user_id, alert_broker.num_shards), ("threshold", user_id, threshold))
+    await user_store.save_threshold(user_id, threshold)
+
+def set_user_state(user_id: int, state: str) -> None:
+    user_states[user_id] = state
+    user_store.save_state(user_id, state)
+
+def clear_user_state(user_id: int) -> None:
+    if user_states.pop(user_id, None) is not None:
+        user_store.delete_state(user_id)
+
+# Record per-handler latency for the metrics endpoint
+def timed_handler(name: str, handler):
+    @functools.wraps(handler)
+    async def wrapper(update: Update, context: "Application") -> None:
+        with metrics.timer("handler_seconds", handler=name):
+            return await handler(update, context)
+    return wrapper
+
+# Per-user locks so concurrent updates from the same user can't interleave their state changes
+_user_locks = weakref.WeakValueDictionary()
+
+def user_lock(user_id: int) -> asyncio.Lock:
+    lock = _user_locks.get(user_id)
+    if lock is None:
+        lock = asyncio.Lock()
+        _user_locks[user_id] = lock
+    return lock
+
+def per_user_serialized(handler):
+    @functools.wraps(handler)
+    async def wrapper(update: Update, context: "Application") -> None:
+        user = update.effective_user
+        if user is None:
+            return await handler(update, context)
+        async with user_lock(user.id):
+            return await handler(update, context)
+    return wrapper
+
+# Token bucket used to pace sends against Telegram's global rate limit
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity or max(rate, 1.0)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+Alert = collections.namedtuple("Alert", "chat_id text reply_markup enqueued_at")
+
+# A user's custom alert rule; empty filters match anything
+AlertRule = collections.namedtuple("AlertRule", "rule_id user_id mint sender receiver wallet min_usd max_usd")
+RULE_COLUMNS = ", ".join(AlertRule._fields)
+
+def retry_after_seconds(error: telegram.error.RetryAfter) -> float:
+    delay = error.retry_after
+    if isinstance(delay, datetime.timedelta):
+        return delay.total_seconds()
+    return float(delay)
+
+# Queue + worker pool that delivers alerts within Telegram's global and per-chat limits
+class AlertDelivery:
+    def __init__(self, global_rate=25.0, chat_rate=1.0, workers=16, queue_size=50000, max_attempts=3):
+        self._global_bucket = TokenBucket(global_rate)
+        self._chat_interval = 1.0 / chat_rate
+        self._chat_ready = {}
+        self._workers = workers
+        self._queue_size = queue_size
+        self._max_attempts = max_attempts
+        self._queue = None
+        self._tasks = []
+        self._bot = None
+        self._stats = {"sent": 0, "retried": 0, "dropped": 0, "latency_total": 0.0, "latency_max": 0.0}
+
+    def start(self, bot) -> None:
+        self._bot = bot
+        self._queue = asyncio.Queue(maxsize=self._queue_size)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self._workers)]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def drain(self) -> None:
+        if self._queue is not None:
+            await self._queue.join()
+
+    def enqueue(self, chat_id: int, text: str, reply_markup=None) -> bool:
+        if self._queue is None:
+            logger.warning("Alert delivery not started, dropping alert.")
+            self._stats["dropped"] += 1
+            return False
+        try:
+            self._queue.put_nowait(Alert(chat_id, text, reply_markup, time.monotonic()))
+        except asyncio.QueueFull:
+            self._stats["dropped"] += 1
+            return False
+        return True
+
+    def metrics(self) -> dict:
+        sent = self._stats["sent"]
+        return {
+            "queue_depth": self._queue.qsize() if self._queue else 0,
+            "sent": sent,
+            "retried": self._stats["retried"],
+            "dropped": self._stats["dropped"],
+            "avg_latency": round(self._stats["latency_total"] / sent, 3) if sent else 0.0,
+            "max_latency": round(self._stats["latency_max"], 3),
+        }
+
+    async def _wait_for_chat(self, chat_id: int) -> None:
+        # Reserve the next free slot for this chat, then sleep until it arrives
+        now = time.monotonic()
+        ready_at = max(now, self._chat_ready.get(chat_id, 0.0))
+        self._chat_ready[chat_id] = ready_at + self._chat_interval
+        if len(self._chat_ready) > 10 * self._queue_size:
+            self._chat_ready = {chat: t for chat, t in self._chat_ready.items() if t > now}
+        if ready_at > now:
+            await asyncio.sleep(ready_at - now)
+
+    async def _worker(self) -> None:
+        while True:
+            alert = await self._queue.get()
+            try:
+                await self._deliver(alert)
+            except Exception as e:
+                logger.error(f"Unexpected error delivering alert to {alert.chat_id}: {e}")
+                self._stats["dropped"] += 1
+            finally:
+                self._queue.task_done()
+
+    async def _deliver(self, alert: Alert) -> None:
+        for attempt in range(1, self._max_attempts + 1):
+            await self._wait_for_chat(alert.chat_id)
+            await self._global_bucket.acquire()
+            started = time.perf_counter()
+            try:
+                await self._bot.send_message(
+                    chat_id=alert.chat_id,
+                    text=alert.text,
+                    reply_markup=alert.reply_markup
+                )
+            except telegram.error.RetryAfter as e:
+                # Flood wait only blocks this chat; other workers keep sending
+                delay = retry_after_seconds(e)
+                logger.warning(f"Flood wait of {delay}s for chat {alert.chat_id}")
+                self._chat_ready[alert.chat_id] = time.monotonic() + delay
+                self._stats["retried"] += 1
+            except telegram.error.NetworkError as e:
+                logger.warning(f"Network error sending alert to {alert.chat_id} (attempt {attempt}): {e}")
+                self._stats["retried"] += 1
+                await asyncio.sleep(min(2 ** attempt, 30))
+            except telegram.error.TelegramError as e:
+                # Blocked bot, deleted chat, bad request: retrying won't help
+                logger.warning(f"Dropping alert to {alert.chat_id}: {e}")
+                self._stats["dropped"] += 1
+                return
+            else:
+                metrics.observe("stage_seconds", time.perf_counter() - started, stage="send")
+                latency = time.monotonic() - alert.enqueued_at
+                metrics.observe("alert_delivery_seconds", latency)
+                self._stats["sent"] += 1
+                self._stats["latency_total"] += latency
+                self._stats["latency_max"] = max(self._stats["latency_max"], latency)
+                return
+        self._stats["dropped"] += 1
+
+alert_delivery = AlertDelivery(
+    global_rate=TELEGRAM_GLOBAL_RATE,
+    chat_rate=TELEGRAM_CHAT_RATE,
+    workers=ALERT_WORKERS,
+    queue_size=ALERT_QUEUE_SIZE,
+    max_attempts=ALERT_MAX_ATTEMPTS,
+)
+
+# Async TTL cache with single-flight loads and stale-while-revalidate
+class AsyncTTLCache:
+    def __init__(self, fetch, ttl=30.0, stale_ttl=300.0, max_size=5000):
+        self._fetch = fetch
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_size = max_size
+        self._entries = {}
+        self._inflight = {}
+        self.stats = {"hits": 0, "misses": 0, "stale": 0, "coalesced": 0}
+
+    async def get(self, key):
+        entry = self._entries.get(key)
+        if entry is not None:
+            value, fetched_at = entry
+            age = time.monotonic() - fetched_at
+            if age < self.ttl:
+                self.stats["hits"] += 1
+                return value
+            if age < self.ttl + self.stale_ttl:
+                # Answer right away and refresh in the background
+                self.stats["stale"] += 1
+                self._refresh(key)
+                return value
+        self.stats["misses"] += 1
+        # Shield so one cancelled caller doesn't cancel the load others are waiting on
+        return await asyncio.shield(self._refresh(key))
+
+    def _refresh(self, key) -> asyncio.Task:
+        task = self._inflight.get(key)
+        if task is not None:
+            self.stats["coalesced"] += 1
+            return task
+        task = asyncio.create_task(self._load(key))
+        self._inflight[key] = task
+        task.add_done_callback(lambda t: self._finish(key, t))
+        return task
+
+    def _finish(self, key, task: asyncio.Task) -> None:
+        self._inflight.pop(key, None)
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning(f"Cache refresh for {key} failed: {task.exception()}")
+
+    async def _load(self, key):
+        value = await self._fetch(key)
+        self._entries.pop(key, None)
+        self._entries[key] = (value, time.monotonic())
+        while len(self._entries) > self.max_size:
+            self._entries.pop(next(iter(self._entries)))
+        return value
+
+async def fetch_token_stats(token_address: str) -> dict:
+    response = await vybe_client.get(f"{VYBE_TOKEN_URL}/{token_address}", stale_ok=True)
+    log_payload("Token API Response", response)
+    response.raise_for_status()
+    data = response.json()
+    if stale_since(response) is not None:
+        data = dict(data, stale_since=stale_since(response))
+    return data
+
+token_stats_cache = AsyncTTLCache(
+    fetch_token_stats,
+    ttl=TOKEN_CACHE_TTL,
+    stale_ttl=TOKEN_CACHE_STALE_TTL,
+    max_size=TOKEN_CACHE_SIZE,
+)
+
+# In-memory symbol <-> mint index with sorted symbols for prefix lookups
+class TokenRegistry:
+    SNAPSHOT_VERSION = 1
+
+    def __init__(self, builtin: dict):
+        self._builtin_rows = [(mint, symbol, None) for symbol, mint in builtin.items()]
+        self._by_symbol, self._by_mint, self._symbols = self.build_index(self._builtin_rows)
+
+    def __len__(self) -> int:
+        return len(self._by_mint)
+
+    @staticmethod
+    def build_index(rows) -> tuple:
+        by_symbol = {}
+        by_mint = {}
+        for mint, symbol, decimals in rows:
+            if not mint or not symbol:
+                continue
+            symbol = symbol.upper()
+            by_mint[mint] = (symbol, decimals)
+            # First listing of a symbol wins so the well-known tokens can't be shadowed by copycats
+            by_symbol.setdefault(symbol, mint)
+        return by_symbol, by_mint, sorted(by_symbol)
+
+    def resolve(self, query: str):
+        if query in self._by_mint:
+            return query
+        return self._by_symbol.get(query.upper())
+
+    def symbol_for(self, mint: str):
+        entry = self._by_mint.get(mint)
+        return entry[0] if entry else None
+
+    def decimals_for(self, mint: str):
+        entry = self._by_mint.get(mint)
+        return entry[1] if entry else None
+
+    def complete(self, prefix: str, limit: int = 5) -> list:
+        prefix = prefix.upper()
+        matches = []
+        pos = bisect.bisect_left(self._symbols, prefix)
+        while pos < len(self._symbols) and len(matches) < limit and self._symbols[pos].startswith(prefix):
+            matches.append(self._symbols[pos])
+            pos += 1
+        return matches
+
+    def _swap(self, index: tuple) -> None:
+        # Replace all three structures at once so handlers never see a half-built index
+        self._by_symbol, self._by_mint, self._symbols = index
+
+    def load_snapshot(self, path: str) -> bool:
+        try:
+            with open(path, "rb") as f:
+                snapshot = pickle.load(f)
+        except FileNotFoundError:
+            return False
+        except (OSError, pickle.UnpicklingError, EOFError) as e:
+            logger.warning(f"Ignoring unreadable token snapshot {path}: {e}")
+            return False
+        if snapshot.get("version") != self.SNAPSHOT_VERSION:
+            return False
+        self._swap((snapshot["by_symbol"], snapshot["by_mint"], snapshot["symbols"]))
+        return True
+
+    def save_snapshot(self, path: str) -> None:
+        snapshot = {
+            "version": self.SNAPSHOT_VERSION,
+            "by_symbol": self._by_symbol,
+            "by_mint": self._by_mint,
+            "symbols": self._symbols,
+        }
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump(snapshot, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+    async def refresh(self) -> None:
+        rows = list(self._builtin_rows)
+        for page in range(TOKEN_REGISTRY_MAX_PAGES):
+            response = await vybe_client.get(VYBE_TOKENS_URL, params={"limit": TOKEN_REGISTRY_PAGE_LIMIT, "page": page})
+            response.raise_for_status()
+            data = response.json()
+            tokens = data.get("data", data.get("tokens", [])) if isinstance(data, dict) else data
+            for item in tokens:
+                rows.append((
+                    item.get("mintAddress", item.get("mint_address")),
+                    item.get("symbol"),
+                    item.get("decimals"),
+                ))
+            if len(tokens) < TOKEN_REGISTRY_PAGE_LIMIT:
+                break
+        # Building and saving a large index is CPU/disk work, keep it off the event loop
+        self._swap(await asyncio.to_thread(self.build_index, rows))
+        await asyncio.to_thread(self.save_snapshot, TOKEN_REGISTRY_FILE)
+        logger.info(f"Token registry refreshed: {len(self)} tokens")
+
+token_registry = TokenRegistry(TOKEN_ADDRESS_MAP)
+
+def tx_token_symbol(tx: dict) -> str:
+    symbol = tx.get("token_symbol")
+    if symbol:
+        return symbol
+    return token_registry.symbol_for(tx_mint(tx)) or "Unknown Token"
+
+def tx_signature(tx: dict):
+    return tx.get("signature", tx.get("tx_hash"))
+
+def tx_block_time(tx: dict):
+    block_time = tx.get("block_time", tx.get("blockTime"))
+    try:
+        return int(block_time)
+    except (ValueError, TypeError):
+        return None
+
+def transfer_key(tx: dict) -> str:
+    # Fall back to the visible fields when the API doesn't give us a signature
+    signature = tx_signature(tx)
+    if signature:
+        return signature
+    return f"{tx_block_time(tx)}:{tx.get('amount_usd')}:{tx.get('token_symbol')}"
+
+# Bounded LRU/TTL set of transfer keys that subscribers were already alerted about
+class SeenTransfers:
+    def __init__(self, max_size=20000, ttl=86400.0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = collections.OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _evict(self, now: float) -> None:
+        while self._entries:
+            key, seen_at = next(iter(self._entries.items()))
+            if len(self._entries) <= self.max_size and now - seen_at <= self.ttl:
+                break
+            self._entries.popitem(last=False)
+
+    def add(self, key: str) -> bool:
+        # Returns True only the first time a key is seen within the TTL
+        now = time.monotonic()
+        self._evict(now)
+        is_new = key not in self._entries
+        self._entries[key] = now
+        self._entries.move_to_end(key)
+        if len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+        return is_new
+
+# Newest block time already processed, persisted so restarts don't replay old transfers
+class Watermark:
+    def __init__(self, path: str):
+        self.path = path
+        self.block_time = None
+        self.keys = []
+        self._dirty = False
+
+    def load(self) -> None:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable watermark file {self.path}: {e}")
+            return
+        self.block_time = data.get("block_time")
+        self.keys = data.get("keys", [])
+        logger.info(f"Restored watermark at block time {self.block_time}")
+
+    def clamp(self, oldest: int) -> None:
+        # Skip a backlog older than `oldest` so the first tick after an outage doesn't flood subscribers
+        if self.block_time is None or self.block_time >= oldest:
+            return
+        logger.warning(f"Skipping {int(oldest - self.block_time)}s of transfer backlog past the catch-up limit; resuming at block time {oldest}")
+        self.block_time = oldest
+        self.keys = []
+        self._dirty = True
+
+    def is_behind(self, tx: dict) -> bool:
+        block_time = tx_block_time(tx)
+        return self.block_time is not None and block_time is not None and block_time < self.block_time
+
+    def advance(self, tx: dict) -> None:
+        block_time = tx_block_time(tx)
+        if block_time is None:
+            return
+        if self.block_time is None or block_time > self.block_time:
+            self.block_time = block_time
+            self.keys = [transfer_key(tx)]
+            self._dirty = True
+        elif block_time == self.block_time and transfer_key(tx) not in self.keys:
+            self.keys.append(transfer_key(tx))
+            self._dirty = True
+
+    def save(self) -> None:
+        if not self._dirty:
+            return
+        tmp_path = f"{self.path}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"block_time": self.block_time, "keys": self.keys}, f)
+            os.replace(tmp_path, self.path)
+            self._dirty = False
+        except OSError as e:
+            logger.error(f"Error saving watermark: {e}")
+
+seen_transfers = SeenTransfers(max_size=SEEN_CACHE_SIZE, ttl=SEEN_TTL)
+watermark = Watermark(WATERMARK_FILE)
+
+def is_new_transfer(tx: dict) -> bool:
+    if watermark.is_behind(tx):
+        return False
+    return seen_transfers.add(transfer_key(tx))
+
+def tx_addresses(tx: dict) -> tuple:
+    sender = tx.get("sender_address", tx.get("senderAddress"))
+    receiver = tx.get("receiver_address", tx.get("receiverAddress"))
+    return sender, receiver
+
+# Watched wallets: address -> watchers, plus per-address cursors (block time and the keys read at it) and a
+# round-robin poll order
+class WatchIndex:
+    def __init__(self):
+        self._watchers = {}
+        self._by_user = {}
+        self.cursors = {}
+        self.cursor_keys = {}
+        self._poll_order = collections.deque()
+
+    def __len__(self) -> int:
+        return len(self._watchers)
+
+    def load(self, watches: list, cursors: dict, cursor_keys: dict = None) -> None:
+        for user_id, address in watches:
+            self.add(user_id, address)
+        self.cursors = {address: block_time for address, block_time in cursors.items() if address in self._watchers}
+        self.cursor_keys = {address: set(keys) for address, keys in (cursor_keys or {}).items() if address in self.cursors}
+
+    def set_cursor(self, address: str, block_time: int, keys: set) -> None:
+        self.cursors[address] = block_time
+        self.cursor_keys[address] = keys
+
+    def add(self, user_id: int, address: str) -> bool:
+        watchers = self._watchers.get(address)
+        if watchers is None:
+            watchers = self._watchers[address] = set()
+            self._poll_order.append(address)
+        if user_id in watchers:
+            return False
+        watchers.add(user_id)
+        self._by_user.setdefault(user_id, set()).add(address)
+        return True
+
+    def remove(self, user_id: int, address: str) -> bool:
+        watchers = self._watchers.get(address)
+        if not watchers or user_id not in watchers:
+            return False
+        watchers.discard(user_id)
+        self._by_user[user_id].discard(address)
+        if not self._by_user[user_id]:
+            del self._by_user[user_id]
+        if not watchers:
+            del self._watchers[address]
+            self.cursors.pop(address, None)
+            self.cursor_keys.pop(address, None)
+            self._poll_order.remove(address)
+        return True
+
+    def watchers(self, address: str) -> set:
+        return self._watchers.get(address, set())
+
+    def watched_by(self, user_id: int) -> set:
+        return self._by_user.get(user_id, set())
+
+    def next_batch(self, size: int) -> list:
+        # Rotate through all addresses so each gets polled once every len/size ticks
+        size = min(size, len(self._poll_order))
+        batch = [self._poll_order[i] for i in range(size)]
+        self._poll_order.rotate(-size)
+        return batch
+
+watch_index = WatchIndex()
+
+def tx_mint(tx: dict):
+    return tx.get("mint_address", tx.get("mintAddress"))
+
+def tx_amount(tx: dict) -> float:
+    amount = tx.get("amount_usd", 0)
+    return amount if isinstance(amount, (int, float)) else 0
+
+# Per-key running totals over a sliding time window, kept in a ring of fixed-width buckets.
+# Adding is O(1); sliding forward subtracts only the buckets that fall out, never rescanning history.
+class SlidingCounter:
+    def __init__(self, window: int, bucket_seconds: int):
+        self.bucket_seconds = bucket_seconds
+        self.size = max(1, window // bucket_seconds)
+        self._slots = [None] * self.size
+        self._newest = None
+        self.totals = {}
+
+    def advance(self, timestamp: int) -> None:
+        bucket = timestamp // self.bucket_seconds
+        if self._newest is None:
+            self._newest = bucket
+            return
+        if bucket <= self._newest:
+            return
+        # Buckets numbered <= bucket - size leave the window; only the `size` newest can still be live
+        for expired in range(self._newest - self.size + 1, min(bucket - self.size, self._newest) + 1):
+            slot = self._slots[expired % self.size]
+            if slot is None or slot[0] != expired:
+                continue
+            for key, amount in slot[1].items():
+                remaining = self.totals.get(key, 0.0) - amount
+                if abs(remaining) < 1e-6:
+                    self.totals.pop(key, None)
+                else:
+                    self.totals[key] = remaining
+            self._slots[expired % self.size] = None
+        self._newest = bucket
+
+    def add(self, timestamp: int, key, amount: float) -> None:
+        self.advance(timestamp)
+        bucket = timestamp // self.bucket_seconds
+        if bucket <= self._newest - self.size:
+            return
+        slot = self._slots[bucket % self.size]
+        if slot is None or slot[0] != bucket:
+            slot = self._slots[bucket % self.size] = (bucket, {})
+        slot[1][key] = slot[1].get(key, 0.0) + amount
+        self.totals[key] = self.totals.get(key, 0.0) + amount
+
+# Rolling whale volume per token and per-wallet flows, with top-N lists refreshed once per tick
+class WhaleAnalytics:
+    def __init__(self, windows: dict, bucket_seconds: int, top_n: int):
+        self.top_n = top_n
+        self._volume = {name: SlidingCounter(seconds, bucket_seconds) for name, seconds in windows.items()}
+        self._moved = {name: SlidingCounter(seconds, bucket_seconds) for name, seconds in windows.items()}
+        self._net = {name: SlidingCounter(seconds, bucket_seconds) for name, seconds in windows.items()}
+        self.top = {name: {"tokens": [], "wallets": [], "inflows": [], "outflows": []} for name in windows}
+        self.updated_at = None
+
+    def add(self, tx: dict) -> None:
+        block_time = tx_block_time(tx)
+        amount = tx_amount(tx)
+        if block_time is None or not amount:
+            return
+        sender, receiver = tx_addresses(tx)
+        mint = tx_mint(tx)
+        for name in self._volume:
+            if mint:
+                self._volume[name].add(block_time, mint, amount)
+            if sender:
+                self._moved[name].add(block_time, sender, amount)
+                self._net[name].add(block_time, sender, -amount)
+            if receiver:
+                self._moved[name].add(block_time, receiver, amount)
+                self._net[name].add(block_time, receiver, amount)
+
+    def refresh(self, now: int) -> None:
+        # O(keys * log N) once per tick, so /top and /flows just read the cached lists
+        for name in self._volume:
+            for counter in (self._volume[name], self._moved[name], self._net[name]):
+                counter.advance(now)
+            net = self._net[name].totals
+            self.top[name] = {
+                "tokens": heapq.nlargest(self.top_n, self._volume[name].totals.items(), key=lambda item: item[1]),
+                "wallets": heapq.nlargest(self.top_n, self._moved[name].totals.items(), key=lambda item: item[1]),
+                "inflows": [item for item in heapq.nlargest(self.top_n, net.items(), key=lambda item: item[1]) if item[1] > 0],
+                "outflows": [item for item in heapq.nsmallest(self.top_n, net.items(), key=lambda item: item[1]) if item[1] < 0],
+            }
+        self.updated_at = now
+
+whale_analytics = WhaleAnalytics(ANALYTICS_WINDOWS, ANALYTICS_BUCKET_SECONDS, ANALYTICS_TOP_N)
+
+# Rules compiled into buckets keyed by (side, address, mint), each sorted by min_usd, so a transfer
+# only touches the handful of buckets it could match and a bisect finds the qualifying prefix
+class RuleEngine:
+    def __init__(self):
+        self._rules = {}
+        self._by_user = {}
+        self._buckets = None
+
+    def __len__(self) -> int:
+        return len(self._rules)
+
+    def load(self, rules: list) -> None:
+        for rule in rules:
+            self.add(rule)
+
+    def add(self, rule: AlertRule) -> None:
+        self._rules[rule.rule_id] = rule
+        self._by_user.setdefault(rule.user_id, set()).add(rule.rule_id)
+        self._buckets = None
+
+    def remove(self, rule_id: str):
+        rule = self._rules.pop(rule_id, None)
+        if rule is not None:
+            self._by_user[rule.user_id].discard(rule_id)
+            if not self._by_user[rule.user_id]:
+                del self._by_user[rule.user_id]
+            self._buckets = None
+        return rule
+
+    def get(self, rule_id: str):
+        return self._rules.get(rule_id)
+
+    def rules_for(self, user_id: int) -> list:
+        return sorted((self._rules[rule_id] for rule_id in self._by_user.get(user_id, ())), key=lambda rule: rule.rule_id)
+
+    def min_usd(self):
+        return min((rule.min_usd for rule in self._rules.values()), default=None)
+
+    @staticmethod
+    def _bucket_key(rule: AlertRule) -> tuple:
+        # Every filter except the USD range is part of the key, so bucket hits need no further checks
+        if rule.sender and rule.receiver:
+            return "pair", (rule.sender, rule.receiver), rule.mint
+        if rule.sender:
+            return "sender", rule.sender, rule.mint
+        if rule.receiver:
+            return "receiver", rule.receiver, rule.mint
+        if rule.wallet:
+            return "wallet", rule.wallet, rule.mint
+        return "any", None, rule.mint
+
+    def _compile(self) -> dict:
+        grouped = collections.defaultdict(list)
+        for rule in self._rules.values():
+            grouped[self._bucket_key(rule)].append(rule)
+        buckets = {}
+        for key, rules in grouped.items():
+            rules.sort(key=lambda rule: rule.min_usd)
+            # Open-ended rules match a whole bisect prefix; only capped rules need a per-rule max check
+            open_rules = [rule for rule in rules if rule.max_usd is None]
+            capped_rules = [rule for rule in rules if rule.max_usd is not None]
+            buckets[key] = (
+                [rule.min_usd for rule in open_rules],
+                [rule.user_id for rule in open_rules],
+                [rule.min_usd for rule in capped_rules],
+                [(rule.max_usd, rule.user_id) for rule in capped_rules],
+            )
+        return buckets
+
+    def match(self, tx: dict) -> set:
+        if not self._rules:
+            return set()
+        if self._buckets is None:
+            self._buckets = self._compile()
+        amount = tx_amount(tx)
+        mint = tx_mint(tx)
+        sender, receiver = tx_addresses(tx)
+        mints = (None, mint) if mint else (None,)
+        sides = [("any", None)]
+        if sender:
+            sides += [("sender", sender), ("wallet", sender)]
+        if receiver:
+            sides.append(("receiver", receiver))
+            if receiver != sender:
+                sides.append(("wallet", receiver))
+        if sender and receiver:
+            sides.append(("pair", (sender, receiver)))
+        users = set()
+        for side, address in sides:
+            for key_mint in mints:
+                bucket = self._buckets.get((side, address, key_mint))
+                if bucket is None:
+                    continue
+                open_mins, open_users, capped_mins, capped_rules = bucket
+                users.update(open_users[:bisect.bisect_right(open_mins, amount)])
+                for max_usd, user_id in capped_rules[:bisect.bisect_right(capped_mins, amount)]:
+                    if amount <= max_usd:
+                        users.add(user_id)
+        return users
+
+rule_engine = RuleEngine()
+
+# Match a batch of transfers against thresholds and rules; returns (user_id, transfer) pairs
+def match_transfers(transfers: list, index: ThresholdIndex = None, rules: RuleEngine = None) -> list:
+    index = index or threshold_index
+    rules = rules or rule_engine
+    pairs = []
+    for tx in transfers:
+        users = set(index.users_for_amount(tx_amount(tx)))
+        users.update(rules.match(tx))
+        pairs.extend((user_id, tx) for user_id in users)
+    return pairs
+
 # Welcome message with crypto theme and inline keyboard
+@per_user_serialized
 async def start(update: Update, context: "Application") -> None:
     user = update.effective_user.first_name
     welcome_message = (
@@ -56,6 +1701,10 @@ async def start(update: Update, context: "Application") -> None:
             InlineKeyboardButton("Token Stats 📈", callback_data="token_stats"),
             InlineKeyboardButton("Wallet Tracker 🔍", callback_data="wallet_tracker"),
         ],
+        [
+            InlineKeyboardButton("Watch Wallet 👀", callback_data="watch_wallet"),
+            InlineKeyboardButton("My Watchlist 📋", callback_data="watchlist"),
+        ],
         [InlineKeyboardButton("Help ℹ️", callback_data="help")],
     ]
     reply_markup = InlineKeyboardMarkup(keyboard)
@@ -69,47 +1718,553 @@ async def start(update: Update, context: "Application") -> None:
             "📊 Let’s set a default threshold for whale alerts (e.g., 10000). "
             "Or type 'skip' to set it later with /threshold:"
         )
-        user_states[user_id] = "awaiting_threshold"
+        set_user_state(user_id, "awaiting_threshold")
 
 # Set threshold
+@per_user_serialized
 async def threshold(update: Update, context: "Application") -> None:
     user_id = update.effective_user.id
     await update.message.reply_text(
         "📊 Enter your threshold amount for whale alerts (e.g., 10000):"
     )
-    user_states[user_id] = "awaiting_threshold"
+    set_user_state(user_id, "awaiting_threshold")
+
+# Pages through transfers newer than the watermark. Pages run oldest first, so a tick stopped by the page cap
+# leaves no gap behind it and the next tick resumes where it stopped; caught_up is set once a short page is read.
+class TransferStream:
+    def __init__(self, min_amount_usd: float):
+        self.min_amount_usd = min_amount_usd
+        self.caught_up = False
+
+    async def __aiter__(self):
+        params = {"min_amount_usd": self.min_amount_usd, "limit": VYBE_PAGE_LIMIT}
+        if watermark.block_time is not None:
+            params["time_start"] = watermark.block_time
+            params["sort_by_asc"] = "block_time"
+        for page in range(VYBE_MAX_PAGES):
+            params["page"] = page
+            response = await vybe_client.get(VYBE_TRANSACTIONS_URL, params=params)
+            log_payload(f"Transactions API Response (page {page})", response)
+            response.raise_for_status()
+
+            with metrics.timer("stage_seconds", stage="parse"):
+                data = response.json()
+            transactions = data.get("transfers", data.get("transactions", []))
+            for tx in transactions:
+                yield tx
+
+            # A short page means we're caught up; without a watermark the newest page is enough to start from
+            if len(transactions) < VYBE_PAGE_LIMIT or watermark.block_time is None:
+                self.caught_up = True
+                return
+        logger.warning(f"Stopped paging transfers after {VYBE_MAX_PAGES} pages; the next tick resumes from the last one read.")
+
+def whale_alert_text(tx: dict) -> str:
+    amount = tx.get("amount_usd", 0)
+    token_symbol = tx_token_symbol(tx)
+    return (
+        f"🚨 Whale Alert! 🐋\n"
+        f"Transaction: ${amount} ({token_symbol})\n"
+        f"Details on AlphaVybe: https://vybe.fyi/\n\n"
+        "What would you like to do next? 👇"
+    )
+
+# Per-user digest windows and the matches waiting to go out in the next digest
+class DigestBuffer:
+    def __init__(self):
+        self.windows = {}
+        self._pending = {}
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def load(self, windows: dict) -> None:
+        self.windows.update(windows)
+
+    def set_window(self, user_id: int, window) -> None:
+        # window is in seconds (0 = one digest per tick); None turns digest mode off
+        if window is None:
+            self.windows.pop(user_id, None)
+        else:
+            self.windows[user_id] = window
+
+    def wants_digest(self, user_id: int) -> bool:
+        return user_id in self.windows
+
+    def add(self, user_id: int, tx: dict) -> None:
+        entry = self._pending.get(user_id)
+        if entry is None:
+            entry = self._pending[user_id] = (time.monotonic(), [])
+        entry[1].append(tx)
+
+    def pop_due(self) -> list:
+        now = time.monotonic()
+        due = []
+        for user_id, (started, transfers) in list(self._pending.items()):
+            if now - started >= self.windows.get(user_id, 0):
+                due.append((user_id, transfers))
+                del self._pending[user_id]
+        return due
+
+digest_buffer = DigestBuffer()
+
+def digest_text(transfers: list) -> str:
+    transfers = sorted(transfers, key=tx_amount, reverse=True)
+    lines = [f"🚨 Whale Digest! 🐋 {len(transfers)} whale transaction{'s' if len(transfers) != 1 else ''}\n"]
+    for tx in transfers[:DIGEST_MAX_ITEMS]:
+        lines.append(f"💸 ${tx.get('amount_usd', 0)} ({tx_token_symbol(tx)})")
+    if len(transfers) > DIGEST_MAX_ITEMS:
+        lines.append(f"…and +{len(transfers) - DIGEST_MAX_ITEMS} more")
+    lines.append("\nDetails on AlphaVybe: https://vybe.fyi/\n\nWhat would you like to do next? 👇")
+    return "\n".join(lines)
+
+# Queue a whale alert for every matched (user, transfer) pair; digest users get theirs buffered instead
+def deliver_matches(pairs: list, delivery: AlertDelivery = None, digests: DigestBuffer = None) -> int:
+    delivery = delivery or alert_delivery
+    digests = digest_buffer if digests is None else digests
+    texts = {}
+    sent = 0
+    for user_id, tx in pairs:
+        if digests.wants_digest(user_id):
+            digests.add(user_id, tx)
+            continue
+        text = texts.get(id(tx))
+        if text is None:
+            text = texts[id(tx)] = whale_alert_text(tx)
+        delivery.enqueue(user_id, text, WHALE_ALERT_MARKUP)
+        sent += 1
+    return sent
+
+# Send one coalesced message per user whose digest window has elapsed
+def flush_digests(delivery: AlertDelivery = None, digests: DigestBuffer = None) -> int:
+    delivery = delivery or alert_delivery
+    digests = digest_buffer if digests is None else digests
+    due = digests.pop_due()
+    for user_id, transfers in due:
+        delivery.enqueue(user_id, digest_text(transfers), WHALE_ALERT_MARKUP)
+        metrics.inc("digest_transfers_total", len(transfers))
+    metrics.inc("digest_messages_total", len(due))
+    return len(due)
+
+def shard_for(user_id: int, num_shards: int) -> int:
+    return user_id % num_shards
+
+# Matching + delivery for one shard of subscribers; runs in a worker process or in-process
+class ShardWorker:
+    def __init__(self, shard: int, num_shards: int, delivery: AlertDelivery):
+        self.shard = shard
+        self.num_shards = num_shards
+        self.delivery = delivery
+        self.index = ThresholdIndex()
+        self.rules = RuleEngine()
+        self.digests = DigestBuffer()
+        self.alerts = 0
+
+    def handle(self, message: tuple) -> None:
+        kind = message[0]
+        if kind == "transfers":
+            pairs = match_transfers(message[1], self.index, self.rules)
+            self.alerts += deliver_matches(pairs, self.delivery, self.digests)
+        elif kind == "tick_end":
+            self.alerts += flush_digests(self.delivery, self.digests)
+        elif kind == "digest":
+            _, user_id, window = message
+            self.digests.set_window(user_id, window)
+        elif kind == "threshold":
+            _, user_id, threshold = message
+            self.index.set(user_id, threshold)
+        elif kind == "rule":
+            self.rules.add(message[1])
+        elif kind == "unrule":
+            self.rules.remove(message[1])
+
+def load_shard_subscribers(path: str, shard: int, num_shards: int) -> tuple:
+    conn = sqlite3.connect(path)
+    try:
+        thresholds = dict(conn.execute(
+            "SELECT user_id, threshold FROM thresholds WHERE user_id % ? = ?", (num_shards, shard)
+        ))
+        rules = [AlertRule(*row) for row in conn.execute(
+            f"SELECT {RULE_COLUMNS} FROM rules WHERE user_id % ? = ?", (num_shards, shard)
+        )]
+        digests = dict(conn.execute(
+            "SELECT user_id, window FROM digests WHERE user_id % ? = ?", (num_shards, shard)
+        ))
+        return thresholds, rules, digests
+    except sqlite3.OperationalError:
+        # Fresh install: the main process hasn't created the tables yet
+        return {}, [], {}
+    finally:
+        conn.close()
+
+async def shard_worker_main(shard: int, num_shards: int, queue, bot_factory=None) -> None:
+    if bot_factory is None:
+        bot = telegram.Bot(
+            TELEGRAM_TOKEN,
+            request=HTTPXRequest(connection_pool_size=ALERT_WORKERS, httpx_kwargs={"verify": tls_context()}),
+        )
+    else:
+        bot = bot_factory()
+    await bot.initialize()
+    # Shards share the bot token, so they split Telegram's global rate between them
+    delivery = AlertDelivery(
+        global_rate=TELEGRAM_GLOBAL_RATE / num_shards,
+        chat_rate=TELEGRAM_CHAT_RATE,
+        workers=ALERT_WORKERS,
+        queue_size=ALERT_QUEUE_SIZE,
+        max_attempts=ALERT_MAX_ATTEMPTS,
+    )
+    delivery.start(bot)
+    worker = ShardWorker(shard, num_shards, delivery)
+    thresholds, rules, digests = await asyncio.to_thread(load_shard_subscribers, USER_DB_FILE, shard, num_shards)
+    worker.index.load(thresholds)
+    worker.rules.load(rules)
+    worker.digests.load(digests)
+    logger.info(f"Alert shard {shard}/{num_shards} started with {len(worker.index)} subscribers and {len(worker.rules)} rules")
+
+    loop = asyncio.get_running_loop()
+    while True:
+        message = await loop.run_in_executor(None, queue.get)
+        if message is None:
+            break
+        worker.handle(message)
+        if message[0] == "tick_end":
+            logger.info(f"Alert shard {shard} delivery: {delivery.metrics()}")
+
+    await delivery.drain()
+    await delivery.stop()
+    await bot.shutdown()
+
+def run_shard_worker(shard: int, num_shards: int, queue, bot_factory=None) -> None:
+    asyncio.run(shard_worker_main(shard, num_shards, queue, bot_factory))
+
+# In-process stand-in for the broker: shard workers share this event loop
+class LocalBroker:
+    def __init__(self, workers: list):
+        self.workers = workers
+        self.num_shards = len(workers)
+
+    def start(self) -> None:
+        pass
+
+    def publish(self, shard: int, message: tuple) -> None:
+        self.workers[shard].handle(message)
+
+    def broadcast(self, message: tuple) -> None:
+        for worker in self.workers:
+            worker.handle(message)
+
+    async def close(self) -> None:
+        pass
+
+# Publishes ingested transfers and subscription changes to shard worker processes over multiprocessing queues
+class ProcessBroker:
+    def __init__(self, num_shards: int, bot_factory=None):
+        # Only sharded deployments need multiprocessing, so keep it off the default import path
+        import multiprocessing
+
+        self.num_shards = num_shards
+        ctx = multiprocessing.get_context("spawn")
+        self.queues = [ctx.Queue() for _ in range(num_shards)]
+        self.processes = [
+            ctx.Process(
+                target=run_shard_worker,
+                args=(shard, num_shards, queue, bot_factory),
+                name=f"alert-shard-{shard}",
+                daemon=True,
+            )
+            for shard, queue in enumerate(self.queues)
+        ]
+
+    def start(self) -> None:
+        for process in self.processes:
+            process.start()
+
+    def publish(self, shard: int, message: tuple) -> None:
+        self.queues[shard].put(message)
+
+    def broadcast(self, message: tuple) -> None:
+        for queue in self.queues:
+            queue.put(message)
+
+    async def close(self, timeout: float = 30.0) -> None:
+        for queue in self.queues:
+            queue.put(None)
+        for process in self.processes:
+            await asyncio.to_thread(process.join, timeout)
+            if process.is_alive():
+                process.terminate()
+
+alert_broker = None
+
+# Scheduled job body: ingest new transfers, match them and hand alerts to the delivery queue
+async def broadcast_whales(context: "Application"):
+    # Returns the number of new transfers, or None if the Vybe API failed
+    floors = [value for value in (threshold_index.min_threshold(), rule_engine.min_usd()) if value is not None]
+    if not floors and not watch_index:
+        logger.info("No subscribers, rules or watched wallets, skipping whale check.")
+        return 0
+
+    # Nobody wants rows below the lowest active threshold, so don't download them. Watched wallets lower the floor to
+    # WATCH_MIN_AMOUNT_USD: this one stream then serves every watch, and the per-wallet sweep only has the rest.
+    alert_floor = max(min(floors), WHALE_MIN_AMOUNT_USD) if floors else None
+    min_amount_usd = min(value for value in (alert_floor, WATCH_MIN_AMOUNT_USD if watch_index else None) if value is not None)
+    covered_from = watermark.block_time
+    processed = []
+    pending = []
+    alerts = 0
+
+    def flush() -> int:
+        # Whatever gets alerted is stored and counted too, even if a later page fails
+        transfer_store.record(pending)
+        whales = [tx for tx in pending if alert_floor is not None and tx_amount(tx) >= alert_floor]
+        for tx in whales:
+            whale_analytics.add(tx)
+        if not whales:
+            return 0
+        if alert_broker is not None:
+            # Shard workers do the subscriber matching and sending
+            alert_broker.broadcast(("transfers", whales))
+            return 0
+        with metrics.timer("stage_seconds", stage="match"):
+            pairs = match_transfers(whales)
+        with metrics.timer("stage_seconds", stage="format"):
+            return deliver_matches(pairs)
+
+    failed = False
+    stream = TransferStream(min_amount_usd)
+    try:
+        async for tx in stream:
+            # Skip transfers that earlier ticks already alerted on
+            if not is_new_transfer(tx):
+                continue
+            processed.append(tx)
+            pending.append(tx)
+            if len(pending) >= SHARD_BATCH_SIZE:
+                alerts += flush()
+                pending = []
+            # Smaller transfers are the watchlist sweep's (poll_wallet), so each transfer alerts watchers once
+            if tx_amount(tx) >= WATCH_MIN_AMOUNT_USD:
+                alerts += alert_watchers(tx)
+    except httpx.HTTPError as e:
+        # Keep the old watermark so the missed pages are fetched again next tick; the seen set skips what was read
+        logger.error(f"Error fetching Vybe API: {e}")
+        failed = True
+    finally:
+        if pending:
+            alerts += flush()
+    metrics.inc("transfers_ingested_total", len(processed))
+    metrics.inc("alerts_queued_total", alerts)
+    if failed:
+        return None
+
+    # Pages run oldest first, so even a capped stream leaves nothing unread behind the new watermark
+    for tx in processed:
+        watermark.advance(tx)
+    watermark.save()
+
+    now = int(time.time())
+    if stream.caught_up:
+        # Everything at or above the floor from the old watermark up to now is in the history store
+        if covered_from is None:
+            covered_from = min((tx_block_time(tx) or now for tx in processed), default=now)
+        transfer_store.extend_coverage("whale", covered_from, now, min_amount_usd)
+    whale_analytics.refresh(now)
+
+    # Windowed digests are checked every tick, even quiet ones
+    if alert_broker is not None:
+        alert_broker.broadcast(("tick_end",))
+    else:
+        alerts += flush_digests()
+
+    logger.info(f"Whale check: {len(processed)} new transfers, {alerts} messages queued.")
+    return len(processed)
+
+# Picks the delay before the next whale check from the last tick's outcome
+class AdaptiveScheduler:
+    def __init__(self, interval: float, min_interval: float, max_interval: float, target_transfers: int):
+        self.interval = interval
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.target_transfers = target_transfers
+        self.failures = 0
+
+    def next_delay(self, new_transfers, rate_limit_remaining=None, rate_limit_reset=None) -> float:
+        if new_transfers is None:
+            # Exponential backoff with full jitter so restarts don't hammer a struggling API in sync
+            self.failures += 1
+            backoff = min(self.max_interval, self.interval * 2 ** self.failures)
+            delay = random.uniform(self.min_interval, max(self.min_interval, backoff))
+        else:
+            self.failures = 0
+            # Busy chain: poll sooner so pages stay short; quiet chain: back off and save quota
+            if new_transfers == 0:
+                factor = 1.5
+            else:
+                factor = min(1.5, max(0.5, self.target_transfers / new_transfers))
+            self.interval = min(self.max_interval, max(self.min_interval, self.interval * factor))
+            delay = self.interval
+        if rate_limit_remaining is not None and rate_limit_remaining <= VYBE_RATE_LIMIT_LOW_WATER:
+            # Nearly out of quota: wait for the window to reset
+            delay = max(delay, rate_limit_reset or self.max_interval)
+        return min(delay, self.max_interval)
+
+whale_scheduler = AdaptiveScheduler(
+    WHALE_CHECK_INTERVAL,
+    WHALE_MIN_INTERVAL,
+    WHALE_MAX_INTERVAL,
+    WHALE_TARGET_TRANSFERS,
+)
+whale_tick_lock = asyncio.Lock()
+
+# One scheduled tick: never overlaps another, then schedules the next one itself
+async def run_whale_tick(context: "Application") -> None:
+    if whale_tick_lock.locked():
+        logger.warning("Previous whale check still running, skipping this one.")
+        metrics.inc("whale_tick_skipped_total")
+        return
+    new_transfers = None
+    async with whale_tick_lock:
+        started = time.perf_counter()
+        planned = whale_scheduler.interval
+        try:
+            with tick_profiler.tick():
+                new_transfers = await broadcast_whales(context)
+        finally:
+            elapsed = time.perf_counter() - started
+            metrics.observe("whale_tick_seconds", elapsed)
+            if elapsed > planned:
+                metrics.inc("whale_tick_overruns_total")
+                logger.warning(f"Whale check took {elapsed:.1f}s, longer than the {planned:.0f}s interval")
+            delay = whale_scheduler.next_delay(
+                new_transfers,
+                vybe_client.rate_limit_remaining,
+                vybe_client.rate_limit_reset,
+            )
+            if new_transfers is None:
+                metrics.inc("whale_tick_failures_total")
+            logger.info(f"Next whale check in {delay:.0f}s")
+            context.job_queue.run_once(check_whales, when=delay, name="whale_check")
+
+# Queue a wallet alert for everyone watching the sender or receiver of a transfer (or only the given addresses)
+def alert_watchers(tx: dict, addresses: tuple = None) -> int:
+    alerts = 0
+    amount = tx.get("amount_usd", "N/A")
+    for address, action in zip(tx_addresses(tx), ("sent", "received")):
+        watchers = watch_index.watchers(address)
+        if not watchers or (addresses is not None and address not in addresses):
+            continue
+        text = (
+            f"👀 Wallet Alert!\n"
+            f"{address} {action} ${amount} ({tx_token_symbol(tx)})\n"
+            f"Details on AlphaVybe: https://vybe.fyi/\n\n"
+            "What would you like to do next? 👇"
+        )
+        for user_id in watchers:
+            alert_delivery.enqueue(user_id, text, WALLET_ALERT_MARKUP)
+            alerts += 1
+    return alerts
+
+# Sweep one watched wallet's transfers since its cursor. Each transfer alerts only this wallet's watchers (a poll of
+# the counterparty alerts its own), and only below WATCH_MIN_AMOUNT_USD: bigger ones came with the whale stream.
+async def poll_wallet(address: str) -> int:
+    cursor = watch_index.cursors.get(address)
+    # time_start is inclusive, so every poll reads the transfers at the cursor again; these keys skip them
+    seen = watch_index.cursor_keys.get(address, set())
+    newest, newest_keys = cursor, set(seen)
+    fetched = []
+    alerts = 0
+    page = 0
+    while True:
+        params = {"address": address, "limit": WATCH_FETCH_LIMIT}
+        if cursor is not None:
+            # Oldest first, so a wallet with more than one page of new activity continues from here next time
+            params.update(time_start=cursor, sort_by_asc="block_time", page=page)
+        response = await vybe_client.get(VYBE_WALLET_URL, params=params)
+        response.raise_for_status()
+        data = response.json()
+        transactions = data.get("transfers", data.get("transactions", []))
+        fetched += transactions
+
+        for tx in transactions:
+            block_time = tx_block_time(tx)
+            if block_time is None or (cursor is not None and block_time < cursor):
+                continue
+            key = transfer_key(tx)
+            if newest is None or block_time > newest:
+                newest, newest_keys = block_time, {key}
+            else:
+                if block_time == newest and key in newest_keys:
+                    continue
+                if block_time == newest:
+                    newest_keys.add(key)
+            # The first poll of a new watch only sets the cursor instead of replaying history
+            if cursor is not None and tx_amount(tx) < WATCH_MIN_AMOUNT_USD:
+                alerts += alert_watchers(tx, (address,))
+
+        # A full page that never got past the cursor would come back unchanged next poll, so read the next one now
+        if cursor is None or len(transactions) < WATCH_FETCH_LIMIT or newest != cursor or page + 1 >= VYBE_MAX_PAGES:
+            break
+        page += 1
+
+    # A short page since the cursor is the wallet's complete activity for that range; a full one only
+    # reaches partway, so it claims nothing. The first poll's newest page covers its own span up to now.
+    if cursor is not None:
+        covered_from = cursor if len(transactions) < WATCH_FETCH_LIMIT else None
+    else:
+        covered_from = min((tx_block_time(tx) or newest for tx in fetched), default=newest)
+    transfer_store.record(fetched)
+    if covered_from is not None:
+        transfer_store.extend_coverage(f"wallet:{address}", covered_from, int(time.time()), 0)
+
+    # Skip the cursor write if the wallet was unwatched while we were fetching
+    if newest is not None and (newest, newest_keys) != (cursor, seen) and watch_index.watchers(address):
+        watch_index.set_cursor(address, newest, newest_keys)
+        user_store.save_cursor(address, newest, sorted(newest_keys))
+    return alerts
+
+# Scheduled job: sweep a fixed-size batch of watched wallets concurrently (the Vybe semaphore bounds requests in flight)
+async def poll_watched_wallets(context: "Application") -> None:
+    batch = watch_index.next_batch(WATCH_BATCH_SIZE)
+    if not batch:
+        return
+    results = await asyncio.gather(*(poll_wallet(address) for address in batch), return_exceptions=True)
+    alerts = 0
+    for address, result in zip(batch, results):
+        if isinstance(result, Exception):
+            logger.error(f"Error polling watched wallet {address}: {result}")
+        else:
+            alerts += result
+    logger.info(f"Wallet watch: polled {len(batch)} of {len(watch_index)} wallets, {alerts} alerts queued.")
 
 # Check for whale transactions
 async def check_whales(context: "Application", user_id: int = None, update: Update = None) -> None:
+    # Scheduled run: stream new transfers out to every subscriber
+    if not user_id:
+        await run_whale_tick(context)
+        return
+
     try:
-        headers = {"X-API-Key": VYBE_API_KEY}
-        response = requests.get(VYBE_TRANSACTIONS_URL, headers=headers)
-        logger.info(f"Transactions API Response: {response.status_code} - {response.text}")
+        response = await vybe_client.get(VYBE_TRANSACTIONS_URL, params=VYBE_TRANSACTIONS_PARAMS, stale_ok=True)
+        log_payload("Transactions API Response", response)
         response.raise_for_status()
+        stale = stale_since(response)
+        marker = stale_note(stale) if stale is not None else ""
 
         data = response.json()
-        # Log the full response for debugging
-        logger.info(f"Transactions API Data: {data}")
         # Try both "transfers" and "transactions" keys to handle different response formats
         transactions = data.get("transfers", data.get("transactions", [])) 
 
         if not transactions:
             logger.info("No transactions found in the response.")
             if user_id:
-                keyboard = [
-                    [
-                        InlineKeyboardButton("Check Again 🔄", callback_data="check_whales"),
-                        InlineKeyboardButton("Set New Threshold 🐋", callback_data="set_threshold"),
-                    ]
-                ]
-                reply_markup = InlineKeyboardMarkup(keyboard)
                 await context.bot.send_message(
                     chat_id=user_id,
                     text=(
-                        "🕒 No whale transactions found at the moment.\n"
+                        f"{marker}🕒 No whale transactions found at the moment.\n"
                         "What would you like to do next? 👇"
                     ),
-                    reply_markup=reply_markup
+                    reply_markup=WHALE_ALERT_MARKUP
                 )
             return
 
@@ -125,71 +2280,33 @@ async def check_whales(context: "Application", user_id: int = None, update: Upda
                 return
 
             threshold = user_thresholds[user_id]
-            found = False
-            for tx in transactions:
-                amount = tx.get("amount_usd", 0)
-                if amount >= threshold:
-                    found = True
-                    token_symbol = tx.get("token_symbol", "Unknown Token")
-                    keyboard = [
-                        [
-                            InlineKeyboardButton("Check Again 🔄", callback_data="check_whales"),
-                            InlineKeyboardButton("Set New Threshold 🐋", callback_data="set_threshold"),
-                        ]
-                    ]
-                    reply_markup = InlineKeyboardMarkup(keyboard)
+            matches = [tx for tx in transactions if tx.get("amount_usd", 0) >= threshold]
+            # Digest users get the whole check as one message, like their scheduled alerts
+            if matches and digest_buffer.wants_digest(user_id):
+                await context.bot.send_message(
+                    chat_id=user_id,
+                    text=marker + digest_text(matches),
+                    reply_markup=WHALE_ALERT_MARKUP
+                )
+            else:
+                for tx in matches:
                     await context.bot.send_message(
                         chat_id=user_id,
-                        text=(
-                            f"🚨 Whale Alert! 🐋\n"
-                            f"Transaction: ${amount} ({token_symbol})\n"
-                            f"Details on AlphaVybe: https://vybe.fyi/\n\n"
-                            "What would you like to do next? 👇"
-                        ),
-                        reply_markup=reply_markup
+                        text=marker + whale_alert_text(tx),
+                        reply_markup=WHALE_ALERT_MARKUP
                     )
-            if not found and user_id:
-                keyboard = [
-                    [
-                        InlineKeyboardButton("Check Again 🔄", callback_data="check_whales"),
-                        InlineKeyboardButton("Set New Threshold 🐋", callback_data="set_threshold"),
-                    ]
-                ]
-                reply_markup = InlineKeyboardMarkup(keyboard)
+            if not matches:
                 await context.bot.send_message(
                     chat_id=user_id,
                     text=(
-                        "🕒 No whale transactions above your threshold right now.\n"
+                        f"{marker}🕒 No whale transactions above your threshold right now.\n"
                         "What would you like to do next? 👇"
                     ),
-                    reply_markup=reply_markup
+                    reply_markup=WHALE_ALERT_MARKUP
                 )
             return
 
-        for user_id, threshold in user_thresholds.items():
-            for tx in transactions:
-                amount = tx.get("amount_usd", 0)
-                if amount >= threshold:
-                    token_symbol = tx.get("token_symbol", "Unknown Token")
-                    keyboard = [
-                        [
-                            InlineKeyboardButton("Check Again 🔄", callback_data="check_whales"),
-                            InlineKeyboardButton("Set New Threshold 🐋", callback_data="set_threshold"),
-                        ]
-                    ]
-                    reply_markup = InlineKeyboardMarkup(keyboard)
-                    await context.bot.send_message(
-                        chat_id=user_id,
-                        text=(
-                            f"🚨 Whale Alert! 🐋\n"
-                            f"Transaction: ${amount} ({token_symbol})\n"
-                            f"Details on AlphaVybe: https://vybe.fyi/\n\n"
-                            "What would you like to do next? 👇"
-                        ),
-                        reply_markup=reply_markup
-                    )
-
-    except requests.RequestException as e:
+    except httpx.HTTPError as e:
         logger.error(f"Error fetching Vybe API: {e}")
         if user_id:
             keyboard = [[InlineKeyboardButton("Try Again 🔄", callback_data="check_whales")]]
@@ -209,49 +2326,49 @@ async def check(update: Update, context: "Application") -> None:
     await check_whales(context, user_id, update)
 
 # Check token stats
+@per_user_serialized
 async def token(update: Update, context: "Application") -> None:
     user_id = update.effective_user.id
     await update.message.reply_text(
         "📈 Enter a token symbol to check its stats (e.g., SOL or USDC):"
     )
-    user_states[user_id] = "awaiting_token"
+    set_user_state(user_id, "awaiting_token")
 
 async def process_token(user_id: int, token_symbol: str, context: "Application") -> None:
-    # Validate token symbol (basic check for letters only)
-    if not re.match(r"^[A-Za-z]+$", token_symbol):
+    # Validate input: a token symbol (letters/digits) or a Solana mint address
+    if not TOKEN_SYMBOL_RE.match(token_symbol) and not SOLANA_ADDRESS_RE.match(token_symbol):
         keyboard = [[InlineKeyboardButton("Try Another Token 📈", callback_data="token_stats")]]
         reply_markup = InlineKeyboardMarkup(keyboard)
         await context.bot.send_message(
             chat_id=user_id,
-            text="❌ Invalid token symbol! Please use letters only (e.g., SOL).\nClick below to try another token:",
+            text="❌ Invalid token! Please enter a symbol (e.g., SOL) or a mint address.\nClick below to try another token:",
             reply_markup=reply_markup
         )
         return
 
     # Map token symbol to Solana token address
-    token_symbol = token_symbol.upper()
-    if token_symbol not in TOKEN_ADDRESS_MAP:
+    token_address = token_registry.resolve(token_symbol)
+    if token_address is None:
+        token_symbol = token_symbol.upper()
+        suggestions = token_registry.complete(token_symbol) or ["SOL", "USDC", "USDT"]
         keyboard = [[InlineKeyboardButton("Try Another Token 📈", callback_data="token_stats")]]
         reply_markup = InlineKeyboardMarkup(keyboard)
         await context.bot.send_message(
             chat_id=user_id,
-            text=f"❌ Token {token_symbol} not supported! Try SOL, USDC, or USDT.\nClick below to try another token:",
+            text=f"❌ Token {token_symbol} not found! Try {', '.join(suggestions)}.\nClick below to try another token:",
             reply_markup=reply_markup
         )
         return
 
-    token_address = TOKEN_ADDRESS_MAP[token_symbol]
+    token_symbol = token_registry.symbol_for(token_address) or token_symbol.upper()
 
     try:
-        headers = {"X-API-Key": VYBE_API_KEY}
-        # Fetch the specific token details
-        response = requests.get(f"{VYBE_TOKEN_URL}/{token_address}", headers=headers)
-        logger.info(f"Token API Response: {response.status_code} - {response.text}")
-        response.raise_for_status()
-
-        data = response.json()
+        # Fetch the specific token details (shared with concurrent lookups for the same token)
+        data = await token_stats_cache.get(token_address)
+        logger.debug(f"Token stats cache: {token_stats_cache.stats}")
         price = data.get("price", "N/A")
         change_24h = data.get("change_24h", "N/A")
+        marker = stale_note(data["stale_since"]) if "stale_since" in data else ""
 
         # Add trend indicator
         trend = ""
@@ -266,12 +2383,15 @@ async def process_token(user_id: int, token_symbol: str, context: "Application")
         except (ValueError, TypeError):
             trend = "❓ (Trend Unavailable)"
 
-        keyboard = [[InlineKeyboardButton("Check Another Token 📈", callback_data="token_stats")]]
+        keyboard = [
+            [InlineKeyboardButton("Whale History 📜", callback_data=f"history:{token_address}")],
+            [InlineKeyboardButton("Check Another Token 📈", callback_data="token_stats")],
+        ]
         reply_markup = InlineKeyboardMarkup(keyboard)
         await context.bot.send_message(
             chat_id=user_id,
             text=(
-                f"📊 {token_symbol} Stats:\n"
+                f"{marker}📊 {token_symbol} Stats:\n"
                 f"Price: ${price}\n"
                 f"24h Change: {change_24h}% {trend}\n"
                 f"Details on AlphaVybe: https://vybe.fyi/\n\n"
@@ -279,7 +2399,7 @@ async def process_token(user_id: int, token_symbol: str, context: "Application")
             ),
             reply_markup=reply_markup
         )
-    except requests.RequestException as e:
+    except httpx.HTTPError as e:
         logger.error(f"Error fetching token data: {e}")
         keyboard = [[InlineKeyboardButton("Try Again 📈", callback_data="token_stats")]]
         reply_markup = InlineKeyboardMarkup(keyboard)
@@ -290,12 +2410,13 @@ async def process_token(user_id: int, token_symbol: str, context: "Application")
         )
 
 # Check wallet activity
+@per_user_serialized
 async def wallet(update: Update, context: "Application") -> None:
     user_id = update.effective_user.id
     await update.message.reply_text(
         "🔍 Enter a Solana wallet address to track its activity (e.g., 5oNDL...):"
     )
-    user_states[user_id] = "awaiting_wallet"
+    set_user_state(user_id, "awaiting_wallet")
 
 async def process_wallet(user_id: int, wallet_address: str, context: "Application", awaited=None) -> None:
     # Check for empty input
@@ -310,7 +2431,7 @@ async def process_wallet(user_id: int, wallet_address: str, context: "Applicatio
         return
 
     # Basic validation for Solana wallet address (base58, typically 32-44 characters)
-    if not re.match(r"^[1-9A-HJ-NP-Za-km-z]{32,44}$", wallet_address):
+    if not SOLANA_ADDRESS_RE.match(wallet_address):
         keyboard = [[InlineKeyboardButton("Try Another Wallet 🔍", callback_data="wallet_tracker")]]
         reply_markup = InlineKeyboardMarkup(keyboard)
         await context.bot.send_message(
@@ -321,12 +2442,12 @@ async def process_wallet(user_id: int, wallet_address: str, context: "Applicatio
         return
 
     try:
-        headers = {"X-API-Key": VYBE_API_KEY}
         # Use the token/transfers endpoint with an address filter
-        wallet_url = f"{VYBE_WALLET_URL}?address={wallet_address}&limit=5"
-        response = requests.get(wallet_url, headers=headers)
-        logger.info(f"Wallet API Response: {response.status_code} - {response.text}")
+        response = await vybe_client.get(VYBE_WALLET_URL, params={"address": wallet_address, "limit": 5}, stale_ok=True)
+        log_payload("Wallet API Response", response)
         response.raise_for_status()
+        stale = stale_since(response)
+        marker = stale_note(stale) if stale is not None else ""
 
         data = response.json()
         transactions = data.get("transfers", data.get("transactions", []))[:3]  
@@ -336,18 +2457,24 @@ async def process_wallet(user_id: int, wallet_address: str, context: "Applicatio
             reply_markup = InlineKeyboardMarkup(keyboard)
             await context.bot.send_message(
                 chat_id=user_id,
-                text=f"🔍 No recent activity for wallet {wallet_address}.\nClick below to track another wallet:",
+                text=f"{marker}🔍 No recent activity for wallet {wallet_address}.\nClick below to track another wallet:",
                 reply_markup=reply_markup
             )
             return
 
-        message = f"🔍 Wallet Activity for {wallet_address}:\n\n"
+        message = f"{marker}🔍 Wallet Activity for {wallet_address}:\n\n"
         for tx in transactions:
             amount = tx.get("amount_usd", "N/A")
             message += f"💸 Transaction: ${amount}\n"
 
         message += "\nDetails on AlphaVybe: https://vybe.fyi/\n\nWhat would you like to do next? 👇"
-        keyboard = [[InlineKeyboardButton("Track Another Wallet 🔍", callback_data="wallet_tracker")]]
+        keyboard = [
+            [
+                InlineKeyboardButton("Watch This Wallet 👀", callback_data=f"watch:{wallet_address}"),
+                InlineKeyboardButton("Whale History 📜", callback_data=f"history:{wallet_address}"),
+            ],
+            [InlineKeyboardButton("Track Another Wallet 🔍", callback_data="wallet_tracker")],
+        ]
         reply_markup = InlineKeyboardMarkup(keyboard)
         await context.bot.send_message(
             chat_id=user_id,
@@ -355,7 +2482,7 @@ async def process_wallet(user_id: int, wallet_address: str, context: "Applicatio
             reply_markup=reply_markup
         )
 
-    except requests.RequestException as e:
+    except httpx.HTTPError as e:
         logger.error(f"Error fetching wallet data: {e}")
         keyboard = [[InlineKeyboardButton("Try Again 🔍", callback_data="wallet_tracker")]]
         reply_markup = InlineKeyboardMarkup(keyboard)
@@ -365,6 +2492,455 @@ async def process_wallet(user_id: int, wallet_address: str, context: "Applicatio
             reply_markup=reply_markup
         )
 
+# Watch a wallet for push alerts
+@per_user_serialized
+async def watch(update: Update, context: "Application") -> None:
+    user_id = update.effective_user.id
+    if context.args:
+        await process_watch(user_id, context.args[0], context)
+        return
+    await update.message.reply_text(
+        "👀 Enter a Solana wallet address to watch (e.g., 5oNDL...):"
+    )
+    set_user_state(user_id, "awaiting_watch")
+
+async def process_watch(user_id: int, wallet_address: str, context: "Application") -> None:
+    wallet_address = wallet_address.strip()
+    if not SOLANA_ADDRESS_RE.match(wallet_address):
+        keyboard = [[InlineKeyboardButton("Try Another Wallet 👀", callback_data="watch_wallet")]]
+        reply_markup = InlineKeyboardMarkup(keyboard)
+        await context.bot.send_message(
+            chat_id=user_id,
+            text="❌ Invalid Solana wallet address! It should be 32-44 characters long and use base58 (e.g., 5oNDL...).\nClick below to try another wallet:",
+            reply_markup=reply_markup
+        )
+        return
+
+    if len(watch_index.watched_by(user_id)) >= WATCH_LIMIT_PER_USER:
+        keyboard = [[InlineKeyboardButton("My Watchlist 📋", callback_data="watchlist")]]
+        reply_markup = InlineKeyboardMarkup(keyboard)
+        await context.bot.send_message(
+            chat_id=user_id,
+            text=f"❌ You can watch up to {WATCH_LIMIT_PER_USER} wallets. Remove one first!\nClick below to see your watchlist:",
+            reply_markup=reply_markup
+        )
+        return
+
+    if watch_index.add(user_id, wallet_address):
+        await user_store.save_watch(user_id, wallet_address)
+    keyboard = [[InlineKeyboardButton("My Watchlist 📋", callback_data="watchlist")]]
+    reply_markup = InlineKeyboardMarkup(keyboard)
+    await context.bot.send_message(
+        chat_id=user_id,
+        text=f"✅ Watching {wallet_address}! I’ll alert you when it moves funds. 👀\nClick below to see your watchlist:",
+        reply_markup=reply_markup
+    )
+
+async def process_unwatch(user_id: int, wallet_address: str, context: "Application") -> None:
+    if watch_index.remove(user_id, wallet_address):
+        await user_store.delete_watch(user_id, wallet_address)
+        if not watch_index.watchers(wallet_address):
+            user_store.delete_cursor(wallet_address)
+        text = f"🗑️ Stopped watching {wallet_address}."
+    else:
+        text = f"❓ You weren’t watching {wallet_address}."
+    keyboard = [[InlineKeyboardButton("My Watchlist 📋", callback_data="watchlist")]]
+    reply_markup = InlineKeyboardMarkup(keyboard)
+    await context.bot.send_message(chat_id=user_id, text=text, reply_markup=reply_markup)
+
+# Stop watching a wallet
+async def unwatch(update: Update, context: "Application") -> None:
+    user_id = update.effective_user.id
+    if not context.args:
+        await send_watchlist(user_id, context)
+        return
+    await process_unwatch(user_id, context.args[0], context)
+
+async def send_watchlist(user_id: int, context: "Application") -> None:
+    addresses = sorted(watch_index.watched_by(user_id))
+    if not addresses:
+        keyboard = [[InlineKeyboardButton("Watch a Wallet 👀", callback_data="watch_wallet")]]
+        reply_markup = InlineKeyboardMarkup(keyboard)
+        await context.bot.send_message(
+            chat_id=user_id,
+            text="📋 You aren’t watching any wallets yet.\nClick below to add one:",
+            reply_markup=reply_markup
+        )
+        return
+    keyboard = [
+        [InlineKeyboardButton(f"Unwatch {address[:6]}…{address[-4:]} 🗑️", callback_data=f"unwatch:{address}")]
+        for address in addresses
+    ]
+    keyboard.append([InlineKeyboardButton("Watch a Wallet 👀", callback_data="watch_wallet")])
+    reply_markup = InlineKeyboardMarkup(keyboard)
+    await context.bot.send_message(
+        chat_id=user_id,
+        text="📋 Your watched wallets:\n\n" + "\n".join(addresses),
+        reply_markup=reply_markup
+    )
+
+# Show the user's watched wallets
+async def watchlist(update: Update, context: "Application") -> None:
+    await send_watchlist(update.effective_user.id, context)
+
+RULE_USAGE = (
+    "⚙️ Create a custom alert rule, for example:\n"
+    "/rule min=50000 token=SOL\n"
+    "/rule min=10000 max=100000 wallet=5oNDL... dir=in\n"
+    "/rule min=25000 from=5oNDL... to=9xQeW...\n\n"
+    "Filters: min, max (USD), token (symbol or mint), from, to, wallet, dir (in/out/any). "
+    "wallet can't be combined with from or to. "
+    f"Whale alerts only cover transfers of ${WHALE_MIN_AMOUNT_USD} or more."
+)
+
+def parse_rule(user_id: int, args: list) -> AlertRule:
+    # Raises ValueError with a user-facing message for bad input
+    fields = {}
+    for arg in args:
+        key, sep, value = arg.partition("=")
+        if not sep or not value:
+            raise ValueError(f"Couldn’t read '{arg}', use key=value.")
+        fields[key.lower()] = value
+
+    unknown = set(fields) - {"min", "max", "token", "from", "to", "wallet", "dir"}
+    if unknown:
+        raise ValueError(f"Unknown filter: {', '.join(sorted(unknown))}.")
+    try:
+        min_usd = float(fields.get("min", WHALE_MIN_AMOUNT_USD))
+        max_usd = float(fields["max"]) if "max" in fields else None
+    except ValueError:
+        raise ValueError("min and max must be numbers (e.g., 10000).")
+    if min_usd < 0 or (max_usd is not None and max_usd < min_usd):
+        raise ValueError("max must be at least min, and both must be positive.")
+
+    mint = None
+    if "token" in fields:
+        mint = token_registry.resolve(fields["token"])
+        if mint is None:
+            raise ValueError(f"Token {fields['token'].upper()} not found.")
+
+    for key in ("from", "to", "wallet"):
+        if key in fields and not SOLANA_ADDRESS_RE.match(fields[key]):
+            raise ValueError(f"'{key}' must be a Solana wallet address.")
+    sender = fields.get("from")
+    receiver = fields.get("to")
+    wallet = fields.get("wallet")
+    if wallet and (sender or receiver):
+        raise ValueError("Use either wallet= (with dir=) or from=/to=, not both.")
+    direction = fields.get("dir", "any").lower()
+    if direction not in ("in", "out", "any"):
+        raise ValueError("dir must be in, out or any.")
+    if wallet and direction == "in":
+        receiver, wallet = wallet, None
+    elif wallet and direction == "out":
+        sender, wallet = wallet, None
+
+    return AlertRule(uuid.uuid4().hex[:8], user_id, mint, sender, receiver, wallet, min_usd, max_usd)
+
+def describe_rule(rule: AlertRule) -> str:
+    parts = [f"≥ ${rule.min_usd:g}"]
+    if rule.max_usd is not None:
+        parts.append(f"≤ ${rule.max_usd:g}")
+    if rule.mint:
+        parts.append(f"token {token_registry.symbol_for(rule.mint) or rule.mint}")
+    if rule.sender:
+        parts.append(f"from {rule.sender[:6]}…")
+    if rule.receiver:
+        parts.append(f"to {rule.receiver[:6]}…")
+    if rule.wallet:
+        parts.append(f"wallet {rule.wallet[:6]}…")
+    return ", ".join(parts)
+
+def publish_rule_change(message: tuple, user_id: int) -> None:
+    if alert_broker is not None:
+        alert_broker.publish(shard_for(user_id, alert_broker.num_shards), message)
+
+# Create a custom alert rule
+async def rule(update: Update, context: "Application") -> None:
+    user_id = update.effective_user.id
+    if not context.args:
+        await update.message.reply_text(RULE_USAGE)
+        return
+    if len(rule_engine.rules_for(user_id)) >= RULES_PER_USER:
+        await update.message.reply_text(f"❌ You can have up to {RULES_PER_USER} rules. Remove one with /rules first!")
+        return
+    try:
+        new_rule = parse_rule(user_id, context.args)
+    except ValueError as e:
+        await update.message.reply_text(f"❌ {e}\n\n{RULE_USAGE}")
+        return
+
+    rule_engine.add(new_rule)
+    publish_rule_change(("rule", new_rule), user_id)
+    await user_store.save_rule(new_rule)
+    keyboard = [[InlineKeyboardButton("My Rules ⚙️", callback_data="rules")]]
+    reply_markup = InlineKeyboardMarkup(keyboard)
+    await update.message.reply_text(
+        f"✅ Rule {new_rule.rule_id} saved: {describe_rule(new_rule)}. 🐋\nClick below to see all your rules:",
+        reply_markup=reply_markup
+    )
+
+async def send_rules(user_id: int, context: "Application") -> None:
+    rules = rule_engine.rules_for(user_id)
+    if not rules:
+        await context.bot.send_message(chat_id=user_id, text=f"⚙️ You don’t have any custom rules yet.\n\n{RULE_USAGE}")
+        return
+    keyboard = [
+        [InlineKeyboardButton(f"Delete {saved_rule.rule_id} 🗑️", callback_data=f"delrule:{saved_rule.rule_id}")]
+        for saved_rule in rules
+    ]
+    reply_markup = InlineKeyboardMarkup(keyboard)
+    await context.bot.send_message(
+        chat_id=user_id,
+        text="⚙️ Your alert rules:\n\n" + "\n".join(f"{saved_rule.rule_id}: {describe_rule(saved_rule)}" for saved_rule in rules),
+        reply_markup=reply_markup
+    )
+
+async def delete_rule(user_id: int, rule_id: str, context: "Application") -> None:
+    saved_rule = rule_engine.get(rule_id)
+    if saved_rule is None or saved_rule.user_id != user_id:
+        await context.bot.send_message(chat_id=user_id, text=f"❓ Rule {rule_id} not found.")
+        return
+    rule_engine.remove(rule_id)
+    publish_rule_change(("unrule", rule_id), user_id)
+    await user_store.delete_rule(rule_id)
+    await context.bot.send_message(chat_id=user_id, text=f"🗑️ Deleted rule {rule_id}.")
+
+# List the user's alert rules
+async def rules(update: Update, context: "Application") -> None:
+    await send_rules(update.effective_user.id, context)
+
+# Delete an alert rule by id
+async def delrule(update: Update, context: "Application") -> None:
+    user_id = update.effective_user.id
+    if not context.args:
+        await send_rules(user_id, context)
+        return
+    await delete_rule(user_id, context.args[0], context)
+
+# Fetch a range the history store doesn't cover from Vybe and keep the rows
+async def backfill_history(kind: str, key: str, start: int, end: int) -> int:
+    params = {
+        "address" if kind == "wallet" else "mint_address": key,
+        "min_amount_usd": WHALE_MIN_AMOUNT_USD,
+        "time_start": start,
+        "time_end": end,
+        "limit": HISTORY_FETCH_LIMIT,
+    }
+    fetched = []
+    for page in range(HISTORY_MAX_PAGES):
+        params["page"] = page
+        response = await vybe_client.get(VYBE_TRANSACTIONS_URL, params=params)
+        log_payload(f"History API Response (page {page})", response)
+        response.raise_for_status()
+        data = response.json()
+        transactions = data.get("transfers", data.get("transactions", []))
+        fetched.extend(transactions)
+        if len(transactions) < HISTORY_FETCH_LIMIT:
+            # Only a complete fetch means the range can be answered locally next time
+            transfer_store.extend_coverage(f"{kind}:{key}", start, end, WHALE_MIN_AMOUNT_USD)
+            break
+    # Wait for the commit so the local query below sees these rows
+    await transfer_store.record(fetched)
+    return len(fetched)
+
+# Whale transfers for a wallet or mint over the last N days: local store first, Vybe only for gaps.
+# Returns (transfers, complete); complete is False when Vybe failed and only local rows could be used.
+async def load_history(kind: str, key: str, days: int) -> tuple:
+    now = int(time.time())
+    since = now - days * 86400
+    # The newest few minutes belong to the next whale check, not to a backfill
+    gaps = transfer_store.gaps(("whale", f"{kind}:{key}"), since, now - int(WHALE_MAX_INTERVAL), WHALE_MIN_AMOUNT_USD)
+    complete = True
+    try:
+        for start, end in gaps:
+            await backfill_history(kind, key, start, end)
+    except httpx.HTTPError as e:
+        logger.warning(f"History backfill for {key} failed, answering from local history: {e}")
+        complete = False
+    metrics.inc("history_queries_total", source="api" if gaps else "local")
+    with metrics.timer("stage_seconds", stage="history"):
+        transfers = await transfer_store.history(kind, key, since, now, WHALE_MIN_AMOUNT_USD, HISTORY_MAX_ROWS)
+    return transfers, complete
+
+def history_text(kind: str, key: str, days: int, transfers: list) -> str:
+    label = (token_registry.symbol_for(key) or key) if kind == "mint" else key
+    lines = [f"📜 Whale History for {label} (last {days} days, ≥ ${WHALE_MIN_AMOUNT_USD}):\n"]
+    if not transfers:
+        lines.append("No whale transfers in this period.")
+    else:
+        volume = sum(tx_amount(tx) for tx in transfers)
+        lines.append(f"Transfers: {len(transfers)}{'+' if len(transfers) >= HISTORY_MAX_ROWS else ''}")
+        lines.append(f"Volume: ${volume:,.0f}")
+        if kind == "wallet":
+            sent = sum(tx_amount(tx) for tx in transfers if tx["sender_address"] == key)
+            received = sum(tx_amount(tx) for tx in transfers if tx["receiver_address"] == key)
+            lines.append(f"Sent: ${sent:,.0f} | Received: ${received:,.0f}")
+            lines.append(f"Net Flow: {'+' if received >= sent else '-'}${abs(received - sent):,.0f}")
+        else:
+            wallets = {address for tx in transfers for address in tx_addresses(tx) if address}
+            lines.append(f"Wallets Involved: {len(wallets)}")
+        lines.append("\nLargest moves:")
+        for tx in sorted(transfers, key=tx_amount, reverse=True)[:HISTORY_LINES]:
+            when = datetime.datetime.fromtimestamp(tx["block_time"], datetime.timezone.utc).strftime("%Y-%m-%d %H:%M")
+            lines.append(f"💸 ${tx['amount_usd']} ({tx_token_symbol(tx)}) – {when} UTC")
+    lines.append("\nDetails on AlphaVybe: https://vybe.fyi/\n\nWhat would you like to do next? 👇")
+    return "\n".join(lines)
+
+async def send_history(user_id: int, target: str, days: int, context: "Application") -> None:
+    token_address = token_registry.resolve(target)
+    if token_address is not None:
+        kind, key = "mint", token_address
+        keyboard = [[InlineKeyboardButton("Check Another Token 📈", callback_data="token_stats")]]
+    elif SOLANA_ADDRESS_RE.match(target):
+        kind, key = "wallet", target
+        keyboard = [
+            [InlineKeyboardButton("Watch This Wallet 👀", callback_data=f"watch:{target}")],
+            [InlineKeyboardButton("Track Another Wallet 🔍", callback_data="wallet_tracker")],
+        ]
+    else:
+        await context.bot.send_message(
+            chat_id=user_id,
+            text="❌ Please give a wallet address, token symbol or mint address (e.g., /history SOL 7)."
+        )
+        return
+
+    transfers, complete = await load_history(kind, key, days)
+    text = history_text(kind, key, days, transfers)
+    if not complete:
+        text = "⚠️ Vybe is unavailable right now, showing only the history stored locally.\n" + text
+    await context.bot.send_message(
+        chat_id=user_id,
+        text=text,
+        reply_markup=InlineKeyboardMarkup(keyboard)
+    )
+
+# Whale history for a wallet or token, served from the local transfer store
+@per_user_serialized
+async def history(update: Update, context: "Application") -> None:
+    user_id = update.effective_user.id
+    if not context.args:
+        await update.message.reply_text(
+            "📜 Usage: /history <wallet, token symbol or mint> [days]\n"
+            f"Example: /history SOL 7 (up to {HISTORY_RETENTION_DAYS} days)"
+        )
+        return
+    days = HISTORY_DEFAULT_DAYS
+    if len(context.args) > 1:
+        if not context.args[1].isdigit() or not 0 < int(context.args[1]) <= HISTORY_RETENTION_DAYS:
+            await update.message.reply_text(f"❌ Days must be a number from 1 to {HISTORY_RETENTION_DAYS}.")
+            return
+        days = int(context.args[1])
+    await send_history(user_id, context.args[0].strip(), days, context)
+
+def analytics_window(args: list) -> str:
+    window = args[0].lower() if args else "24h"
+    return window if window in ANALYTICS_WINDOWS else None
+
+def analytics_keyboard(command: str) -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup([[
+        InlineKeyboardButton(f"Last {window} ⏱️", callback_data=f"{command}:{window}") for window in ANALYTICS_WINDOWS
+    ]])
+
+def analytics_footer() -> str:
+    updated = "never"
+    if whale_analytics.updated_at is not None:
+        updated = datetime.datetime.fromtimestamp(whale_analytics.updated_at, datetime.timezone.utc).strftime("%H:%M UTC")
+    return f"\nUpdated {updated}. Details on AlphaVybe: https://vybe.fyi/\n\nWhat would you like to do next? 👇"
+
+def top_text(window: str) -> str:
+    ranked = whale_analytics.top[window]
+    lines = [f"🏆 Top Whale Activity (last {window})\n", "Tokens by whale volume:"]
+    for rank, (mint, volume) in enumerate(ranked["tokens"], 1):
+        lines.append(f"{rank}. {token_registry.symbol_for(mint) or mint} – ${volume:,.0f}")
+    if not ranked["tokens"]:
+        lines.append("No whale transfers yet.")
+    lines.append("\nMost active wallets:")
+    for rank, (address, volume) in enumerate(ranked["wallets"], 1):
+        lines.append(f"{rank}. {address} – ${volume:,.0f} moved")
+    if not ranked["wallets"]:
+        lines.append("No whale transfers yet.")
+    lines.append(analytics_footer())
+    return "\n".join(lines)
+
+def flows_text(window: str) -> str:
+    ranked = whale_analytics.top[window]
+    lines = [f"🌊 Whale Flows (last {window})\n", "Biggest net inflows:"]
+    for rank, (address, net) in enumerate(ranked["inflows"], 1):
+        lines.append(f"{rank}. {address} +${net:,.0f}")
+    if not ranked["inflows"]:
+        lines.append("None yet.")
+    lines.append("\nBiggest net outflows:")
+    for rank, (address, net) in enumerate(ranked["outflows"], 1):
+        lines.append(f"{rank}. {address} -${-net:,.0f}")
+    if not ranked["outflows"]:
+        lines.append("None yet.")
+    lines.append(analytics_footer())
+    return "\n".join(lines)
+
+# Top tokens and wallets by rolling whale volume
+async def top(update: Update, context: "Application") -> None:
+    window = analytics_window(context.args)
+    if window is None:
+        await update.message.reply_text(f"❌ Choose a window: /top {' or /top '.join(ANALYTICS_WINDOWS)}")
+        return
+    await update.message.reply_text(top_text(window), reply_markup=analytics_keyboard("top"))
+
+# Net whale inflows and outflows per wallet
+async def flows(update: Update, context: "Application") -> None:
+    window = analytics_window(context.args)
+    if window is None:
+        await update.message.reply_text(f"❌ Choose a window: /flows {' or /flows '.join(ANALYTICS_WINDOWS)}")
+        return
+    await update.message.reply_text(flows_text(window), reply_markup=analytics_keyboard("flows"))
+
+# Switch between one message per whale and a coalesced digest
+async def digest(update: Update, context: "Application") -> None:
+    user_id = update.effective_user.id
+    choice = context.args[0].lower() if context.args else ""
+    if choice == "off":
+        window = None
+    elif choice == "on":
+        window = 0
+    elif choice.isdigit() and 0 < int(choice) <= DIGEST_MAX_WINDOW_MINUTES:
+        window = int(choice) * 60
+    else:
+        current = digest_buffer.windows.get(user_id)
+        status = "off" if current is None else ("on (every check)" if current == 0 else f"every {current // 60} min")
+        await update.message.reply_text(
+            f"📬 Digest mode is {status}.\n\n"
+            "/digest on – one message per check with all your whale alerts\n"
+            f"/digest 15 – one message every 15 minutes (up to {DIGEST_MAX_WINDOW_MINUTES})\n"
+            "/digest off – one message per whale"
+        )
+        return
+
+    digest_buffer.set_window(user_id, window)
+    if alert_broker is not None:
+        alert_broker.publish(shard_for(user_id, alert_broker.num_shards), ("digest", user_id, window))
+    if window is None:
+        await user_store.delete_digest(user_id)
+        await update.message.reply_text("✅ Digest mode off. You’ll get one message per whale. 🐋")
+    else:
+        await user_store.save_digest(user_id, window)
+        when = "after each check" if window == 0 else f"every {window // 60} minutes"
+        await update.message.reply_text(f"✅ Digest mode on. You’ll get one summary {when}. 📬")
+
+# Admin-only: profile the next N scheduler ticks
+async def profile(update: Update, context: "Application") -> None:
+    if update.effective_user.id not in ADMIN_USER_IDS:
+        return
+    try:
+        ticks = int(context.args[0]) if context.args else 1
+    except ValueError:
+        ticks = 1
+    tick_profiler.arm(ticks)
+    await update.message.reply_text(f"🧪 Profiling the next {ticks} whale check(s). Stats will be saved to {PROFILE_DIR}/.")
+
+# Periodic metrics snapshot in the logs
+async def log_metrics_snapshot(context: "Application") -> None:
+    logger.info(f"Metrics: {metrics.snapshot()}")
+
 # Help command with crypto theme
 async def help_command(update: Update, context: "Application") -> None:
     help_message = (
@@ -373,6 +2949,11 @@ async def help_command(update: Update, context: "Application") -> None:
         "- Track whale moves with a custom threshold 🐋\n"
         "- Check token prices and stats 📊\n"
         "- Monitor wallet activity 🔍\n"
+        "- Look up a wallet’s or token’s whale history with /history 📜\n"
+        "- See the top whale tokens, wallets and flows with /top and /flows 🏆\n"
+        "- Watch wallets and get pushed alerts when they move funds 👀\n"
+        "- Create custom alert rules by token, wallet and USD range with /rule ⚙️\n"
+        "- Bundle alerts into one digest message with /digest 📬\n"
         "- Get real-time alerts with AlphaVybe links 💰\n\n"
         "Choose an action below to get started! 👇"
     )
@@ -385,11 +2966,16 @@ async def help_command(update: Update, context: "Application") -> None:
             InlineKeyboardButton("Token Stats 📈", callback_data="token_stats"),
             InlineKeyboardButton("Wallet Tracker 🔍", callback_data="wallet_tracker"),
         ],
+        [
+            InlineKeyboardButton("Watch Wallet 👀", callback_data="watch_wallet"),
+            InlineKeyboardButton("My Watchlist 📋", callback_data="watchlist"),
+        ],
     ]
     reply_markup = InlineKeyboardMarkup(keyboard)
     await update.callback_query.message.reply_text(help_message, reply_markup=reply_markup)
 
 # Handle text input (threshold, token, wallet)
+@per_user_serialized
 async def handle_text(update: Update, context: "Application") -> None:
     user_id = update.effective_user.id
     text = update.message.text.lower()
@@ -404,7 +2990,7 @@ async def handle_text(update: Update, context: "Application") -> None:
 
     if state == "awaiting_threshold":
         if text == "skip":
-            user_states.pop(user_id, None)
+            clear_user_state(user_id)
             keyboard = [[InlineKeyboardButton("Set Threshold Later 🐋", callback_data="set_threshold")]]
             reply_markup = InlineKeyboardMarkup(keyboard)
             await update.message.reply_text(
@@ -419,8 +3005,8 @@ async def handle_text(update: Update, context: "Application") -> None:
                     "❌ Threshold must be a positive number! Try again or type 'skip' to set it later:"
                 )
                 return
-            user_thresholds[user_id] = threshold
-            user_states.pop(user_id, None)
+            await set_user_threshold(user_id, threshold)
+            clear_user_state(user_id)
             keyboard = [[InlineKeyboardButton("Check Whale Alerts 📊", callback_data="check_whales")]]
             reply_markup = InlineKeyboardMarkup(keyboard)
             await update.message.reply_text(
@@ -433,16 +3019,23 @@ async def handle_text(update: Update, context: "Application") -> None:
             )
 
     elif state == "awaiting_token":
-        user_states.pop(user_id, None)
-        token_symbol = text.upper()
+        clear_user_state(user_id)
+        # Keep the original casing so mint addresses still resolve
+        token_symbol = update.message.text.strip()
         await process_token(user_id, token_symbol, context)
 
     elif state == "awaiting_wallet":
-        user_states.pop(user_id, None)
-        wallet_address = text
+        clear_user_state(user_id)
+        # Base58 is case-sensitive, so use the address exactly as typed
+        wallet_address = update.message.text.strip()
         await process_wallet(user_id, wallet_address, context)
 
+    elif state == "awaiting_watch":
+        clear_user_state(user_id)
+        await process_watch(user_id, update.message.text, context)
+
 # Handle inline keyboard button clicks
+@per_user_serialized
 async def button_handler(update: Update, context: "Application") -> None:
     query = update.callback_query
     await query.answer()  # Acknowledge the button press
@@ -454,19 +3047,40 @@ async def button_handler(update: Update, context: "Application") -> None:
         await query.message.reply_text(
             "📊 Enter your threshold amount for whale alerts (e.g., 10000):"
         )
-        user_states[user_id] = "awaiting_threshold"
+        set_user_state(user_id, "awaiting_threshold")
     elif callback_data == "check_whales":
         await check_whales(context, user_id, update)
     elif callback_data == "token_stats":
         await query.message.reply_text(
             "📈 Enter a token symbol to check its stats (e.g., SOL or USDC):"
         )
-        user_states[user_id] = "awaiting_token"
+        set_user_state(user_id, "awaiting_token")
     elif callback_data == "wallet_tracker":
         await query.message.reply_text(
             "🔍 Enter a Solana wallet address to track its activity (e.g., 5oNDL...):"
         )
-        user_states[user_id] = "awaiting_wallet"
+        set_user_state(user_id, "awaiting_wallet")
+    elif callback_data == "watch_wallet":
+        await query.message.reply_text(
+            "👀 Enter a Solana wallet address to watch (e.g., 5oNDL...):"
+        )
+        set_user_state(user_id, "awaiting_watch")
+    elif callback_data == "watchlist":
+        await send_watchlist(user_id, context)
+    elif callback_data.startswith("watch:"):
+        await process_watch(user_id, callback_data.split(":", 1)[1], context)
+    elif callback_data.startswith("unwatch:"):
+        await process_unwatch(user_id, callback_data.split(":", 1)[1], context)
+    elif callback_data == "rules":
+        await send_rules(user_id, context)
+    elif callback_data.startswith("delrule:"):
+        await delete_rule(user_id, callback_data.split(":", 1)[1], context)
+    elif callback_data.startswith("top:") and callback_data[4:] in ANALYTICS_WINDOWS:
+        await query.message.reply_text(top_text(callback_data[4:]), reply_markup=analytics_keyboard("top"))
+    elif callback_data.startswith("flows:") and callback_data[6:] in ANALYTICS_WINDOWS:
+        await query.message.reply_text(flows_text(callback_data[6:]), reply_markup=analytics_keyboard("flows"))
+    elif callback_data.startswith("history:"):
+        await send_history(user_id, callback_data.split(":", 1)[1], HISTORY_DEFAULT_DAYS, context)
     elif callback_data == "help":
         await help_command(update, context)
 
@@ -485,37 +3099,184 @@ async def error_handler(update: Update, context: "Application") -> None:
             reply_markup=reply_markup
         )
 
+# Drop transfer history older than the retention window
+async def compact_transfer_history(context: "Application") -> None:
+    cutoff = int(time.time()) - HISTORY_RETENTION_DAYS * 86400
+    if not await transfer_store.compact(cutoff):
+        logger.error("Transfer history compaction failed.")
+
+# Background refresh of the token registry
+async def refresh_token_registry(context: "Application") -> None:
+    try:
+        await token_registry.refresh()
+    except httpx.HTTPError as e:
+        logger.error(f"Error refreshing token registry: {e}")
+
+# Replay the last day of stored history into the rolling /top and /flows windows; rows after `until` come from the ticks
+async def rebuild_whale_analytics(until: int = None) -> None:
+    now = int(time.time())
+    rows = await transfer_store.since(now - max(ANALYTICS_WINDOWS.values()), WHALE_MIN_AMOUNT_USD, until)
+    for i, tx in enumerate(rows, 1):
+        whale_analytics.add(tx)
+        # Yield now and then so handlers and the first tick aren't held up by a busy day
+        if i % 5000 == 0:
+            await asyncio.sleep(0)
+    whale_analytics.refresh(int(time.time()))
+    logger.info(f"Rebuilt whale analytics from {len(rows)} stored transfers")
+
+# Load stored users, the transfer history and the token registry snapshot, restore the polling watermark, start
+# the alert delivery workers and any shard processes once the bot is initialized
+async def post_init(application: "Application") -> None:
+    watermark.load()
+    # None of these depend on each other, so the disk loads and the Vybe TLS handshakes overlap
+    stored, _, registry_loaded, _ = await asyncio.gather(
+        user_store.open(),
+        transfer_store.open(),
+        asyncio.to_thread(token_registry.load_snapshot, TOKEN_REGISTRY_FILE),
+        vybe_client.warm(VYBE_API_BASE, VYBE_WARM_CONNECTIONS),
+    )
+    user_thresholds.update(stored["thresholds"])
+    user_states.update(stored["states"])
+    threshold_index.load(user_thresholds)
+    watch_index.load(stored["watches"], stored["cursors"], stored["cursor_keys"])
+    rule_engine.load(stored["rules"])
+    digest_buffer.load(stored["digests"])
+    logger.info(
+        f"Loaded {len(user_thresholds)} subscribers, {len(rule_engine)} rules and "
+        f"{len(watch_index)} watched wallets from {USER_DB_FILE}"
+    )
+    if registry_loaded:
+        logger.info(f"Loaded token registry snapshot: {len(token_registry)} tokens")
+    watermark.clamp(int(time.time() - WHALE_MAX_CATCHUP))
+    for key in watermark.keys:
+        seen_transfers.add(key)
+    application.bot_data["analytics_rebuild"] = asyncio.create_task(rebuild_whale_analytics(watermark.block_time))
+    alert_delivery.start(application.bot)
+    if alert_broker is not None:
+        alert_broker.start()
+
+    metrics.gauge("alert_queue_depth", lambda: alert_delivery.metrics()["queue_depth"])
+    metrics.gauge("alerts_sent", lambda: alert_delivery.metrics()["sent"])
+    metrics.gauge("alerts_dropped", lambda: alert_delivery.metrics()["dropped"])
+    metrics.gauge("alerts_retried", lambda: alert_delivery.metrics()["retried"])
+    metrics.gauge("token_cache_hits", lambda: token_stats_cache.stats["hits"])
+    metrics.gauge("token_cache_misses", lambda: token_stats_cache.stats["misses"])
+    metrics.gauge("subscribers", lambda: len(threshold_index))
+    metrics.gauge("watched_wallets", lambda: len(watch_index))
+    if METRICS_PORT:
+        application.bot_data["metrics_server"] = await asyncio.start_server(serve_metrics, "0.0.0.0", METRICS_PORT)
+        logger.info(f"Serving metrics on :{METRICS_PORT}/metrics")
+    if PROFILE_TICKS:
+        tick_profiler.arm(PROFILE_TICKS)
+
+# Stop the metrics server, shard processes and delivery workers, flush the user and transfer stores and close the shared Vybe client when the bot stops
+async def post_shutdown(application: "Application") -> None:
+    metrics_server = application.bot_data.get("metrics_server")
+    if metrics_server is not None:
+        metrics_server.close()
+    rebuild = application.bot_data.get("analytics_rebuild")
+    if rebuild is not None:
+        rebuild.cancel()
+    if alert_broker is not None:
+        await alert_broker.close()
+    await alert_delivery.stop()
+    await user_store.close()
+    await transfer_store.close()
+    await vybe_client.close()
+
+# Register the command, text and button handlers; shared by main() and the webhook benchmark
+def add_handlers(application: "Application") -> None:
+    from telegram.ext import CommandHandler, MessageHandler, filters, CallbackQueryHandler
+
+    application.add_handler(CommandHandler("start", timed_handler("start", start)))
+    application.add_handler(CommandHandler("threshold", timed_handler("threshold", threshold)))
+    application.add_handler(CommandHandler("check", timed_handler("check", check)))
+    application.add_handler(CommandHandler("token", timed_handler("token", token)))
+    application.add_handler(CommandHandler("wallet", timed_handler("wallet", wallet)))
+    application.add_handler(CommandHandler("watch", timed_handler("watch", watch)))
+    application.add_handler(CommandHandler("unwatch", timed_handler("unwatch", unwatch)))
+    application.add_handler(CommandHandler("watchlist", timed_handler("watchlist", watchlist)))
+    application.add_handler(CommandHandler("rule", timed_handler("rule", rule)))
+    application.add_handler(CommandHandler("rules", timed_handler("rules", rules)))
+    application.add_handler(CommandHandler("delrule", timed_handler("delrule", delrule)))
+    application.add_handler(CommandHandler("top", timed_handler("top", top)))
+    application.add_handler(CommandHandler("flows", timed_handler("flows", flows)))
+    application.add_handler(CommandHandler("history", timed_handler("history", history)))
+    application.add_handler(CommandHandler("digest", timed_handler("digest", digest)))
+    application.add_handler(CommandHandler("help", timed_handler("help", help_command)))
+    application.add_handler(CommandHandler("profile", timed_handler("profile", profile)))
+
+    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, timed_handler("text", handle_text)))
+    application.add_handler(CallbackQueryHandler(timed_handler("button", button_handler)))
+
+    application.add_error_handler(error_handler)
+
 # Main function to start the bot
 def main() -> None:
+    # telegram.ext (and the webhook server it pulls in) is only needed to run the bot, not by shard
+    # workers or the replay harness that import this module
+    import pytz
+    from telegram.ext import Application
+
+    global alert_broker
+    if ALERT_SHARDS > 0:
+        alert_broker = ProcessBroker(ALERT_SHARDS)
+
     # Create the Application instance with a custom HTTPXRequest
     request = HTTPXRequest(
         connection_pool_size=10,
         read_timeout=10.0,
         connect_timeout=10.0,
+        httpx_kwargs={"verify": tls_context()},
+    )
+    application = (
+        Application.builder()
+        .token(TELEGRAM_TOKEN)
+        .request(request)
+        .get_updates_request(HTTPXRequest(httpx_kwargs={"verify": tls_context()}))
+        .concurrent_updates(CONCURRENT_UPDATES)
+        .post_init(post_init)
+        .post_shutdown(post_shutdown)
+        .build()
     )
-    application = Application.builder().token(TELEGRAM_TOKEN).request(request).build()
-
-    # Add handlers
-    application.add_handler(CommandHandler("start", start))
-    application.add_handler(CommandHandler("threshold", threshold))
-    application.add_handler(CommandHandler("check", check))
-    application.add_handler(CommandHandler("token", token))
-    application.add_handler(CommandHandler("wallet", wallet))
-    application.add_handler(CommandHandler("help", help_command))
-
-    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_text))
-    application.add_handler(CallbackQueryHandler(button_handler))
 
-    application.add_error_handler(error_handler)
+    add_handlers(application)
 
     # Set the scheduler timezone to UTC+1 
     application.job_queue.scheduler.configure(timezone=pytz.timezone("Etc/GMT-1"))
 
-    # Schedule whale checks every 120 seconds
-    application.job_queue.run_repeating(check_whales, interval=120, first=0)
+    # Start the whale check chain; each tick schedules the next with an adaptive delay
+    application.job_queue.run_once(check_whales, when=0, name="whale_check")
+
+    # Log a metrics snapshot periodically
+    if METRICS_SNAPSHOT_INTERVAL > 0:
+        application.job_queue.run_repeating(log_metrics_snapshot, interval=METRICS_SNAPSHOT_INTERVAL, first=METRICS_SNAPSHOT_INTERVAL)
+
+    # Poll a batch of watched wallets each tick
+    application.job_queue.run_repeating(poll_watched_wallets, interval=WATCH_POLL_INTERVAL, first=15)
+
+    # Enforce the transfer history retention window
+    application.job_queue.run_repeating(compact_transfer_history, interval=HISTORY_COMPACT_INTERVAL, first=60)
+
+    # Keep the token registry fresh without blocking handlers
+    application.job_queue.run_repeating(refresh_token_registry, interval=TOKEN_REGISTRY_REFRESH, first=5)
+
+    if WEBHOOK_URL:
+        if not WEBHOOK_SECRET:
+            logger.warning("WEBHOOK_SECRET is not set; webhook requests won't be verified.")
+        logger.info(f"Starting WhaleAlertBot with webhook on {WEBHOOK_LISTEN}:{WEBHOOK_PORT}/{WEBHOOK_PATH}...")
+        application.run_webhook(
+            listen=WEBHOOK_LISTEN,
+            port=WEBHOOK_PORT,
+            url_path=WEBHOOK_PATH,
+            webhook_url=f"{WEBHOOK_URL.rstrip('/')}/{WEBHOOK_PATH}",
+            secret_token=WEBHOOK_SECRET,
+            allowed_updates=ALLOWED_UPDATES,
+        )
+        return
 
     logger.info("Starting WhaleAlertBot...")
-    application.run_polling(allowed_updates=Update.ALL_TYPES)
+    application.run_polling(allowed_updates=ALLOWED_UPDATES)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,487 @@
+import argparse
+import asyncio
+import bisect
+import functools
+import importlib
+import json
+import logging
+import os
+import random
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import types
+import uuid
+from urllib.parse import parse_qs, urlsplit
+
+# Offline replay of recorded or synthetic transfers through the alert pipeline:
+# fake Vybe API (local HTTP server) -> ingestion -> matching -> formatting -> delivery (fake Telegram bot).
+# Nothing leaves the machine, so it can run in CI and fail the build on a throughput regression.
+
+BASE58 = "123456789ABCDEFGHJKLMNPQRSTUVWXYZabcdefghijkmnopqrstuvwxyz"
+BUILTIN_TOKENS = {
+    "SOL": "So11111111111111111111111111111111111111112",
+    "USDC": "EPjFWdd5AufqSSqeM2qN1xzybapC8G4wEGGkZwyTDt1v",
+    "USDT": "Es9vMFrzaCERmJfrF4H2FYD4KCoNkY11McCe8BenwNYB",
+}
+
+def random_address(rng: random.Random) -> str:
+    return "".join(rng.choice(BASE58) for _ in range(44))
+
+def field(tx: dict, snake: str, camel: str):
+    return tx.get(snake, tx.get(camel))
+
+# Synthetic whale stream: a few hot tokens and wallets, log-uniform USD amounts, increasing block times
+def synthetic_transfers(count: int, tokens: int, wallets: int, seed: int) -> list:
+    rng = random.Random(seed)
+    mints = list(BUILTIN_TOKENS.values()) + [random_address(rng) for _ in range(max(0, tokens - len(BUILTIN_TOKENS)))]
+    addresses = [random_address(rng) for _ in range(wallets)]
+    block_time = int(time.time()) - count
+    transfers = []
+    for _ in range(count):
+        block_time += rng.choice((0, 0, 1, 1, 2))
+        transfers.append({
+            "signature": uuid.UUID(int=rng.getrandbits(128)).hex,
+            "block_time": block_time,
+            "amount_usd": round(10 ** rng.uniform(3.7, 6.7), 2),
+            "mint_address": rng.choice(mints[:3]) if rng.random() < 0.5 else rng.choice(mints),
+            "sender_address": rng.choice(addresses),
+            "receiver_address": rng.choice(addresses),
+        })
+    return transfers
+
+def load_transfers(path: str) -> list:
+    transfers = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                transfers.append(json.loads(line))
+    return transfers
+
+# Local stand-in for the Vybe API, serving transfers released so far (paged like the real one, newest first
+# unless sort_by_asc=block_time)
+class FakeVybe:
+    def __init__(self, transfers: list, latency: float = 0.0, error_rate: float = 0.0, seed: int = 0):
+        self.transfers = sorted(transfers, key=lambda tx: field(tx, "block_time", "blockTime") or 0)
+        self.block_times = [field(tx, "block_time", "blockTime") or 0 for tx in self.transfers]
+        self.released = 0
+        self.latency = latency
+        # Fraction of requests answered with a 503, and a switch that fails every request (an outage)
+        self.error_rate = error_rate
+        self.down = False
+        self._rng = random.Random(seed)
+        self.requests = 0
+        self.by_address = {}
+        self.tokens = dict((mint, symbol) for symbol, mint in BUILTIN_TOKENS.items())
+        for i, tx in enumerate(self.transfers):
+            for address in (field(tx, "sender_address", "senderAddress"), field(tx, "receiver_address", "receiverAddress")):
+                if address:
+                    self.by_address.setdefault(address, []).append(i)
+            mint = field(tx, "mint_address", "mintAddress")
+            if mint and mint not in self.tokens:
+                self.tokens[mint] = tx.get("token_symbol") or f"TKN{len(self.tokens)}"
+        self._server = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.sockets[0].getsockname()[:2]
+        return f"http://{host}:{port}"
+
+    async def start(self) -> None:
+        self._server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+
+    async def stop(self) -> None:
+        self._server.close()
+        await self._server.wait_closed()
+
+    def release(self, count: int) -> int:
+        self.released = min(len(self.transfers), self.released + count)
+        return self.released
+
+    def _transfers(self, query: dict) -> dict:
+        limit = int(query.get("limit", 100))
+        page = int(query.get("page", 0))
+        address = query.get("address")
+        start = bisect.bisect_left(self.block_times, int(query.get("time_start", 0)), 0, self.released)
+        end = bisect.bisect_right(self.block_times, int(query.get("time_end", sys.maxsize)), start, self.released)
+        if address:
+            rows = [self.transfers[i] for i in self.by_address.get(address, ()) if start <= i < end]
+        else:
+            rows = self.transfers[start:end]
+        if query.get("sort_by_asc") != "block_time":
+            rows = reversed(rows)
+        min_amount_usd = float(query.get("min_amount_usd", 0))
+        mint = query.get("mint_address")
+        rows = [
+            tx for tx in rows
+            if tx.get("amount_usd", 0) >= min_amount_usd and (mint is None or field(tx, "mint_address", "mintAddress") == mint)
+        ]
+        return {"transfers": rows[page * limit:(page + 1) * limit]}
+
+    def _route(self, path: str, query: dict) -> tuple:
+        if path == "/token/transfers":
+            return 200, self._transfers(query)
+        if path == "/tokens":
+            limit = int(query.get("limit", 1000))
+            page = int(query.get("page", 0))
+            rows = [{"mintAddress": mint, "symbol": symbol, "decimals": 9} for mint, symbol in self.tokens.items()]
+            return 200, {"data": rows[page * limit:(page + 1) * limit]}
+        if path.startswith("/token/"):
+            mint = path[len("/token/"):]
+            rng = random.Random(mint)
+            return 200, {"mintAddress": mint, "price": round(rng.uniform(0.01, 200), 4), "change_24h": round(rng.uniform(-20, 20), 2)}
+        return 404, {"error": "not found"}
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        # HTTP/1.1 with keep-alive so the bot's pooled connections get reused like in production
+        try:
+            while True:
+                head = await reader.readuntil(b"\r\n\r\n")
+                method, target, _ = head.split(b"\r\n", 1)[0].decode().split(" ", 2)
+                url = urlsplit(target)
+                query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+                self.requests += 1
+                if self.latency:
+                    await asyncio.sleep(self.latency)
+                if self.down or (self.error_rate and self._rng.random() < self.error_rate):
+                    status, payload = 503, {"error": "unavailable"}
+                else:
+                    status, payload = self._route(url.path, query)
+                body = json.dumps(payload).encode()
+                reason = {200: "OK", 404: "Not Found", 503: "Service Unavailable"}[status]
+                writer.write(
+                    f"HTTP/1.1 {status} {reason}\r\n".encode()
+                    + f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n\r\n".encode()
+                    # HEAD (the bot's connection warm-up) gets the headers only, or the keep-alive stream desyncs
+                    + (body if method != "HEAD" else b"")
+                )
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+# Telegram stand-in that records every message instead of sending it
+class FakeBot:
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.sent = []
+        self.first_sent_at = None
+
+    async def send_message(self, chat_id, text, reply_markup=None, **kwargs):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if self.first_sent_at is None:
+            self.first_sent_at = time.perf_counter()
+        self.sent.append((chat_id, text))
+
+# Fake Telegram bot for shard worker processes: the replay can't see their sends, so each one writes its
+# count to stats_dir on shutdown
+class ShardStatsBot(FakeBot):
+    def __init__(self, stats_dir: str, latency: float = 0.0, verbose: bool = False):
+        super().__init__(latency)
+        self.stats_dir = stats_dir
+        self.verbose = verbose
+
+    async def initialize(self) -> None:
+        if not self.verbose:
+            logging.getLogger("bot").setLevel(logging.WARNING)
+
+    async def shutdown(self) -> None:
+        with open(os.path.join(self.stats_dir, f"shard-{os.getpid()}.json"), "w") as f:
+            json.dump({"sent": len(self.sent)}, f)
+
+def read_shard_stats(stats_dir: str) -> list:
+    stats = []
+    for name in sorted(os.listdir(stats_dir)):
+        with open(os.path.join(stats_dir, name)) as f:
+            stats.append(json.load(f))
+    return stats
+
+# Random thresholds, rules and watched wallets over the addresses and mints in the replay data
+def seed_subscribers(bot, vybe: FakeVybe, args) -> tuple:
+    rng = random.Random(args.seed + 1)
+    addresses = list(vybe.by_address) or [random_address(rng)]
+    mints = list(vybe.tokens)
+    thresholds = {user_id: rng.choice((5000, 10000, 25000, 50000, 100000, 250000, 1000000)) for user_id in range(1, args.users + 1)}
+    bot.user_thresholds.update(thresholds)
+    bot.threshold_index.load(thresholds)
+    rules = []
+    for i in range(args.rules):
+        user_id = rng.randint(1, max(1, args.users))
+        kind = rng.random()
+        rules.append(bot.AlertRule(
+            f"r{i}",
+            user_id,
+            rng.choice(mints) if kind < 0.6 else None,
+            rng.choice(addresses) if 0.6 <= kind < 0.8 else None,
+            None,
+            rng.choice(addresses) if kind >= 0.8 else None,
+            rng.choice((5000, 20000, 100000)),
+            rng.choice((None, None, 500000)),
+        ))
+    bot.rule_engine.load(rules)
+    for _ in range(args.watches):
+        bot.watch_index.add(rng.randint(1, max(1, args.users)), rng.choice(addresses))
+    return thresholds, rules
+
+# Hands matching and sending to args.shards shard workers, the way ALERT_SHARDS does in main()
+async def start_shards(bot, thresholds: dict, rules: list, args) -> str:
+    if args.in_process_shards:
+        workers = [bot.ShardWorker(shard, args.shards, bot.alert_delivery) for shard in range(args.shards)]
+        for worker in workers:
+            worker.index.load({
+                user_id: threshold for user_id, threshold in thresholds.items()
+                if bot.shard_for(user_id, args.shards) == worker.shard
+            })
+            worker.rules.load([rule for rule in rules if bot.shard_for(rule.user_id, args.shards) == worker.shard])
+        bot.alert_broker = bot.LocalBroker(workers)
+        stats_dir = None
+    else:
+        # Worker processes load their slice of subscribers from the user store, like a restarted deployment
+        await asyncio.gather(
+            *(bot.user_store.save_threshold(user_id, threshold) for user_id, threshold in thresholds.items()),
+            *(bot.user_store.save_rule(rule) for rule in rules),
+        )
+        stats_dir = tempfile.mkdtemp(prefix="vybe-shards-")
+        bot.alert_broker = bot.ProcessBroker(
+            args.shards, bot_factory=functools.partial(ShardStatsBot, stats_dir, args.send_latency, args.verbose)
+        )
+    bot.alert_broker.start()
+    return stats_dir
+
+# The bot reads its settings at import time, so point it at the fake server and a scratch dir first
+def bot_environment(base_url: str, workdir: str, **overrides) -> dict:
+    env = {
+        "VYBE_API_BASE": base_url,
+        "VYBE_API_KEY": "replay",
+        "WATERMARK_FILE": os.path.join(workdir, "watermark.json"),
+        "USER_DB_FILE": os.path.join(workdir, "users.db"),
+        "TRANSFER_DB_FILE": os.path.join(workdir, "transfers.db"),
+        "TOKEN_REGISTRY_FILE": os.path.join(workdir, "tokens.snapshot"),
+        "METRICS_PORT": "0",
+    }
+    env.update((key, str(value)) for key, value in overrides.items())
+    return env
+
+# Cold `import bot` in fresh interpreters, so nothing is already cached in sys.modules
+def measure_cold_imports(runs: int, env: dict) -> list:
+    code = "import time; started = time.perf_counter(); import bot; print(time.perf_counter() - started)"
+    cwd = os.path.dirname(os.path.abspath(__file__))
+    return [
+        float(subprocess.run([sys.executable, "-c", code], cwd=cwd, env=env, capture_output=True, text=True, check=True).stdout)
+        for _ in range(runs)
+    ]
+
+def report_line(label: str, value: str) -> str:
+    return f"  {label:<28}{value}"
+
+async def replay(args) -> dict:
+    if args.input:
+        transfers = load_transfers(args.input)
+    else:
+        transfers = synthetic_transfers(args.synthetic, args.tokens, args.wallets, args.seed)
+    if not transfers:
+        raise SystemExit("No transfers to replay.")
+
+    vybe = FakeVybe(transfers, latency=args.api_latency, seed=args.seed)
+    await vybe.start()
+    os.environ.update(bot_environment(
+        vybe.base_url,
+        tempfile.mkdtemp(prefix="vybe-replay-"),
+        TELEGRAM_GLOBAL_RATE=args.send_rate,
+        TELEGRAM_CHAT_RATE=args.send_rate,
+        ALERT_QUEUE_SIZE=max(50000, args.users * 10),
+    ))
+    cold_imports = await asyncio.to_thread(measure_cold_imports, args.import_runs, dict(os.environ))
+    import_started = time.perf_counter()
+    bot = importlib.import_module("bot")
+    import_seconds = time.perf_counter() - import_started
+    if not args.verbose:
+        bot.logger.setLevel(logging.WARNING)
+
+    fake_bot = FakeBot(latency=args.send_latency)
+    context = types.SimpleNamespace(bot=fake_bot)
+    # The same startup path as the real bot: stores, registry snapshot, watermark, Vybe warm-up, delivery workers
+    application = types.SimpleNamespace(bot=fake_bot, bot_data={})
+    startup_started = time.perf_counter()
+    await bot.post_init(application)
+    startup_seconds = time.perf_counter() - startup_started
+    # No snapshot in the scratch dir, so load the registry the way the first refresh job would
+    await bot.token_registry.refresh()
+    thresholds, rules = seed_subscribers(bot, vybe, args)
+    stats_dir = await start_shards(bot, thresholds, rules, args) if args.shards else None
+    # Start just behind the first transfer, as if the watermark had been restored from a previous run
+    bot.watermark.block_time = vybe.block_times[0] - 1
+
+    rng = random.Random(args.seed + 2)
+    mints = list(vybe.tokens)
+    addresses = list(vybe.by_address)
+    ticks = []
+    if args.trace_memory:
+        tracemalloc.start()
+    started = time.perf_counter()
+    failed_ticks = 0
+    # Inject errors only once warm-up (token registry load) is done
+    vybe.error_rate = args.api_error_rate
+    # Keep ticking after the last release until the bot has paged through the backlog
+    new_transfers = None
+    while vybe.released < len(vybe.transfers) or new_transfers != 0:
+        vybe.release(args.tick_size)
+        tick_started = time.perf_counter()
+        new_transfers = await bot.broadcast_whales(context)
+        if new_transfers is None:
+            # The watermark didn't move, so the next tick reads the rest of the backlog again
+            failed_ticks += 1
+        if bot.watch_index:
+            await bot.poll_watched_wallets(context)
+        for _ in range(args.lookups):
+            await bot.process_token(0, bot.token_registry.symbol_for(rng.choice(mints)) or "SOL", context)
+            if addresses:
+                await bot.process_wallet(0, rng.choice(addresses), context)
+        drain_started = time.perf_counter()
+        await bot.alert_delivery.drain()
+        ticks.append((drain_started - tick_started, time.perf_counter() - drain_started))
+    shard_stats = []
+    if stats_dir is not None:
+        # Shard processes drain their delivery queues before exiting, so the run ends once they have all exited
+        await bot.alert_broker.close()
+        bot.alert_broker = None
+        shard_stats = read_shard_stats(stats_dir)
+    elapsed = time.perf_counter() - started
+    peak_memory = None
+    if args.trace_memory:
+        _, peak_memory = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    await bot.post_shutdown(application)
+    await vybe.stop()
+
+    snapshot = bot.metrics.snapshot()
+    # Counted by the bot, so transfers a failed tick alerted and stored before the error are included
+    ingested = int(snapshot.get("transfers_ingested_total", 0))
+    stages = {}
+    for stage in ("parse", "match", "format", "send"):
+        stages[stage] = snapshot.get(f'stage_seconds{{stage="{stage}"}}', {"count": 0, "mean": 0.0, "p50": 0.0, "p99": 0.0})
+    fetches = [value for key, value in snapshot.items() if key.startswith("vybe_fetch_seconds")]
+    fetch_count = sum(value["count"] for value in fetches)
+    stages["fetch"] = {
+        "count": fetch_count,
+        "mean": sum(value["mean"] * value["count"] for value in fetches) / fetch_count if fetch_count else 0.0,
+        "p50": max((value["p50"] for value in fetches), default=0.0),
+        "p99": max((value["p99"] for value in fetches), default=0.0),
+    }
+    tick_seconds = sorted(tick for tick, _ in ticks)
+    delivery = bot.alert_delivery.metrics()
+    alerts = len(fake_bot.sent) + sum(stats["sent"] for stats in shard_stats)
+    return {
+        "transfers": len(transfers),
+        "ingested": ingested,
+        "ticks": len(ticks),
+        "failed_ticks": failed_ticks,
+        "shards": args.shards,
+        "alerts": alerts,
+        "dropped": delivery["dropped"],
+        "api_requests": vybe.requests,
+        "elapsed": elapsed,
+        "transfers_per_sec": ingested / elapsed if elapsed else 0.0,
+        "alerts_per_sec": alerts / elapsed if elapsed else 0.0,
+        "peak_traced_mb": peak_memory / 1e6 if peak_memory is not None else None,
+        "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "import_seconds": import_seconds,
+        "cold_import_min": min(cold_imports, default=None),
+        "cold_import_median": statistics.median(cold_imports) if cold_imports else None,
+        "startup_seconds": startup_seconds,
+        "first_alert_seconds": fake_bot.first_sent_at - import_started if fake_bot.first_sent_at is not None else None,
+        "tick_p50": tick_seconds[len(tick_seconds) // 2],
+        "tick_max": tick_seconds[-1],
+        "drain_total": sum(drain for _, drain in ticks),
+        "stages": stages,
+    }
+
+def print_report(result: dict) -> None:
+    print("Replay results")
+    print(report_line(
+        "transfers ingested",
+        f"{result['ingested']} of {result['transfers']} in {result['ticks']} ticks ({result['failed_ticks']} failed)",
+    ))
+    dropped = f"{result['dropped']} dropped" + (" outside the shard processes" if result["shards"] else "")
+    print(report_line("messages sent", f"{result['alerts']} ({dropped})"))
+    print(report_line("fake Vybe requests", str(result["api_requests"])))
+    print(report_line("wall time", f"{result['elapsed']:.2f}s (bot import {result['import_seconds'] * 1000:.0f}ms)"))
+    if result["cold_import_min"] is not None:
+        print(report_line(
+            "cold import",
+            f"min {result['cold_import_min'] * 1000:.0f}ms, median {result['cold_import_median'] * 1000:.0f}ms",
+        ))
+    first_alert = result["first_alert_seconds"]
+    print(report_line(
+        "cold start",
+        f"post_init {result['startup_seconds'] * 1000:.0f}ms, first alert "
+        + (f"{first_alert * 1000:.0f}ms after import" if first_alert is not None else "never sent"),
+    ))
+    if result["shards"]:
+        print(report_line("alert shards", str(result["shards"])))
+    print(report_line("throughput", f"{result['transfers_per_sec']:.0f} transfers/s, {result['alerts_per_sec']:.0f} alerts/s"))
+    memory = f"{result['max_rss_mb']:.0f} MB max RSS"
+    if result["peak_traced_mb"] is not None:
+        memory += f", {result['peak_traced_mb']:.1f} MB traced Python heap"
+    print(report_line("memory high-water", memory))
+    print(report_line("tick latency", f"p50 {result['tick_p50'] * 1000:.1f}ms, max {result['tick_max'] * 1000:.1f}ms"))
+    print(report_line("delivery drain", f"{result['drain_total']:.2f}s total"))
+    print("Per-stage latency (mean / p50 bucket / p99 bucket)")
+    for stage, stats in result["stages"].items():
+        print(report_line(
+            f"{stage} x{stats['count']}",
+            f"{stats['mean'] * 1000:.3f}ms / {stats['p50'] * 1000:g}ms / {stats['p99'] * 1000:g}ms",
+        ))
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Replay transfers through the whale alert pipeline without network access.")
+    parser.add_argument("input", nargs="?", help="JSONL file with one Vybe transfer per line (default: synthetic data)")
+    parser.add_argument("--synthetic", type=int, default=5000, help="number of synthetic transfers when no input is given")
+    parser.add_argument("--tokens", type=int, default=50, help="distinct mints in synthetic data")
+    parser.add_argument("--wallets", type=int, default=5000, help="distinct wallets in synthetic data")
+    parser.add_argument("--users", type=int, default=200, help="subscribers with a random threshold")
+    parser.add_argument("--rules", type=int, default=500, help="random custom alert rules")
+    parser.add_argument("--watches", type=int, default=200, help="random watched wallets")
+    parser.add_argument("--tick-size", type=int, default=200, help="transfers released to the fake API per whale check")
+    parser.add_argument("--lookups", type=int, default=2, help="/token and /wallet lookups per tick")
+    parser.add_argument("--api-latency", type=float, default=0.0, help="seconds added to every fake Vybe response")
+    parser.add_argument("--api-error-rate", type=float, default=0.0, help="fraction of fake Vybe responses that are 503s")
+    parser.add_argument("--send-latency", type=float, default=0.0, help="seconds added to every fake Telegram send")
+    parser.add_argument("--send-rate", type=float, default=1e6, help="Telegram rate limit applied by the delivery queue")
+    parser.add_argument("--shards", type=int, default=0, help="match and send in this many shard worker processes (ALERT_SHARDS)")
+    parser.add_argument("--in-process-shards", action="store_true", help="run the --shards workers in this process (LocalBroker)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--import-runs", type=int, default=3, help="fresh interpreters timed importing the bot (0 to skip)")
+    parser.add_argument("--trace-memory", action="store_true", help="also report the tracemalloc peak (slows the replay down)")
+    parser.add_argument("--verbose", action="store_true", help="keep the bot's INFO logs")
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    parser.add_argument("--min-transfers-per-sec", type=float, default=0.0, help="exit non-zero below this throughput")
+    parser.add_argument("--max-import-ms", type=float, default=0.0, help="exit non-zero if the median cold import is slower")
+    return parser.parse_args(argv)
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    result = asyncio.run(replay(args))
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        print_report(result)
+    if result["transfers_per_sec"] < args.min_transfers_per_sec:
+        print(f"Throughput {result['transfers_per_sec']:.0f} transfers/s is below {args.min_transfers_per_sec:.0f}", file=sys.stderr)
+        return 1
+    cold_import = result["cold_import_median"]
+    if args.max_import_ms and cold_import is not None and cold_import * 1000 > args.max_import_ms:
+        print(f"Cold import {cold_import * 1000:.0f}ms is above {args.max_import_ms:.0f}ms", file=sys.stderr)
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
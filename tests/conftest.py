@@ -0,0 +1,69 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from replay import FakeVybe, bot_environment  # noqa: E402
+
+# The bot reads its settings at import time, so keep every file it could write in a scratch dir
+os.environ.update(bot_environment("http://127.0.0.1:9", tempfile.mkdtemp(prefix="vybe-tests-")))
+
+import bot as bot_module  # noqa: E402
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+# Stand-in for AlertDelivery that records what would have been sent
+class RecordingDelivery:
+    def __init__(self):
+        self.sent = []
+
+    def enqueue(self, chat_id: int, text: str, reply_markup=None) -> bool:
+        self.sent.append((chat_id, text))
+        return True
+
+# The bot module with fresh subscriber, dedup, watermark, history and Vybe client state for each test
+@pytest.fixture
+def bot(monkeypatch, tmp_path):
+    monkeypatch.setattr(bot_module, "user_thresholds", {})
+    monkeypatch.setattr(bot_module, "threshold_index", bot_module.ThresholdIndex())
+    monkeypatch.setattr(bot_module, "rule_engine", bot_module.RuleEngine())
+    monkeypatch.setattr(bot_module, "watch_index", bot_module.WatchIndex())
+    monkeypatch.setattr(bot_module, "digest_buffer", bot_module.DigestBuffer())
+    monkeypatch.setattr(bot_module, "seen_transfers", bot_module.SeenTransfers())
+    monkeypatch.setattr(bot_module, "watermark", bot_module.Watermark(str(tmp_path / "watermark.json")))
+    monkeypatch.setattr(bot_module, "transfer_store", bot_module.TransferStore(str(tmp_path / "transfers.db")))
+    monkeypatch.setattr(bot_module, "whale_analytics", bot_module.WhaleAnalytics(
+        bot_module.ANALYTICS_WINDOWS, bot_module.ANALYTICS_BUCKET_SECONDS, bot_module.ANALYTICS_TOP_N,
+    ))
+    monkeypatch.setattr(bot_module, "alert_delivery", RecordingDelivery())
+    monkeypatch.setattr(bot_module, "vybe_client", bot_module.VybeClient("test"))
+    monkeypatch.setattr(bot_module, "token_stats_cache", bot_module.AsyncTTLCache(bot_module.fetch_token_stats))
+    return bot_module
+
+# Starts a local fake Vybe API (replay.FakeVybe) serving the given transfers and points the bot at it.
+# Transfers are only served once released, e.g. vybe.release(100) before a tick.
+@pytest.fixture
+async def fake_vybe(bot, monkeypatch):
+    servers = []
+
+    async def serve(transfers=(), **kwargs) -> FakeVybe:
+        vybe = FakeVybe(list(transfers), **kwargs)
+        await vybe.start()
+        servers.append(vybe)
+        monkeypatch.setattr(bot, "VYBE_API_BASE", vybe.base_url)
+        monkeypatch.setattr(bot, "VYBE_TRANSACTIONS_URL", f"{vybe.base_url}/token/transfers")
+        monkeypatch.setattr(bot, "VYBE_WALLET_URL", f"{vybe.base_url}/token/transfers")
+        monkeypatch.setattr(bot, "VYBE_TOKEN_URL", f"{vybe.base_url}/token")
+        monkeypatch.setattr(bot, "VYBE_TOKENS_URL", f"{vybe.base_url}/tokens")
+        return vybe
+
+    yield serve
+    await bot.vybe_client.close()
+    for vybe in servers:
+        await vybe.stop()
@@ -0,0 +1,154 @@
+import asyncio
+import time
+
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+OPEN_SECONDS = 0.2
+ENDPOINT = "/token/transfers"
+
+# A client with a small breaker: opens once half of at least 4 requests failed, probes after OPEN_SECONDS
+@pytest.fixture
+async def client(bot):
+    client = bot.VybeClient("test", breaker=bot.CircuitBreaker(
+        window=60, min_requests=4, failure_ratio=0.5, open_seconds=OPEN_SECONDS,
+    ))
+    yield client
+    await client.close()
+
+async def get(bot, client, stale_ok=False, **params):
+    return await client.get(bot.VYBE_TRANSACTIONS_URL, params=params or {"limit": 1}, stale_ok=stale_ok)
+
+async def open_circuit(bot, client, vybe):
+    vybe.down = True
+    while client.breaker.state(ENDPOINT) == "closed":
+        await get(bot, client)
+
+async def test_opens_at_the_failure_ratio(bot, fake_vybe, client):
+    vybe = await fake_vybe()
+    for _ in range(2):
+        assert (await get(bot, client)).status_code == 200
+    vybe.down = True
+    assert (await get(bot, client)).status_code == 503
+    # 1 of 3 failed, and fewer than min_requests anyway
+    assert client.breaker.state(ENDPOINT) == "closed"
+    assert (await get(bot, client)).status_code == 503
+    assert client.breaker.state(ENDPOINT) == "open"
+
+    requests = vybe.requests
+    with pytest.raises(bot.CircuitOpenError):
+        await get(bot, client)
+    assert vybe.requests == requests
+
+async def test_random_errors_below_the_ratio_keep_it_closed(bot, fake_vybe, client):
+    vybe = await fake_vybe(error_rate=0.2, seed=3)
+    statuses = [(await get(bot, client)).status_code for _ in range(40)]
+    assert 503 in statuses
+    assert client.breaker.state(ENDPOINT) == "closed"
+    assert vybe.requests == 40
+
+async def test_open_circuit_answers_stale_immediately(bot, fake_vybe, client):
+    vybe = await fake_vybe()
+    fresh = await get(bot, client, stale_ok=True)
+    assert bot.stale_since(fresh) is None
+    await open_circuit(bot, client, vybe)
+
+    # A slow, failing API no longer costs the handler anything: the cached answer comes back without a request
+    vybe.latency = 1.0
+    requests = vybe.requests
+    started = time.perf_counter()
+    stale = await get(bot, client, stale_ok=True)
+    assert time.perf_counter() - started < 0.1
+    assert vybe.requests == requests
+    assert stale.json() == fresh.json()
+    assert bot.stale_since(stale) is not None
+
+async def test_failed_probe_reopens_the_circuit(bot, fake_vybe, client):
+    vybe = await fake_vybe()
+    await open_circuit(bot, client, vybe)
+    await asyncio.sleep(OPEN_SECONDS * 1.5)
+    assert client.breaker.state(ENDPOINT) == "half_open"
+
+    requests = vybe.requests
+    assert (await get(bot, client)).status_code == 503
+    assert vybe.requests == requests + 1
+    # The probe failed, so the open period starts over
+    assert client.breaker.state(ENDPOINT) == "open"
+    with pytest.raises(bot.CircuitOpenError):
+        await get(bot, client)
+
+async def test_good_probe_closes_the_circuit(bot, fake_vybe, client):
+    vybe = await fake_vybe()
+    await open_circuit(bot, client, vybe)
+    vybe.down = False
+    await asyncio.sleep(OPEN_SECONDS * 1.5)
+
+    assert (await get(bot, client)).status_code == 200
+    assert client.breaker.state(ENDPOINT) == "closed"
+    assert (await get(bot, client)).status_code == 200
+
+async def test_open_circuit_without_a_cached_answer_raises(bot, fake_vybe, client):
+    vybe = await fake_vybe(error_rate=1.0)
+    await get(bot, client, stale_ok=True, limit=1)
+    while client.breaker.state(ENDPOINT) == "closed":
+        await get(bot, client)
+
+    # Nothing was ever cached for these params (every response failed), so there is nothing stale to fall back on
+    with pytest.raises(bot.CircuitOpenError):
+        await get(bot, client, stale_ok=True, limit=1)
+    with pytest.raises(bot.CircuitOpenError):
+        await get(bot, client, stale_ok=True, limit=2)
+
+async def test_probe_cancelled_while_queued_frees_the_slot(bot, fake_vybe):
+    client = bot.VybeClient("test", max_concurrency=1, breaker=bot.CircuitBreaker(
+        window=60, min_requests=4, failure_ratio=0.5, open_seconds=OPEN_SECONDS,
+    ))
+    vybe = await fake_vybe()
+    await open_circuit(bot, client, vybe)
+    vybe.down = False
+    await asyncio.sleep(OPEN_SECONDS * 1.5)
+
+    # The probe is let through by the breaker but cancelled before it gets a connection slot
+    async with client._semaphore:
+        probe = asyncio.create_task(get(bot, client))
+        await asyncio.sleep(0.01)
+        probe.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await probe
+    assert (await get(bot, client)).status_code == 200
+    assert client.breaker.state(ENDPOINT) == "closed"
+    await client.close()
+
+async def test_probe_failing_outside_httpx_frees_the_slot(bot, fake_vybe, client, monkeypatch):
+    vybe = await fake_vybe()
+    await open_circuit(bot, client, vybe)
+    await asyncio.sleep(OPEN_SECONDS * 1.5)
+
+    class Broken:
+        async def get(self, url, params=None):
+            raise RuntimeError("boom")
+
+    monkeypatch.setattr(client, "_get_client", Broken)
+    with pytest.raises(RuntimeError):
+        await get(bot, client)
+    assert client.breaker.allow(ENDPOINT) is not None
+
+async def test_results_from_before_the_probe_do_not_decide_it(bot):
+    breaker = bot.CircuitBreaker(window=60, min_requests=2, failure_ratio=0.5, open_seconds=OPEN_SECONDS)
+    # Slow requests let through while the circuit was still closed
+    slow = [breaker.allow(ENDPOINT) for _ in range(2)]
+    for _ in range(2):
+        breaker.record(ENDPOINT, breaker.allow(ENDPOINT), failed=True)
+    assert breaker.state(ENDPOINT) == "open"
+    await asyncio.sleep(OPEN_SECONDS * 1.5)
+    probe = breaker.allow(ENDPOINT)
+    assert probe is not None
+
+    breaker.record(ENDPOINT, slow[0], failed=False)
+    assert breaker.state(ENDPOINT) == "half_open"
+    breaker.record(ENDPOINT, slow[1], failed=True)
+    assert breaker.state(ENDPOINT) == "half_open"
+    assert breaker.allow(ENDPOINT) is None
+    breaker.record(ENDPOINT, probe, failed=False)
+    assert breaker.state(ENDPOINT) == "closed"
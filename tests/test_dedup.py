@@ -0,0 +1,84 @@
+import types
+
+import pytest
+
+from replay import synthetic_transfers
+
+CONTEXT = types.SimpleNamespace()
+
+def test_seen_transfers_evicts_oldest_past_max_size(bot):
+    seen = bot.SeenTransfers(max_size=3, ttl=3600)
+    for key in "abcd":
+        assert seen.add(key)
+    assert len(seen) == 3
+    # "a" was evicted, so it counts as new again; "d" is still remembered
+    assert seen.add("a")
+    assert not seen.add("d")
+
+def test_seen_transfers_expires_after_ttl(bot, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(bot.time, "monotonic", lambda: now[0])
+    seen = bot.SeenTransfers(max_size=100, ttl=60)
+    assert seen.add("a")
+    now[0] += 30
+    assert not seen.add("a")
+    # Seeing a key again refreshes it, so the TTL counts from the last sighting
+    now[0] += 59
+    assert not seen.add("a")
+    now[0] += 61
+    assert seen.add("a")
+
+def test_watermark_tracks_every_key_at_the_newest_block_time(bot, tmp_path):
+    watermark = bot.Watermark(str(tmp_path / "watermark.json"))
+    older = {"signature": "s1", "block_time": 100}
+    first = {"signature": "s2", "block_time": 200}
+    second = {"signature": "s3", "block_time": 200}
+    for tx in (older, first, second, first):
+        watermark.advance(tx)
+    assert watermark.block_time == 200
+    assert watermark.keys == ["s2", "s3"]
+    assert watermark.is_behind(older)
+    # Transfers sharing the watermark's block time aren't behind it; the seen keys dedupe them instead
+    assert not watermark.is_behind({"signature": "s4", "block_time": 200})
+
+    watermark.save()
+    restored = bot.Watermark(str(tmp_path / "watermark.json"))
+    restored.load()
+    assert (restored.block_time, restored.keys) == (200, ["s2", "s3"])
+
+@pytest.mark.anyio
+async def test_overlapping_ticks_alert_once(bot, fake_vybe, monkeypatch):
+    monkeypatch.setattr(bot, "VYBE_PAGE_LIMIT", 10)
+    bot.threshold_index.set(1, 5000)
+    transfers = synthetic_transfers(40, 5, 50, seed=7)
+    vybe = await fake_vybe(transfers)
+
+    # Every tick's window starts at the last one's newest block time, so consecutive windows overlap
+    vybe.release(15)
+    assert await bot.broadcast_whales(CONTEXT) == 10
+    assert await bot.broadcast_whales(CONTEXT) == 0
+    vybe.release(40)
+    # A window rewound to the start overlaps the ten transfers already alerted
+    bot.watermark.block_time = transfers[0]["block_time"]
+    assert await bot.broadcast_whales(CONTEXT) == 30
+    assert await bot.broadcast_whales(CONTEXT) == 0
+    assert len(bot.alert_delivery.sent) == 40
+
+@pytest.mark.anyio
+async def test_restart_resumes_from_the_saved_watermark(bot, fake_vybe, monkeypatch, tmp_path):
+    monkeypatch.setattr(bot, "VYBE_PAGE_LIMIT", 10)
+    bot.threshold_index.set(1, 5000)
+    transfers = synthetic_transfers(30, 5, 50, seed=8)
+    vybe = await fake_vybe(transfers)
+    vybe.release(30)
+    bot.watermark.block_time = transfers[0]["block_time"] - 1
+    assert await bot.broadcast_whales(CONTEXT) == 30
+
+    # A restart loses the in-memory seen cache but restores the watermark and its keys from disk
+    monkeypatch.setattr(bot, "seen_transfers", bot.SeenTransfers())
+    monkeypatch.setattr(bot, "watermark", bot.Watermark(str(tmp_path / "watermark.json")))
+    bot.watermark.load()
+    for key in bot.watermark.keys:
+        bot.seen_transfers.add(key)
+    assert await bot.broadcast_whales(CONTEXT) == 0
+    assert len(bot.alert_delivery.sent) == 30
@@ -0,0 +1,34 @@
+import types
+
+import pytest
+
+from replay import FakeBot
+
+pytestmark = pytest.mark.anyio
+
+USER = 42
+
+def transfer(i: int, amount_usd: float) -> dict:
+    return {"signature": f"s{i}", "block_time": 1000 + i, "amount_usd": amount_usd,
+            "sender_address": "5oNDL3swdJJF1g9DzJiZ4ynHXgszjAEpUkxVYejchzrY",
+            "receiver_address": "9xQeWvG816bUx9EPjHmaT23yvVM2ZWbrrpZb9PusVFin"}
+
+async def manual_check(bot, fake_vybe, digest: bool) -> list:
+    vybe = await fake_vybe([transfer(i, 10000.0 * (i + 1)) for i in range(6)])
+    vybe.release(6)
+    bot.user_thresholds[USER] = 30000
+    if digest:
+        bot.digest_buffer.set_window(USER, 0)
+    context = types.SimpleNamespace(bot=FakeBot())
+    await bot.check_whales(context, user_id=USER)
+    return context.bot.sent
+
+async def test_manual_check_sends_one_message_per_whale(bot, fake_vybe):
+    sent = await manual_check(bot, fake_vybe, digest=False)
+    assert len(sent) == 4
+    assert all(text.startswith("🚨 Whale Alert!") for _, text in sent)
+
+async def test_manual_check_in_digest_mode_sends_one_digest(bot, fake_vybe):
+    sent = await manual_check(bot, fake_vybe, digest=True)
+    assert len(sent) == 1
+    assert sent[0][1].startswith("🚨 Whale Digest! 🐋 4 whale transactions")
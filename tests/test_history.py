@@ -0,0 +1,72 @@
+import sqlite3
+import types
+
+import pytest
+
+from replay import synthetic_transfers
+
+pytestmark = pytest.mark.anyio
+
+CONTEXT = types.SimpleNamespace()
+
+def stored_rows(path) -> int:
+    with sqlite3.connect(path) as conn:
+        return conn.execute("SELECT COUNT(*) FROM transfers").fetchone()[0]
+
+async def test_a_tick_that_fails_mid_stream_stores_what_it_alerted(bot, fake_vybe, monkeypatch, tmp_path):
+    monkeypatch.setattr(bot, "VYBE_PAGE_LIMIT", 10)
+    bot.threshold_index.set(1, 5000)
+    await bot.transfer_store.open()
+    transfers = synthetic_transfers(30, 5, 50, seed=11)
+    vybe = await fake_vybe(transfers)
+    vybe.release(30)
+    bot.watermark.block_time = transfers[0]["block_time"] - 1
+
+    # Serve two pages, then fail every request from the third page on
+    route = vybe._route
+
+    def failing_after_two_pages(path, query):
+        if vybe.requests >= 2:
+            vybe.down = True
+        return route(path, query)
+
+    monkeypatch.setattr(vybe, "_route", failing_after_two_pages)
+    assert await bot.broadcast_whales(CONTEXT) is None
+    assert len(bot.alert_delivery.sent) == 20
+    assert "whale" not in bot.transfer_store.coverage
+
+    vybe.down = False
+    monkeypatch.setattr(vybe, "_route", route)
+    assert await bot.broadcast_whales(CONTEXT) == 10
+    assert len(bot.alert_delivery.sent) == 30
+    await bot.transfer_store.close()
+    # Coverage now spans the failed tick too, and every transfer it alerted on is in the store
+    assert stored_rows(tmp_path / "transfers.db") == 30
+    assert bot.transfer_store.coverage["whale"][0][0] == transfers[0]["block_time"] - 1
+
+async def test_compaction_returns_freed_pages(bot, tmp_path):
+    store = bot.TransferStore(str(tmp_path / "history.db"))
+    await store.open()
+    transfers = synthetic_transfers(3000, 5, 500, seed=12)
+    await store.record(transfers)
+    pages = store._reader.execute("PRAGMA page_count").fetchone()[0]
+
+    assert await store.compact(transfers[-1]["block_time"] + 1)
+    assert store._reader.execute("PRAGMA freelist_count").fetchone()[0] == 0
+    assert store._reader.execute("PRAGMA page_count").fetchone()[0] < pages / 2
+    await store.close()
+
+async def test_history_files_without_auto_vacuum_are_converted(bot, tmp_path):
+    path = tmp_path / "old.db"
+    with sqlite3.connect(path) as conn:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("CREATE TABLE transfers (signature TEXT PRIMARY KEY, block_time INTEGER NOT NULL, "
+                     "mint TEXT, sender TEXT, receiver TEXT, amount_usd REAL NOT NULL, symbol TEXT)")
+    conn.close()
+
+    store = bot.TransferStore(str(path))
+    await store.open()
+    await store.close()
+    with sqlite3.connect(path) as conn:
+        assert conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2
+    conn.close()
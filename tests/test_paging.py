@@ -0,0 +1,90 @@
+import types
+
+import pytest
+
+from replay import synthetic_transfers
+
+pytestmark = pytest.mark.anyio
+
+CONTEXT = types.SimpleNamespace()
+
+@pytest.fixture
+def subscribed(bot, monkeypatch):
+    # One subscriber at the floor, so every synthetic transfer (>= ~$5k) alerts exactly once
+    bot.threshold_index.set(1, 5000)
+    monkeypatch.setattr(bot, "VYBE_PAGE_LIMIT", 10)
+    return bot
+
+def alerted(bot) -> int:
+    return len(bot.alert_delivery.sent)
+
+async def test_pages_until_a_short_page(subscribed, fake_vybe):
+    bot = subscribed
+    transfers = synthetic_transfers(25, 5, 50, seed=1)
+    vybe = await fake_vybe(transfers)
+    vybe.release(25)
+    bot.watermark.block_time = transfers[0]["block_time"] - 1
+
+    assert await bot.broadcast_whales(CONTEXT) == 25
+    assert vybe.requests == 3
+    assert alerted(bot) == 25
+    assert bot.watermark.block_time == transfers[-1]["block_time"]
+    assert bot.transfer_store.coverage["whale"][0][0] == transfers[0]["block_time"] - 1
+
+async def test_page_cap_resumes_on_the_next_tick(subscribed, fake_vybe, monkeypatch):
+    bot = subscribed
+    monkeypatch.setattr(bot, "VYBE_MAX_PAGES", 2)
+    transfers = synthetic_transfers(50, 5, 50, seed=2)
+    vybe = await fake_vybe(transfers)
+    vybe.release(50)
+    bot.watermark.block_time = transfers[0]["block_time"] - 1
+
+    # The first capped tick reads the oldest 20 and claims no history coverage
+    assert await bot.broadcast_whales(CONTEXT) == 20
+    assert "whale" not in bot.transfer_store.coverage
+    assert bot.watermark.block_time == transfers[19]["block_time"]
+
+    ingested = 20
+    for _ in range(5):
+        ingested += await bot.broadcast_whales(CONTEXT)
+    assert ingested == 50
+    assert alerted(bot) == 50
+    assert "whale" in bot.transfer_store.coverage
+
+async def test_transfers_behind_the_watermark_are_skipped(subscribed, fake_vybe):
+    bot = subscribed
+    transfers = synthetic_transfers(30, 5, 50, seed=3)
+    vybe = await fake_vybe(transfers)
+    vybe.release(30)
+    # Restored watermark in the middle of the stream, with the transfers at its block time already alerted
+    restored = transfers[14]
+    bot.watermark.block_time = restored["block_time"]
+    bot.watermark.keys = [bot.transfer_key(tx) for tx in transfers if tx["block_time"] == restored["block_time"]]
+    for key in bot.watermark.keys:
+        bot.seen_transfers.add(key)
+
+    newer = [tx for tx in transfers if tx["block_time"] > restored["block_time"]]
+    assert await bot.broadcast_whales(CONTEXT) == len(newer)
+    assert alerted(bot) == len(newer)
+
+async def test_first_run_reads_only_the_newest_page(subscribed, fake_vybe):
+    bot = subscribed
+    transfers = synthetic_transfers(40, 5, 50, seed=4)
+    vybe = await fake_vybe(transfers)
+    vybe.release(40)
+
+    assert await bot.broadcast_whales(CONTEXT) == 10
+    assert vybe.requests == 1
+    assert bot.watermark.block_time == transfers[-1]["block_time"]
+
+async def test_min_amount_follows_the_lowest_threshold(bot, fake_vybe, monkeypatch):
+    monkeypatch.setattr(bot, "VYBE_PAGE_LIMIT", 10)
+    bot.threshold_index.set(1, 100000)
+    bot.threshold_index.set(2, 250000)
+    transfers = synthetic_transfers(60, 5, 50, seed=5)
+    vybe = await fake_vybe(transfers)
+    vybe.release(60)
+    bot.watermark.block_time = transfers[0]["block_time"] - 1
+
+    wanted = [tx for tx in transfers if tx["amount_usd"] >= 100000]
+    assert await bot.broadcast_whales(CONTEXT) == len(wanted)
@@ -0,0 +1,28 @@
+import pytest
+
+SENDER = "5oNDL3swdJJF1g9DzJiZ4ynHXgszjAEpUkxVYejchzrY"
+RECEIVER = "9xQeWvG816bUx9EPjHmaT23yvVM2ZWbrrpZb9PusVFin"
+
+@pytest.mark.parametrize("args", [
+    [f"wallet={SENDER}", f"from={RECEIVER}"],
+    [f"wallet={SENDER}", f"to={RECEIVER}"],
+    [f"wallet={SENDER}", "dir=in", f"to={RECEIVER}"],
+])
+def test_wallet_cannot_be_combined_with_from_or_to(bot, args):
+    with pytest.raises(ValueError, match="not both"):
+        bot.parse_rule(1, args)
+
+def test_wallet_direction_becomes_a_sender_or_receiver_rule(bot):
+    inbound = bot.parse_rule(1, [f"wallet={SENDER}", "dir=in", "min=10000"])
+    assert (inbound.sender, inbound.receiver, inbound.wallet) == (None, SENDER, None)
+    outbound = bot.parse_rule(1, [f"wallet={SENDER}", "dir=out"])
+    assert (outbound.sender, outbound.receiver, outbound.wallet) == (SENDER, None, None)
+
+def test_every_filter_of_a_parsed_rule_is_enforced(bot):
+    rule = bot.parse_rule(1, [f"from={SENDER}", f"to={RECEIVER}", "min=10000"])
+    bot.rule_engine.add(rule)
+    transfer = {"signature": "s1", "amount_usd": 20000.0, "sender_address": SENDER, "receiver_address": RECEIVER}
+    assert bot.rule_engine.match(transfer) == {1}
+    # Same sender, someone else receiving: the pair rule must not fire
+    assert bot.rule_engine.match({**transfer, "receiver_address": SENDER}) == set()
+    assert bot.rule_engine.match({**transfer, "amount_usd": 5000.0}) == set()
@@ -0,0 +1,105 @@
+import types
+
+import pytest
+
+from replay import BASE58
+
+pytestmark = pytest.mark.anyio
+
+WALLET = "5oNDL3swdJJF1g9DzJiZ4ynHXgszjAEpUkxVYejchzrY"
+COUNTERPARTY = "9xQeWvG816bUx9EPjHmaT23yvVM2ZWbrrpZb9PusVFin"
+CONTEXT = types.SimpleNamespace()
+
+def address(i: int) -> str:
+    return BASE58[i % 58] * 44
+
+def transfer(signature: str, block_time: int, amount_usd: float = 100.0, sender: str = WALLET,
+             receiver: str = COUNTERPARTY) -> dict:
+    return {"signature": signature, "block_time": block_time, "amount_usd": amount_usd,
+            "sender_address": sender, "receiver_address": receiver}
+
+async def test_busy_wallet_is_polled_oldest_first_from_its_cursor(bot, fake_vybe, monkeypatch):
+    monkeypatch.setattr(bot, "WATCH_FETCH_LIMIT", 25)
+    vybe = await fake_vybe([transfer(f"s{i}", 1000 + i) for i in range(60)])
+    vybe.release(60)
+    bot.watch_index.add(1, WALLET)
+    bot.watch_index.cursors[WALLET] = 999
+
+    # Each poll re-reads the transfer at its cursor (time_start is inclusive), which the cursor keys skip
+    alerts = [await bot.poll_wallet(WALLET) for _ in range(4)]
+    assert alerts == [25, 24, 11, 0]
+    assert bot.watch_index.cursors[WALLET] == 1059
+    assert bot.watch_index.cursor_keys[WALLET] == {"s59"}
+    assert len(bot.alert_delivery.sent) == 60
+    # Only the poll that reached a short page claims the wallet's history is complete
+    assert bot.transfer_store.coverage[f"wallet:{WALLET}"][0][0] == 1048
+
+async def test_idle_wallets_never_realert_their_last_transfer(bot, fake_vybe, monkeypatch, tmp_path):
+    # More watched wallets than the sweep reaches per tick, each with one old transfer and nothing new
+    monkeypatch.setattr(bot, "WATCH_BATCH_SIZE", 2)
+    monkeypatch.setattr(bot, "user_store", bot.UserStore(str(tmp_path / "users.db")))
+    await bot.user_store.open()
+    wallets = [address(i) for i in range(5)]
+    vybe = await fake_vybe([transfer(f"s{i}", 1000 + i, sender=wallet) for i, wallet in enumerate(wallets)])
+    vybe.release(5)
+    for wallet in wallets:
+        bot.watch_index.add(1, wallet)
+
+    for _ in range(3 * len(wallets)):
+        await bot.poll_watched_wallets(CONTEXT)
+    assert bot.alert_delivery.sent == []
+
+    # The keys at each cursor survive a restart along with the cursor
+    await bot.user_store.close()
+    stored = await bot.user_store.open()
+    restored = bot.WatchIndex()
+    restored.load([(1, wallet) for wallet in wallets], stored["cursors"], stored["cursor_keys"])
+    monkeypatch.setattr(bot, "watch_index", restored)
+    for _ in range(len(wallets)):
+        await bot.poll_watched_wallets(CONTEXT)
+    assert bot.alert_delivery.sent == []
+    await bot.user_store.close()
+
+async def test_a_full_page_at_the_cursor_pages_on(bot, fake_vybe, monkeypatch):
+    monkeypatch.setattr(bot, "WATCH_FETCH_LIMIT", 10)
+    transfers = [transfer(f"s{i:02}", 1000) for i in range(25)] + [transfer("s25", 1001)]
+    vybe = await fake_vybe(transfers)
+    vybe.release(len(transfers))
+    bot.watch_index.add(1, WALLET)
+    # The last poll read the first ten transfers at block time 1000
+    bot.watch_index.set_cursor(WALLET, 1000, {tx["signature"] for tx in transfers[:10]})
+
+    assert await bot.poll_wallet(WALLET) == 16
+    assert vybe.requests == 3
+    assert bot.watch_index.cursors[WALLET] == 1001
+    assert await bot.poll_wallet(WALLET) == 0
+
+async def test_requests_per_tick_stay_flat_as_watches_grow(bot, fake_vybe, monkeypatch):
+    monkeypatch.setattr(bot, "WATCH_BATCH_SIZE", 20)
+    hot = address(7)
+    wallets = [hot] + [f"{i:044d}" for i in range(999)]
+    vybe = await fake_vybe([
+        transfer("whale", 2000, amount_usd=250000.0, sender=COUNTERPARTY, receiver=hot),
+        transfer("small", 2001, amount_usd=100.0, sender=hot, receiver=address(8)),
+    ])
+    for user_id in range(1, 6):
+        bot.watch_index.add(user_id, hot)
+    for user_id, wallet in enumerate(wallets[1:], start=6):
+        bot.watch_index.add(user_id, wallet)
+    for wallet in wallets:
+        bot.watch_index.set_cursor(wallet, 1999, set())
+    bot.watermark.block_time = 1999
+
+    # One whale-stream request alerts every watcher of the whale's wallets, however many wallets are watched
+    vybe.release(2)
+    assert await bot.broadcast_whales(CONTEXT) == 1
+    assert vybe.requests == 1
+    assert len(bot.alert_delivery.sent) == 5
+
+    # The sweep costs WATCH_BATCH_SIZE requests per tick and only alerts what the stream left out
+    for _ in range(len(wallets) // 20):
+        requests = vybe.requests
+        await bot.poll_watched_wallets(CONTEXT)
+        assert vybe.requests - requests == 20
+    assert len(bot.alert_delivery.sent) == 10
+    assert all("sent $100.0" in text for _, text in bot.alert_delivery.sent[5:])